@@ -0,0 +1,42 @@
+"""توحيد النص العربي للبحث
+
+يُستخدم نفس جدول الاستبدال في بايثون (لنص البحث) وفي SQL (داخل مشغلات
+فهرس البحث) حتى تتطابق الكلمات مهما اختلفت طريقة كتابتها.
+"""
+
+import re
+
+# الاستبدالات: أشكال الألف، التاء المربوطة، الألف المقصورة، التطويل والتشكيل
+ARABIC_NORMALIZATION = [
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ة', 'ه'),
+    ('ى', 'ي'),
+    ('ـ', ''),  # التطويل
+    # علامات التشكيل
+    ('ً', ''), ('ٌ', ''), ('ٍ', ''), ('َ', ''),
+    ('ُ', ''), ('ِ', ''), ('ّ', ''), ('ْ', ''),
+    ('ٰ', ''),
+]
+
+_TRANSLATION = str.maketrans({source: target for source, target in ARABIC_NORMALIZATION})
+_WORD_PATTERN = re.compile(r'\w+')
+
+def normalize_arabic(text):
+    """توحيد النص العربي وتحويل الحروف اللاتينية إلى صغيرة"""
+    if not text:
+        return ""
+    return text.translate(_TRANSLATION).lower()
+
+def normalize_sql(expression):
+    """بناء تعبير SQL يطبق نفس التوحيد باستخدام replace فقط
+
+    لا يعتمد على دوال مسجلة في بايثون، لذلك تعمل المشغلات من أي اتصال.
+    """
+    sql = f"COALESCE({expression}, '')"
+    for source, target in ARABIC_NORMALIZATION:
+        sql = f"replace({sql}, '{source}', '{target}')"
+    return f"lower({sql})"
+
+def tokenize(text):
+    """تقسيم النص الموحد إلى كلمات"""
+    return _WORD_PATTERN.findall(normalize_arabic(text))
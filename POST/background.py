@@ -0,0 +1,264 @@
+"""تنفيذ استدعاءات قاعدة البيانات في الخلفية لنوافذ Tkinter
+
+النوافذ ترسل الاستدعاءات البطيئة (التقارير، البحث، الحفظ) إلى خيوط عاملة
+مشتركة، وتعود النتائج إلى خيط الواجهة عبر root.after فقط، لأن Tkinter لا
+يسمح بتعديل عناصر الواجهة من خيط آخر. كل خيط عامل يحصل على اتصاله الخاص
+بقاعدة البيانات من مدير الاتصالات.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from tkinter import messagebox
+from models import data_version
+
+class Task:
+    """طلب في الخلفية يمكن إلغاؤه"""
+
+    def __init__(self, owner, key, on_success, on_error, busy, on_progress=None):
+        self.owner = owner
+        self.key = key
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.busy = busy
+        self.future = None
+        self.cancelled = False
+
+    def cancel(self):
+        """إلغاء الطلب: لا يبدأ إن لم يكن قد بدأ، ولا تُعرض نتيجته إن كان يعمل"""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+class BackgroundWorker:
+    """خيوط عاملة مشتركة مع إعادة النتائج إلى خيط الواجهة
+
+    الطلبات التي تحمل نفس المفتاح لنفس النافذة تلغي الطلب السابق (مثل بحث
+    جديد قبل انتهاء البحث السابق)، ويظهر مؤشر الانشغال على النافذة طوال
+    وجود طلبات لها قيد التنفيذ.
+    """
+
+    # الفاصل بين فحص النتائج الجاهزة (بالمللي ثانية)
+    POLL_INTERVAL = 30
+    # أقصى انتظار للطلبات الجارية عند الخروج (بالثواني)
+    SHUTDOWN_TIMEOUT = 10
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = None
+        self._results = queue.Queue()
+        self._pending = {}
+        self._busy_counts = {}
+        # الطلبات المرسلة التي لم تُسلم نتيجتها بعد
+        self._active = set()
+        self._lock = threading.Lock()
+        self._root = None
+        self._polling = False
+
+    def submit(self, owner, func, *args, on_success=None, on_error=None, key=None,
+               busy=True, on_progress=None, **kwargs):
+        """تشغيل func(*args, **kwargs) في الخلفية
+
+        owner: عنصر الواجهة صاحب الطلب (لا تُعرض النتيجة إن أُغلقت نافذته).
+        on_success(result) و on_error(exception) تُستدعى في خيط الواجهة.
+        on_progress: إن وُجدت تُمرر إلى func دالة progress(*values) تستدعيها من
+        الخيط العامل، فتصل القيم إلى on_progress(*values) في خيط الواجهة.
+        """
+        if key is not None:
+            previous = self._pending.get((str(owner), key))
+            if previous is not None:
+                previous.cancel()
+                self._finish(previous)
+
+        task = Task(owner, key, on_success, on_error, busy, on_progress)
+        if on_progress is not None:
+            kwargs['progress'] = lambda *values: self._results.put((task, 'progress', values))
+        if key is not None:
+            self._pending[(str(owner), key)] = task
+        if busy:
+            self._set_busy(owner, 1)
+
+        task.future = self._get_executor().submit(self._run, task, func, args, kwargs)
+        self._active.add(task)
+        self._start_polling(owner)
+        return task
+
+    def _get_executor(self):
+        """إنشاء الخيوط العاملة عند أول طلب"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="db-worker")
+            return self._executor
+
+    def _run(self, task, func, args, kwargs):
+        """التنفيذ داخل الخيط العامل"""
+        if task.cancelled:
+            return
+        try:
+            result = func(*args, **kwargs)
+            self._results.put((task, 'success', result))
+        except Exception as e:
+            self._results.put((task, 'error', e))
+
+    def _start_polling(self, owner):
+        """بدء فحص النتائج على الجذر (يتوقف تلقائياً عند عدم وجود طلبات)"""
+        if self._polling:
+            return
+        self._root = owner.nametowidget('.')
+        self._polling = True
+        self._root.after(self.POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        """تسليم النتائج الجاهزة في خيط الواجهة"""
+        while True:
+            try:
+                task, kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                if not task.cancelled and self._exists(task.owner):
+                    task.on_progress(*value)
+                continue
+            self._active.discard(task)
+            self._deliver(task, kind, value)
+
+        # الطلبات الملغاة قبل بدئها لا ترجع نتيجة
+        self._active = {task for task in self._active if not task.future.done()}
+        if self._active or not self._results.empty():
+            self._root.after(self.POLL_INTERVAL, self._poll)
+        else:
+            self._polling = False
+
+    def _deliver(self, task, kind, value):
+        """استدعاء دالة النتيجة إن كان الطلب ما زال مطلوباً"""
+        if task.cancelled:
+            return
+        self._finish(task)
+        if not self._exists(task.owner):
+            return
+        if kind == 'success':
+            if task.on_success:
+                task.on_success(value)
+        elif task.on_error:
+            task.on_error(value)
+        else:
+            messagebox.showerror("خطأ", f"حدث خطأ: {str(value)}")
+
+    def _finish(self, task):
+        """إزالة الطلب من قائمة الطلبات الجارية وإنهاء مؤشر الانشغال"""
+        if task.key is not None and self._pending.get((str(task.owner), task.key)) is task:
+            del self._pending[(str(task.owner), task.key)]
+        if task.busy:
+            task.busy = False
+            self._set_busy(task.owner, -1)
+
+    def _set_busy(self, owner, delta):
+        """إظهار مؤشر الانشغال على نافذة صاحب الطلب"""
+        if not self._exists(owner):
+            self._busy_counts.pop(str(owner), None)
+            return
+        window = owner.winfo_toplevel()
+        name = str(window)
+        count = self._busy_counts.get(name, 0) + delta
+        if count > 0:
+            self._busy_counts[name] = count
+            window.config(cursor="watch")
+        else:
+            self._busy_counts.pop(name, None)
+            window.config(cursor="")
+
+    @staticmethod
+    def _exists(widget):
+        """هل ما زال عنصر الواجهة موجوداً؟"""
+        try:
+            return bool(widget.winfo_exists())
+        except Exception:
+            return False
+
+    def cancel_all(self, owner):
+        """إلغاء جميع طلبات نافذة (عند إغلاقها)"""
+        for (name, key), task in list(self._pending.items()):
+            if name == str(owner):
+                task.cancel()
+                self._finish(task)
+
+    def shutdown(self, timeout=None):
+        """إيقاف الخيوط العاملة عند الخروج من البرنامج
+
+        الطلبات التي لم تبدأ تُلغى، والجارية يُنتظر انتهاؤها حتى timeout ثانية
+        (SHUTDOWN_TIMEOUT افتراضياً) حتى لا تُغلق اتصالاتها أثناء استخدامها.
+        ترجع False إن بقيت طلبات تعمل بعد المهلة.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        running = [task.future for task in self._active if not task.future.done()]
+        _, not_done = wait(running, self.SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        return not not_done
+
+# الخيوط العاملة المشتركة بين جميع النوافذ
+worker = BackgroundWorker()
+
+class ChangeBus:
+    """إشعار النوافذ المفتوحة بتغير البيانات في نافذة أخرى
+
+    النماذج تنشر كل كتابة برفع إصدار نطاقها في data_version (من أي خيط)،
+    والناقل يفحص الإصدار دورياً في خيط الواجهة ويستدعي دوال النوافذ
+    المشتركة في النطاقات المتغيرة فقط. الفحص مقارنة رقم واحد عند عدم وجود
+    تغييرات، ويتوقف عند إغلاق جميع النوافذ المشتركة.
+    """
+
+    # الفاصل بين فحص الإصدارات (بالمللي ثانية)
+    POLL_INTERVAL = 250
+
+    def __init__(self, versions=data_version):
+        self.versions = versions
+        self._subscriptions = []
+        self._root = None
+        self._polling = False
+
+    def subscribe(self, owner, scopes, callback):
+        """استدعاء callback() في خيط الواجهة عند تغير أحد النطاقات بعد الآن"""
+        self._subscriptions.append([owner, tuple(scopes), callback, self.versions.version])
+        if not self._polling:
+            self._root = owner.nametowidget('.')
+            self._polling = True
+            self._root.after(self.POLL_INTERVAL, self._poll)
+
+    def unsubscribe(self, owner):
+        """إلغاء اشتراكات نافذة"""
+        self._subscriptions = [sub for sub in self._subscriptions if sub[0] is not owner]
+
+    def _poll(self):
+        """الفحص الدوري في خيط الواجهة"""
+        self.dispatch()
+        if self._subscriptions:
+            self._root.after(self.POLL_INTERVAL, self._poll)
+        else:
+            self._polling = False
+
+    def dispatch(self):
+        """استدعاء المشتركين في النطاقات التي تغيرت، ويرجع عدد الاستدعاءات"""
+        # كتابات العمليات الأخرى على نفس الملف
+        self.versions.sync()
+        version = self.versions.version
+        # حذف اشتراكات النوافذ المغلقة
+        self._subscriptions = [sub for sub in self._subscriptions
+                               if BackgroundWorker._exists(sub[0])]
+        called = 0
+        for subscription in list(self._subscriptions):
+            owner, scopes, callback, seen = subscription
+            if seen == version:
+                continue
+            # الإصدار يُحدث قبل الاستدعاء حتى لا يتكرر الإشعار عند حدوث خطأ
+            subscription[3] = version
+            if self.versions.changed_since(seen, scopes):
+                callback()
+                called += 1
+        return called
+
+# ناقل إشعارات التغيير المشترك بين جميع النوافذ
+change_bus = ChangeBus()
@@ -0,0 +1,130 @@
+"""فهرس النسخ الاحتياطية وسياسة الاحتفاظ بها
+
+الفهرس ملف JSON واحد في مجلد النسخ يحفظ لكل نسخة حجمها على القرص وحجمها
+الأصلي وبصمتها (SHA-256) وعدد صفحات قاعدة البيانات ووقت إنشائها، مرتبة من
+الأحدث للأقدم. عرض القائمة يقرأ هذا الملف فقط بدل فحص كل ملفات المجلد.
+
+سياسة الاحتفاظ (الجد-الأب-الابن): لكل مستوى (ساعة، يوم، أسبوع، شهر) تُحفظ
+أحدث نسخة في كل فترة من أحدث N فترات، وما لا يحفظه أي مستوى يُحذف.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+# قفل مشترك لكتابة الفهرس (النسخ اليدوي والتلقائي قد يعملان معاً)،
+# ويُعاد دخوله حتى تستدعي إعادة الفهرسة replace_all وهي ممسكة به
+_catalog_lock = threading.RLock()
+
+# صيغة وقت الإنشاء في الفهرس (قابلة للترتيب كنص)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# عدد الفترات الأحدث التي تُحفظ منها نسخة لكل مستوى
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4, 'monthly': 12}
+
+# مفتاح الفترة التي تقع فيها النسخة لكل مستوى
+PERIODS = {
+    'hourly': lambda created: created.strftime('%Y-%m-%d %H'),
+    'daily': lambda created: created.strftime('%Y-%m-%d'),
+    'weekly': lambda created: '%d-W%02d' % created.isocalendar()[:2],
+    'monthly': lambda created: created.strftime('%Y-%m'),
+}
+
+def file_checksum(path, block_size=1024 * 1024):
+    """بصمة SHA-256 لملف (قراءة بالتدفق)"""
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def select_expired(entries, policy=DEFAULT_RETENTION):
+    """أسماء النسخ التي لا تحفظها سياسة الاحتفاظ (أحدث نسخة تُحفظ دائماً)"""
+    ordered = sorted(entries, key=lambda entry: entry['created'], reverse=True)
+    keep = {ordered[0]['name']} if ordered else set()
+
+    for level, count in policy.items():
+        periods = set()
+        for entry in ordered:
+            period = PERIODS[level](datetime.strptime(entry['created'], DATE_FORMAT))
+            # الترتيب من الأحدث: أول نسخة في الفترة هي أحدثها
+            if period in periods:
+                continue
+            if len(periods) >= count:
+                break
+            periods.add(period)
+            keep.add(entry['name'])
+
+    return [entry['name'] for entry in ordered if entry['name'] not in keep]
+
+class BackupCatalog:
+    """فهرس النسخ الاحتياطية في ملف JSON"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        """هل أُنشئ الفهرس؟ (المجلدات القديمة تحتاج إعادة فهرسة)"""
+        return os.path.exists(self.path)
+
+    def entries(self):
+        """جميع النسخ من الأحدث للأقدم"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as catalog_file:
+                return json.load(catalog_file)
+        except FileNotFoundError:
+            return []
+
+    def get(self, name):
+        """بيانات نسخة بالاسم (None إن لم توجد)"""
+        for entry in self.entries():
+            if entry['name'] == name:
+                return entry
+        return None
+
+    def add(self, entry):
+        """إضافة نسخة (أو استبدال بياناتها إن كانت موجودة)"""
+        with _catalog_lock:
+            entries = [existing for existing in self.entries() if existing['name'] != entry['name']]
+            entries.append(entry)
+            self._save(entries)
+
+    def remove(self, name):
+        """حذف نسخة من الفهرس"""
+        with _catalog_lock:
+            self._save([entry for entry in self.entries() if entry['name'] != name])
+
+    def abandon_after(self, change_id, restored_at):
+        """تعليم النسخ التالية لموضع نسخة مستعادة بأنها من خط زمني لم يعد قائماً
+
+        تبقى في القائمة وتُستعاد بالاسم، لكن تغييرات الأرشيف بعد الاستعادة لا
+        تتبعها فلا تصلح أساساً للاستعادة لوقت.
+        """
+        with _catalog_lock:
+            entries = self.entries()
+            for entry in entries:
+                if (entry.get('change_id') is not None and entry['change_id'] > change_id
+                        and not entry.get('abandoned')):
+                    entry['abandoned'] = restored_at
+            self._save(entries)
+
+    def locked(self):
+        """قفل الفهرس لقراءة ثم كتابة لا تتداخل معها إضافة أو حذف"""
+        return _catalog_lock
+
+    def replace_all(self, entries):
+        """كتابة الفهرس كاملاً (عند إعادة الفهرسة)"""
+        with _catalog_lock:
+            self._save(entries)
+
+    def _save(self, entries):
+        """حفظ الفهرس مرتباً بملف مؤقت ثم استبداله"""
+        entries = sorted(entries, key=lambda entry: entry['created'], reverse=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as catalog_file:
+            json.dump(entries, catalog_file, ensure_ascii=False, indent=1)
+            catalog_file.flush()
+            os.fsync(catalog_file.fileno())
+        os.replace(temp_path, self.path)
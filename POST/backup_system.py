@@ -1,11 +1,17 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 from utils import BackupManager
+from treeview_helpers import KeyedTreeview
+from background import worker
 from datetime import datetime
 import threading
 import time
 import os
 
+# أنواع ملفات النسخ في نوافذ الفتح والحفظ (الضغط يُحدد من الامتداد)
+BACKUP_FILE_TYPES = [("Gzip backup", "*.gz"), ("XZ backup", "*.xz"), ("Bzip2 backup", "*.bz2"),
+                     ("Database files", "*.db"), ("All files", "*.*")]
+
 class BackupSystemWindow:
     def __init__(self, parent=None):
         self.parent = parent
@@ -52,10 +58,14 @@ class BackupSystemWindow:
         
         ttk.Button(manual_buttons, text="إنشاء نسخة احتياطية", 
                   command=self.create_manual_backup, style='Accent.TButton').pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(manual_buttons, text="نسخة تزايدية", 
+                  command=lambda: self.create_manual_backup(incremental=True)).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(manual_buttons, text="استعادة نسخة احتياطية", 
                   command=self.restore_backup).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(manual_buttons, text="تصدير نسخة احتياطية", 
-                  command=self.export_backup).pack(side=tk.LEFT)
+                  command=self.export_backup).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(manual_buttons, text="استعادة لوقت محدد", 
+                  command=self.recover_to_time).pack(side=tk.LEFT)
         
         # إطار النسخ التلقائي
         auto_frame = ttk.LabelFrame(main_frame, text="النسخ الاحتياطي التلقائي", padding=15)
@@ -87,17 +97,20 @@ class BackupSystemWindow:
         list_frame.pack(fill=tk.BOTH, expand=True)
         
         # إنشاء Treeview
-        columns = ('الاسم', 'التاريخ', 'الحجم')
+        columns = ('الاسم', 'التاريخ', 'الحجم', 'الحجم الأصلي')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=12)
+        self.tree_rows = KeyedTreeview(self.tree)
         
         # تعريف العناوين
         self.tree.heading('الاسم', text='اسم الملف')
         self.tree.heading('التاريخ', text='تاريخ الإنشاء')
         self.tree.heading('الحجم', text='الحجم (KB)')
+        self.tree.heading('الحجم الأصلي', text='الحجم الأصلي (KB)')
         
         self.tree.column('الاسم', width=250, anchor=tk.CENTER)
         self.tree.column('التاريخ', width=150, anchor=tk.CENTER)
         self.tree.column('الحجم', width=100, anchor=tk.CENTER)
+        self.tree.column('الحجم الأصلي', width=110, anchor=tk.CENTER)
         
         # شريط التمرير
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
@@ -116,20 +129,25 @@ class BackupSystemWindow:
         ttk.Button(list_buttons, text="حذف نسخة احتياطية", 
                   command=self.delete_backup).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(list_buttons, text="استعادة محددة", 
-                  command=self.restore_selected_backup).pack(side=tk.LEFT)
+                  command=self.restore_selected_backup).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(list_buttons, text="إعادة الفهرسة", 
+                  command=self.rebuild_catalog).pack(side=tk.LEFT)
         
         # شريط الحالة
         self.status_bar = ttk.Label(self.window, text="جاهز", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
     
-    def create_manual_backup(self):
-        """إنشاء نسخة احتياطية يدوية"""
-        try:
-            self.status_bar.config(text="جاري إنشاء النسخة الاحتياطية...")
-            self.window.update()
-            
-            backup_path = self.backup_manager.create_backup()
-            
+    def create_manual_backup(self, incremental=False):
+        """إنشاء نسخة احتياطية يدوية (في الخلفية مع عرض نسبة التقدم)
+
+        النسخة التزايدية لا تكتب إلا الأجزاء التي تغيرت منذ آخر نسخة.
+        """
+        self.status_bar.config(text="جاري إنشاء النسخة الاحتياطية...")
+        
+        def on_progress(copied, total):
+            self.status_bar.config(text=f"جاري إنشاء النسخة الاحتياطية... {copied * 100 // max(total, 1)}%")
+        
+        def on_success(backup_path):
             if backup_path:
                 messagebox.showinfo("نجح", f"تم إنشاء النسخة الاحتياطية بنجاح:\n{os.path.basename(backup_path)}")
                 self.refresh_backup_list()
@@ -138,15 +156,20 @@ class BackupSystemWindow:
                 messagebox.showerror("خطأ", "فشل في إنشاء النسخة الاحتياطية")
                 self.status_bar.config(text="فشل في إنشاء النسخة الاحتياطية")
         
-        except Exception as e:
+        def on_error(e):
             messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
             self.status_bar.config(text="حدث خطأ أثناء إنشاء النسخة الاحتياطية")
+        
+        create = (self.backup_manager.create_incremental_backup if incremental
+                  else self.backup_manager.create_backup)
+        worker.submit(self.window, create, on_success=on_success, on_error=on_error,
+                      on_progress=on_progress)
     
     def restore_backup(self):
         """استعادة نسخة احتياطية من ملف خارجي"""
         file_path = filedialog.askopenfilename(
             title="اختر ملف النسخة الاحتياطية",
-            filetypes=[("Database files", "*.db"), ("All files", "*.*")]
+            filetypes=BACKUP_FILE_TYPES
         )
         
         if file_path:
@@ -154,18 +177,63 @@ class BackupSystemWindow:
                                        "هل أنت متأكد من استعادة هذه النسخة الاحتياطية؟\n"
                                        "سيتم استبدال البيانات الحالية!")
             if result:
-                try:
-                    success = self.backup_manager.restore_backup(file_path)
-                    
-                    if success:
-                        messagebox.showinfo("نجح", "تم استعادة النسخة الاحتياطية بنجاح")
-                        self.status_bar.config(text="تم استعادة النسخة الاحتياطية بنجاح")
-                    else:
-                        messagebox.showerror("خطأ", "فشل في استعادة النسخة الاحتياطية")
-                        self.status_bar.config(text="فشل في استعادة النسخة الاحتياطية")
-                
-                except Exception as e:
-                    messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+                self.start_restore(self.backup_manager.restore_backup, file_path)
+    
+    def start_restore(self, restore, *args, success_text="تم استعادة النسخة الاحتياطية بنجاح"):
+        """تشغيل الاستعادة في الخلفية مع عرض نسبة التقدم
+        
+        restore(*args, progress=...) هي restore_backup أو restore_by_name.
+        """
+        self.status_bar.config(text="جاري استعادة النسخة الاحتياطية...")
+        
+        def on_progress(done, total):
+            self.status_bar.config(text=f"جاري استعادة النسخة الاحتياطية... {done * 100 // max(total, 1)}%")
+        
+        def on_success(success):
+            if success:
+                messagebox.showinfo("نجح", success_text)
+                self.status_bar.config(text=success_text)
+            else:
+                messagebox.showerror("خطأ", "فشل في استعادة النسخة الاحتياطية")
+                self.status_bar.config(text="فشل في استعادة النسخة الاحتياطية")
+        
+        def on_error(e):
+            messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            self.status_bar.config(text="فشل في استعادة النسخة الاحتياطية")
+        
+        worker.submit(self.window, restore, *args, on_success=on_success, on_error=on_error,
+                      on_progress=on_progress, key='restore')
+    
+    def recover_to_time(self):
+        """استعادة البيانات كما كانت في وقت محدد (نسخة أساسية + سجل التغييرات)"""
+        target_time = simpledialog.askstring(
+            "استعادة لوقت محدد", "الوقت المطلوب (YYYY-MM-DD HH:MM:SS):",
+            initialvalue=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), parent=self.window)
+        if not target_time:
+            return
+        
+        self.status_bar.config(text="جاري بناء قاعدة البيانات للوقت المحدد...")
+        
+        def on_progress(done, total):
+            self.status_bar.config(text=f"جاري بناء قاعدة البيانات للوقت المحدد... {done * 100 // max(total, 1)}%")
+        
+        def on_success(result):
+            if result is None:
+                messagebox.showerror("خطأ", "تعذرت الاستعادة لهذا الوقت")
+                self.status_bar.config(text="فشل في الاستعادة لوقت محدد")
+                return
+            self.status_bar.config(text=f"تم تطبيق {result['changes']} تغيير في {result['seconds']:.1f} ثانية")
+            if messagebox.askyesno("تأكيد الاستعادة",
+                                   f"تم بناء البيانات كما كانت في {target_time}\n"
+                                   f"(النسخة الأساسية: {result['base']}، التغييرات: {result['changes']})\n"
+                                   "هل تريد استبدال البيانات الحالية بها؟"):
+                self.start_restore(self.backup_manager.restore_backup, result['path'],
+                                   success_text="تم استعادة البيانات للوقت المحدد")
+            else:
+                messagebox.showinfo("معلومة", f"تم حفظ البيانات المستعادة في:\n{result['path']}")
+        
+        worker.submit(self.window, self.backup_manager.recover_to_time, target_time,
+                      on_success=on_success, on_progress=on_progress, key='recover')
     
     def export_backup(self):
         """تصدير نسخة احتياطية"""
@@ -175,45 +243,69 @@ class BackupSystemWindow:
             return
         
         item = self.tree.item(selection[0])
-        backup_name = item['values'][0]
-        backup_path = os.path.join(self.backup_manager.backup_dir, backup_name)
+        backup_name = str(item['values'][0])
         
         export_path = filedialog.asksaveasfilename(
             title="حفظ النسخة الاحتياطية",
-            defaultextension=".db",
-            filetypes=[("Database files", "*.db"), ("All files", "*.*")]
+            defaultextension=".gz",
+            filetypes=BACKUP_FILE_TYPES
         )
         
         if export_path:
-            try:
-                import shutil
-                shutil.copy2(backup_path, export_path)
-                messagebox.showinfo("نجح", f"تم تصدير النسخة الاحتياطية إلى:\n{export_path}")
+            self.status_bar.config(text="جاري تصدير النسخة الاحتياطية...")
+            
+            def on_progress(done, total):
+                self.status_bar.config(text=f"جاري تصدير النسخة الاحتياطية... {done * 100 // max(total, 1)}%")
+            
+            def on_success(path):
+                messagebox.showinfo("نجح", f"تم تصدير النسخة الاحتياطية إلى:\n{path}")
                 self.status_bar.config(text="تم تصدير النسخة الاحتياطية بنجاح")
             
-            except Exception as e:
+            def on_error(e):
                 messagebox.showerror("خطأ", f"حدث خطأ في التصدير: {str(e)}")
+                self.status_bar.config(text="فشل تصدير النسخة الاحتياطية")
+            
+            # الضغط حسب امتداد الملف، والنسخ التزايدية يُعاد تجميعها أولاً
+            worker.submit(self.window, self.backup_manager.export_backup, backup_name, export_path,
+                          on_success=on_success, on_error=on_error, on_progress=on_progress,
+                          key='export')
     
     def refresh_backup_list(self):
         """تحديث قائمة النسخ الاحتياطية"""
-        # مسح القائمة الحالية
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        # المجلدات الأقدم من الفهرس تُفهرس أولاً في الخلفية (تفك النسخ المضغوطة)
+        if not self.backup_manager.catalog.exists():
+            self.rebuild_catalog()
+            return
         
         # جلب النسخ الاحتياطية
         backups = self.backup_manager.list_backups()
         
-        for backup in backups:
-            size_kb = backup['size'] / 1024
-            values = (
+        # تحديث الصفوف المتغيرة فقط (اسم الملف هو المفتاح)
+        self.tree_rows.sync(
+            (backup['name'], (
                 backup['name'],
                 backup['created'],
-                f"{size_kb:.1f}"
-            )
-            self.tree.insert('', tk.END, values=values)
+                f"{backup['size'] / 1024:.1f}",
+                f"{backup['logical_size'] / 1024:.1f}" if backup['logical_size'] is not None else "-"
+            ))
+            for backup in backups
+        )
         
         self.status_bar.config(text=f"تم تحميل {len(backups)} نسخة احتياطية")
     
+    def rebuild_catalog(self):
+        """إعادة بناء فهرس النسخ من ملفات المجلد (للنسخ المنسوخة إليه يدوياً)"""
+        self.status_bar.config(text="جاري إعادة فهرسة النسخ الاحتياطية...")
+        
+        def on_progress(done, total):
+            self.status_bar.config(text=f"جاري إعادة فهرسة النسخ الاحتياطية... {done}/{total}")
+        
+        def on_success(count):
+            self.refresh_backup_list()
+        
+        worker.submit(self.window, self.backup_manager.rebuild_catalog, on_success=on_success,
+                      on_progress=on_progress, key='catalog')
+    
     def delete_backup(self):
         """حذف نسخة احتياطية"""
         selection = self.tree.selection()
@@ -222,13 +314,12 @@ class BackupSystemWindow:
             return
         
         item = self.tree.item(selection[0])
-        backup_name = item['values'][0]
+        backup_name = str(item['values'][0])
         
         result = messagebox.askyesno("تأكيد الحذف", f"هل أنت متأكد من حذف النسخة الاحتياطية:\n{backup_name}؟")
         if result:
             try:
-                backup_path = os.path.join(self.backup_manager.backup_dir, backup_name)
-                os.remove(backup_path)
+                self.backup_manager.delete_backup(backup_name)
                 messagebox.showinfo("نجح", "تم حذف النسخة الاحتياطية بنجاح")
                 self.refresh_backup_list()
                 self.status_bar.config(text="تم حذف النسخة الاحتياطية بنجاح")
@@ -244,24 +335,13 @@ class BackupSystemWindow:
             return
         
         item = self.tree.item(selection[0])
-        backup_name = item['values'][0]
-        backup_path = os.path.join(self.backup_manager.backup_dir, backup_name)
+        backup_name = str(item['values'][0])
         
         result = messagebox.askyesno("تأكيد الاستعادة", 
                                    f"هل أنت متأكد من استعادة النسخة الاحتياطية:\n{backup_name}؟\n"
                                    "سيتم استبدال البيانات الحالية!")
         if result:
-            try:
-                success = self.backup_manager.restore_backup(backup_path)
-                
-                if success:
-                    messagebox.showinfo("نجح", "تم استعادة النسخة الاحتياطية بنجاح")
-                    self.status_bar.config(text="تم استعادة النسخة الاحتياطية بنجاح")
-                else:
-                    messagebox.showerror("خطأ", "فشل في استعادة النسخة الاحتياطية")
-            
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            self.start_restore(self.backup_manager.restore_by_name, backup_name)
     
     def toggle_auto_backup(self):
         """تفعيل/إلغاء النسخ الاحتياطي التلقائي"""
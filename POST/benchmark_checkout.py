@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياس سرعة عمليات البيع
+
+يقارن عدد عمليات البيع في الثانية بإعدادات SQLite الافتراضية
+(rollback journal + synchronous=FULL) وبملف إعدادات PRAGMA المحسن (WAL)،
+ويقيس الزمن الإضافي لكل مسح بسبب سجل السلة (CartJournal).
+
+الاستخدام:
+    python benchmark_checkout.py [عدد عمليات البيع]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# إضافة المسار الحالي لاستيراد الوحدات
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database, PRAGMA_PROFILE, connection_manager
+from models import Product, Sale
+from cart import CartEngine, CartJournal
+
+def run_checkouts(db_name, pragmas, count):
+    """تنفيذ عدد من عمليات البيع وإرجاع الزمن المستغرق بالثواني"""
+    connection_manager.configure(pragmas)
+    Database(db_name)
+
+    product = Product(db_name)
+    sale = Sale(db_name)
+    product_id = product.add_product("منتج القياس", "", 10.0, 6.0, count * 3)
+
+    items = [{
+        'product_id': product_id,
+        'quantity': 1,
+        'selling_price': 10.0,
+        'purchasing_price': 6.0,
+        'discount_applied': 0,
+        'manual_discount': 0,
+        'final_price': 10.0
+    }] * 3
+
+    start = time.perf_counter()
+    for _ in range(count):
+        sale.add_sale(None, 30.0, 12.0, 30.0, items)
+    elapsed = time.perf_counter() - start
+
+    connection_manager.reset(db_name)
+    return elapsed
+
+def measure_scan_latency(db_name, journal, count):
+    """متوسط زمن المسح الواحد بالمللي ثانية"""
+    cart = CartEngine(db_name, journal=journal)
+    cart.barcode_cache.warm()
+    start = time.perf_counter()
+    for index in range(count):
+        cart.scan(f"BENCH{index % 200}")
+    elapsed = time.perf_counter() - start
+    cart.clear()
+    return elapsed / count * 1000
+
+def run_scan_benchmark(temp_dir, count):
+    """مقارنة زمن المسح بدون سجل ومع السجل (مع fsync وبدونه)"""
+    db_name = os.path.join(temp_dir, "bench_scan.db")
+    Database(db_name)
+    product = Product(db_name)
+    for index in range(200):
+        product.add_product(f"منتج {index}", "", 10.0, 6.0, 1000, barcode=f"BENCH{index}")
+
+    journal_path = CartJournal.path_for(db_name)
+    baseline = measure_scan_latency(db_name, None, count)
+    print(f"المسح بدون سجل: {baseline:.3f} مللي ثانية")
+    for label, fsync in (("السجل مع fsync", True), ("السجل بدون fsync", False)):
+        latency = measure_scan_latency(db_name, CartJournal(journal_path, fsync), count)
+        print(f"{label}: {latency:.3f} مللي ثانية (زيادة {latency - baseline:.3f})")
+    connection_manager.reset(db_name)
+
+def main():
+    """تشغيل القياس وطباعة النتائج"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    profiles = [
+        ("الإعدادات الافتراضية", {}),
+        ("ملف PRAGMA المحسن", PRAGMA_PROFILE),
+    ]
+
+    print(f"قياس {count} عملية بيع (3 بنود لكل عملية)")
+    print("=" * 50)
+
+    original = dict(connection_manager.pragmas)
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index, (label, pragmas) in enumerate(profiles):
+            db_name = os.path.join(temp_dir, f"bench_{index}.db")
+            elapsed = run_checkouts(db_name, pragmas, count)
+            results[label] = count / elapsed
+            print(f"{label}: {elapsed:.2f} ثانية - {count / elapsed:.0f} عملية/ثانية")
+        connection_manager.configure(original)
+
+        baseline, tuned = results.values()
+        print("=" * 50)
+        print(f"نسبة التحسن: {tuned / baseline:.1f}x")
+
+        print("=" * 50)
+        print(f"زمن المسح ({count} مسح لسلة من 200 منتج)")
+        run_scan_benchmark(temp_dir, count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياس زمن تشغيل البرنامج الرئيسي
+
+يعرض أبطأ الوحدات عند استيراد main_application (باستخدام python -X importtime)
+ثم يشغل البرنامج في وضع القياس (--startup-timing) ويقيس زمن أول رسم للنافذة
+الرئيسية، ويقارن زمن التشغيل الكلي بالهدف المطلوب لأجهزة نقاط البيع.
+
+الاستخدام:
+    python benchmark_startup.py [الهدف بالمللي ثانية] [عدد مرات التشغيل]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+# مجلد البرنامج (تُشغل منه العمليات الفرعية)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# الهدف الافتراضي لزمن التشغيل الكلي (بالمللي ثانية)
+DEFAULT_TARGET_MS = 1500
+
+def parse_import_times(output, depth=1):
+    """استخراج الزمن التراكمي لكل وحدة من مخرجات -X importtime
+
+    depth: أقصى مستوى تداخل يُعرض (1 = الوحدات التي يستوردها البرنامج مباشرة).
+    ترجع قائمة (اسم الوحدة، الزمن بالمللي ثانية) مرتبة من الأبطأ.
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        level = (len(name) - len(name.lstrip())) // 2
+        if level <= depth:
+            name = name.strip()
+            times[name] = max(times.get(name, 0), int(parts[1]) / 1000)
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)
+
+def measure_imports(module="main_application"):
+    """زمن استيراد الوحدة مع تفصيل أبطأ الوحدات"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    return parse_import_times(result.stderr)
+
+def measure_first_paint(timeout=60):
+    """تشغيل البرنامج في وضع القياس وإرجاع التوقيتات (None إن تعذر فتح نافذة)"""
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, "main_application.py", "--startup-timing"],
+                                cwd=BASE_DIR, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    total_ms = (time.perf_counter() - start) * 1000
+
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            timings = {key: float(value) for key, value in
+                       (field.split("=") for field in line.split()[1:])}
+            # الزمن الكلي يشمل تشغيل مفسر Python نفسه
+            timings['process_ms'] = total_ms
+            return timings
+    return None
+
+def main():
+    """تشغيل القياس وطباعة النتائج"""
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TARGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print("أبطأ الوحدات عند الاستيراد:")
+    import_times = measure_imports()
+    for name, elapsed in import_times[:15]:
+        print(f"  {name:<40} {elapsed:8.1f} ms")
+
+    results = [timings for timings in (measure_first_paint() for _ in range(runs)) if timings]
+    if not results:
+        print("تعذر قياس أول رسم (لا توجد شاشة متاحة؟)")
+        return 0
+
+    # أفضل تشغيل يمثل التشغيل الدافئ، وأول تشغيل يقترب من التشغيل البارد
+    best = min(results, key=lambda timings: timings['process_ms'])
+    print(f"\nالاستيراد: {best['imports_ms']:.1f} ms")
+    print(f"إنشاء النافذة الرئيسية: {best['init_ms']:.1f} ms")
+    print(f"أول رسم (من بداية main_application): {best['first_paint_ms']:.1f} ms")
+    print(f"زمن التشغيل الكلي: أول مرة {results[0]['process_ms']:.1f} ms، "
+          f"أفضل مرة {best['process_ms']:.1f} ms (الهدف {target_ms:.0f} ms)")
+
+    if results[0]['process_ms'] > target_ms:
+        print("⚠️ زمن التشغيل أكبر من الهدف")
+        return 1
+    print("✅ زمن التشغيل ضمن الهدف")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
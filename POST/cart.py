@@ -0,0 +1,297 @@
+"""محرك سلة البيع في الذاكرة
+
+يحتفظ بأسعار وخصومات المنتجات بعد أول مسح، ويحدث الإجماليات تدريجياً
+مع كل تغيير في بند (بطرح مساهمة البند القديمة وإضافة الجديدة) بدلاً من
+إعادة حساب السلة كاملة. لا تُكتب السلة في قاعدة البيانات إلا مرة واحدة
+عند إتمام البيع.
+"""
+
+from collections import OrderedDict
+import json
+import os
+from models import Product, Sale, data_version
+from utils import BarcodeCache
+
+class CartJournal:
+    """سجل إلحاقي للسلة الحالية يحميها من انقطاع الكهرباء أو توقف البرنامج
+
+    كل تغيير في بند يُلحق كسطر JSON يحتوي الكمية الجديدة وأسعار البند وقت
+    المسح، فتُستعاد السلة كما كانت دون الرجوع لقاعدة البيانات. السجل يُفرغ
+    عند إتمام البيع أو تفريغ السلة. سطر غير مكتمل (انقطاع أثناء الكتابة)
+    يتم تجاهله عند الاستعادة.
+
+    قبل تثبيت البيع يُلحق سطر برقمه ووقته، فإن انقطع البرنامج بعد التثبيت
+    وقبل تفريغ السجل عرفت الاستعادة أن السلة بيعت ولا تعرضها مرة أخرى.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        # fsync يضمن بقاء السطر بعد انقطاع الكهرباء وليس فقط بعد توقف البرنامج
+        self.fsync = fsync
+        self._file = None
+
+    @staticmethod
+    def path_for(db_name):
+        """مسار السجل بجانب ملف قاعدة البيانات"""
+        return os.path.splitext(db_name)[0] + "_cart.journal"
+
+    def append(self, entry):
+        """إلحاق تغيير بالسجل"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def mark_sale(self, sale_id, date):
+        """تسجيل البيع قبل تثبيته في قاعدة البيانات"""
+        self.append({'sale_id': sale_id, 'date': date})
+
+    @staticmethod
+    def sale_marker(entries):
+        """سطر البيع إن كان آخر سطر (بنود بعده تعني أن البيع لم يكتمل)"""
+        return entries[-1] if entries and 'sale_id' in entries[-1] else None
+
+    def read(self):
+        """قراءة جميع التغييرات المسجلة"""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # سطر مقطوع بسبب انقطاع أثناء الكتابة
+                    break
+        return entries
+
+    def rewrite(self, entries):
+        """استبدال السجل بالتغييرات المعطاة (ملف مؤقت ثم استبدال ذري)"""
+        self.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as journal_file:
+            for entry in entries:
+                journal_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal_file.flush()
+            if self.fsync:
+                os.fsync(journal_file.fileno())
+        os.replace(temp_path, self.path)
+
+    def truncate(self):
+        """تفريغ السجل بعد حفظ البيع"""
+        self.close()
+        if os.path.exists(self.path):
+            with open(self.path, 'w', encoding='utf-8'):
+                pass
+
+    def close(self):
+        """إغلاق ملف السجل"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class CartEngine:
+    """سلة البيع مع إجماليات محدثة تدريجياً"""
+
+    def __init__(self, db_name="store_management.db", barcode_cache=None, journal=None):
+        self.db_name = db_name
+        # سجل السلة (None = بدون حماية من الانقطاع)
+        self.journal = journal
+        self.product_model = Product(db_name, read_only=True)
+        self.sale_model = Sale(db_name)
+        self.barcode_cache = barcode_cache or BarcodeCache(db_name)
+        # أسعار المنتجات المحسوبة مسبقاً (تُمسح عند تعديل المنتجات لا عند البيع)
+        self._pricing = {}
+        self._pricing_version = data_version.version
+        self.lines = OrderedDict()
+        self._reset_totals()
+
+    def _reset_totals(self):
+        """تصفير الإجماليات"""
+        self.total_amount = 0.0
+        self.final_amount = 0.0
+        self.profit = 0.0
+        self.item_count = 0
+
+    def pricing_for(self, product):
+        """أسعار المنتج بعد الخصم، محسوبة مرة واحدة لكل منتج"""
+        if data_version.changed_since(self._pricing_version, ('products',)):
+            self._pricing_version = data_version.version
+            self._pricing.clear()
+
+        pricing = self._pricing.get(product['product_id'])
+        if pricing is None:
+            selling_price = product['selling_price']
+            discount_percentage = product['discount_percentage'] or 0
+            manual_discount = product['manual_discount'] or 0
+            final_price = self.product_model.calculate_discounted_price(
+                selling_price, discount_percentage, manual_discount)
+            pricing = {
+                'name': product['name'],
+                'selling_price': selling_price,
+                'purchasing_price': product['purchasing_price'],
+                'discount_applied': selling_price * (discount_percentage / 100),
+                'manual_discount': manual_discount,
+                'final_price': final_price,
+            }
+            self._pricing[product['product_id']] = pricing
+        return pricing
+
+    def scan(self, barcode, quantity=1):
+        """إضافة منتج بالباركود (باركود العبوة يضيف عدد وحداتها)"""
+        product = self.barcode_cache.lookup(barcode)
+        if product is None:
+            return None
+        return self.add_scanned(product, quantity)
+
+    def add_scanned(self, product, quantity=1):
+        """إضافة منتج من ذاكرة الباركود (باركود العبوة يضيف عدد وحداتها)"""
+        return self.add_product(product, quantity * (product['pack_quantity'] or 1))
+
+    def add_product(self, product, quantity=1):
+        """إضافة منتج إلى السلة أو زيادة كميته"""
+        product_id = product['product_id']
+        line = self.lines.get(product_id)
+        if line is None:
+            line = dict(self.pricing_for(product), product_id=product_id, quantity=0)
+            self.lines[product_id] = line
+        # المخزون من صف المنتج الحالي (للتنبيه فقط، البيع يتحقق منه في قاعدة البيانات)
+        line['stock_quantity'] = product['stock_quantity']
+        return self.set_quantity(product_id, line['quantity'] + quantity)
+
+    def set_quantity(self, product_id, quantity):
+        """تغيير كمية بند (الصفر يحذف البند)، ويرجع البند أو None عند حذفه"""
+        line = self.lines.get(product_id)
+        if line is None:
+            return None
+
+        self._apply(line, -1)
+        if quantity <= 0:
+            del self.lines[product_id]
+            line = None
+        else:
+            line['quantity'] = quantity
+            self._apply(line, 1)
+
+        if self.journal is not None:
+            entry = dict(self.lines[product_id]) if line else {'product_id': product_id}
+            entry['quantity'] = max(quantity, 0)
+            self.journal.append(entry)
+        return line
+
+    def remove(self, product_id):
+        """حذف بند من السلة"""
+        return self.set_quantity(product_id, 0)
+
+    def clear(self):
+        """تفريغ السلة"""
+        self.lines.clear()
+        self._reset_totals()
+        if self.journal is not None:
+            self.journal.truncate()
+
+    def pending_entries(self):
+        """تغييرات سلة لم تُبع بعد في السجل
+
+        إن كان آخر سطر تسجيلاً لبيع موجود في قاعدة البيانات فقد ثُبت البيع
+        قبل الانقطاع، فيُفرغ السجل ولا يُرجع شيء.
+        """
+        if self.journal is None:
+            return []
+        entries = self.journal.read()
+        marker = CartJournal.sale_marker(entries)
+        if marker is not None and self.sale_model.sale_exists(marker['sale_id'], marker['date']):
+            self.journal.truncate()
+            return []
+        return [entry for entry in entries if 'sale_id' not in entry]
+
+    def restore(self, entries=None):
+        """استعادة السلة من السجل بعد إعادة التشغيل، ويرجع عدد البنود المستعادة
+
+        entries: نتيجة pending_entries إن جُلبت مسبقاً (في الخيط العامل).
+        """
+        if self.journal is None:
+            return 0
+
+        lines = OrderedDict()
+        for entry in self.pending_entries() if entries is None else entries:
+            if entry['quantity'] > 0:
+                lines[entry['product_id']] = entry
+            else:
+                lines.pop(entry['product_id'], None)
+
+        self.lines.clear()
+        self._reset_totals()
+        for product_id, entry in lines.items():
+            line = dict(entry)
+            self.lines[product_id] = line
+            self._apply(line, 1)
+
+        # إعادة كتابة السجل بالحالة الحالية فقط حتى لا يكبر
+        self.journal.rewrite(self.lines.values())
+        return len(self.lines)
+
+    def _apply(self, line, sign):
+        """إضافة أو طرح مساهمة البند في الإجماليات"""
+        quantity = line['quantity'] * sign
+        self.total_amount += line['selling_price'] * quantity
+        self.final_amount += line['final_price'] * quantity
+        self.profit += (line['final_price'] - line['purchasing_price']) * quantity
+        self.item_count += quantity
+
+    def line_total(self, product_id):
+        """إجمالي البند بعد الخصم"""
+        line = self.lines[product_id]
+        return line['final_price'] * line['quantity']
+
+    def is_short(self, product_id):
+        """هل الكمية المطلوبة أكبر من المخزون المعروف؟"""
+        line = self.lines[product_id]
+        return line['quantity'] > line['stock_quantity']
+
+    def totals(self):
+        """إجماليات السلة مقربة لخانتين"""
+        return {
+            'total_amount': round(self.total_amount, 2),
+            'discount': round(self.total_amount - self.final_amount, 2),
+            'final_amount': round(self.final_amount, 2),
+            'profit': round(self.profit, 2),
+            'item_count': self.item_count,
+            'line_count': len(self.lines),
+        }
+
+    def sale_items(self):
+        """بنود البيع بالصيغة التي يتوقعها نموذج المبيعات"""
+        return [{
+            'product_id': line['product_id'],
+            'quantity': line['quantity'],
+            'selling_price': line['selling_price'],
+            'purchasing_price': line['purchasing_price'],
+            'discount_applied': line['discount_applied'],
+            'manual_discount': line['manual_discount'],
+            'final_price': line['final_price'],
+        } for line in self.lines.values()]
+
+    def checkout(self, customer_id=None):
+        """إتمام البيع في معاملة واحدة، وتفريغ السلة عند النجاح
+
+        ترجع نتيجة Sale.checkout، وعند نقص المخزون تُحدث الكميات المتاحة
+        للبنود حتى تظهر للكاشير.
+        """
+        if not self.lines:
+            return {'success': False, 'sale_id': None, 'lines': []}
+
+        totals = self.totals()
+        result = self.sale_model.checkout(customer_id, totals['total_amount'], totals['profit'],
+                                          totals['final_amount'], self.sale_items(),
+                                          before_commit=self.journal.mark_sale if self.journal else None)
+        if result['success']:
+            self.clear()
+        else:
+            for status in result['lines']:
+                line = self.lines.get(status['product_id'])
+                if line is not None and status['available'] is not None:
+                    line['stock_quantity'] = status['available']
+        return result
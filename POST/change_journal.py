@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+أرشيف سجل التغييرات والاستعادة لوقت محدد
+
+المشغلات تسجل صورة كل صف يتغير في جدول changelog (الترحيل 7)، وينقل
+archive() الصفوف الجديدة دورياً إلى ملفات مضغوطة في backups/journal ثم
+يحذفها من قاعدة البيانات. الاستعادة تأخذ أقرب نسخة احتياطية قبل الوقت
+المطلوب وتطبق عليها التغييرات التالية لها حتى ذلك الوقت.
+
+التطبيق جماعي وليس تغييراً بعد تغيير: كل تغيير يحمل صورة الصف كاملة، فيكفي
+آخر تغيير لكل صف، ويُطبق كل جدول بثلاثة استعلامات (حذف، تعديل، إضافة)
+داخل معاملة واحدة.
+
+الاستخدام:
+    python change_journal.py "2024-05-01 18:00:00" [ملف الناتج] [--restore]
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+
+from database import (JOURNALED_TABLES, connection_manager, create_changelog_triggers,
+                      drop_changelog_triggers)
+
+# أعمدة التغيير بالترتيب المخزن في الأرشيف
+CHANGE_COLUMNS = ('change_id', 'changed_at', 'table_name', 'operation', 'row_id', 'row_data')
+
+def change_position(conn):
+    """رقم آخر تغيير مسجل في قاعدة البيانات (0 إن لم يوجد سجل)"""
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changelog'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def end_of_second(target_time):
+    """حد المقارنة لوقت مطلوب بالثواني: أوقات التغييرات بالمللي ثانية، فيشمل الحد الثانية كلها"""
+    return target_time + ".999" if len(target_time) == 19 else target_time
+
+def foreign_key_violations(conn):
+    """مخالفات المفاتيح الأجنبية في قاعدة بيانات: [(الجدول، الصف، الجدول المشار إليه، رقم المفتاح)]"""
+    return [tuple(row) for row in conn.execute("PRAGMA foreign_key_check").fetchall()]
+
+def has_changelog(conn):
+    """هل تحتوي قاعدة البيانات على سجل التغييرات؟ (النسخ الأقدم منه لا تصلح أساساً)"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'changelog'"
+                        ).fetchone() is not None
+
+class JournalArchive:
+    """ملفات أرشيف سجل التغييرات: كل ملف يحمل مدى متصلاً من أرقام التغييرات
+
+    الأرشفة الدورية تضيف إلى آخر ملف حتى يبلغ SEGMENT_BYTES ثم تبدأ ملفاً
+    جديداً، واسم آخر ملف محفوظ في STATE_FILE فلا يُفحص المجلد مع كل أرشفة.
+    """
+
+    SUFFIX = ".jsonl.gz"
+    # حجم الملف المضغوط الذي يُبدأ بعده ملف جديد
+    SEGMENT_BYTES = 256 * 1024
+    STATE_FILE = "last_segment"
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _parse(self, file_name):
+        """(أول رقم، آخر رقم، المسار) من اسم ملف أرشيف"""
+        first, last = file_name[:-len(self.SUFFIX)].split("_")
+        return int(first), int(last), os.path.join(self.root, file_name)
+
+    def segments(self):
+        """ملفات الأرشيف مرتبة: (أول رقم، آخر رقم، المسار)
+
+        الانقطاع أثناء الإضافة قد يترك الملف السابق بجانب الملف الأطول الذي
+        يحتويه (بنفس أول رقم)، فيُحذف.
+        """
+        longest = {}
+        for file_name in os.listdir(self.root):
+            if file_name.endswith(self.SUFFIX):
+                segment = self._parse(file_name)
+                previous = longest.get(segment[0])
+                if previous is not None:
+                    shorter = min(previous, segment)
+                    os.remove(shorter[2])
+                    segment = max(previous, segment)
+                longest[segment[0]] = segment
+        return sorted(longest.values())
+
+    def _last_segment(self):
+        """آخر ملف أرشيف (None إن لم يوجد) من ملف الحالة، أو من فحص المجلد إن لم يصلح"""
+        try:
+            with open(os.path.join(self.root, self.STATE_FILE), 'r', encoding='utf-8') as state:
+                segment = self._parse(state.read().strip())
+            if os.path.exists(segment[2]):
+                return segment
+        except (OSError, ValueError):
+            pass
+        segments = self.segments()
+        segment = segments[-1] if segments else None
+        self._save_state(segment)
+        return segment
+
+    def _save_state(self, segment):
+        """حفظ اسم آخر ملف أرشيف (ملف صغير يُستبدل دفعة واحدة)"""
+        state_path = os.path.join(self.root, self.STATE_FILE)
+        if segment is None:
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            return
+        with open(state_path + ".tmp", 'w', encoding='utf-8') as state:
+            state.write(os.path.basename(segment[2]))
+        os.replace(state_path + ".tmp", state_path)
+
+    def last_archived(self):
+        """رقم آخر تغيير في الأرشيف"""
+        segment = self._last_segment()
+        return segment[1] if segment else 0
+
+    def archive(self, db_name):
+        """نقل التغييرات الجديدة من قاعدة البيانات إلى ملف أرشيف، ويرجع عددها"""
+        conn = connection_manager.get_connection(db_name)
+        segment = self._last_segment()
+        last = segment[1] if segment else 0
+        changes = conn.execute(f"SELECT {', '.join(CHANGE_COLUMNS)} FROM changelog "
+                               "WHERE change_id > ? ORDER BY change_id", (last,)).fetchall()
+        if changes:
+            if segment and os.path.getsize(segment[2]) < self.SEGMENT_BYTES:
+                # الإضافة لآخر ملف: يُكتب الملف الأطول أولاً ثم يُحذف السابق
+                self._write_segment(self._read_segment(segment[2]) + changes)
+                os.remove(segment[2])
+            else:
+                self._write_segment(changes)
+        # الحذف بعد كتابة الملف على القرص: الانقطاع بينهما لا يفقد تغييرات
+        try:
+            conn.execute("DELETE FROM changelog WHERE change_id <= ?",
+                         (changes[-1][0] if changes else last,))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return len(changes)
+
+    def _write_segment(self, changes):
+        """كتابة ملف أرشيف بملف مؤقت (يُثبت على القرص) ثم استبداله، وتسجيله آخر ملف"""
+        path = os.path.join(self.root, f"{changes[0][0]:012d}_{changes[-1][0]:012d}{self.SUFFIX}")
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as raw:
+            with gzip.open(raw, 'wt', encoding='utf-8') as segment:
+                for change in changes:
+                    segment.write(json.dumps(list(change), ensure_ascii=False) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, path)
+        self._save_state((changes[0][0], changes[-1][0], path))
+
+    @staticmethod
+    def _read_segment(path):
+        """قراءة تغييرات ملف أرشيف"""
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            return [tuple(json.loads(line)) for line in segment]
+
+    def changes(self, after_id, until=None):
+        """التغييرات بعد رقم معين وحتى وقت معين (شامل) بالترتيب"""
+        for first, last, path in self.segments():
+            if last <= after_id:
+                continue
+            for change in self._read_segment(path):
+                if change[0] > after_id and (until is None or change[1] <= until):
+                    yield change
+
+    def truncate_after(self, change_id):
+        """بدء خط زمني جديد بعد استعادة: نقل التغييرات التالية لرقم معين إلى مجلد جانبي
+
+        بعد الاستعادة تُعاد أرقام التغييرات من موضع النسخة المستعادة، فالتغييرات
+        المؤرشفة بعده تخص خطاً زمنياً لم يعد قائماً (تُحفظ ولا تُحذف).
+        """
+        abandoned_dir = None
+        for first, last, path in self.segments():
+            if last <= change_id:
+                continue
+            if abandoned_dir is None:
+                abandoned_dir = os.path.join(
+                    self.root, f"abandoned_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+                os.makedirs(abandoned_dir)
+            kept = [change for change in self._read_segment(path) if change[0] <= change_id]
+            if kept:
+                self._write_segment(kept)
+            shutil.move(path, os.path.join(abandoned_dir, os.path.basename(path)))
+
+    def prune_before(self, change_id):
+        """حذف ملفات الأرشيف التي تسبق أقدم نسخة احتياطية (لا تحتاجها أي استعادة)"""
+        removed = 0
+        for first, last, path in self.segments():
+            if last <= change_id:
+                os.remove(path)
+                removed += 1
+        return removed
+
+def apply_changes(conn, changes):
+    """تطبيق التغييرات التالية لموضع قاعدة البيانات دفعة واحدة، ويرجع عددها
+
+    التغييرات تُضاف أيضاً إلى changelog بأرقامها (بدون تشغيل المشغلات) حتى
+    يستمر السجل من نفس الموضع. المشغلات الأخرى (الملخص اليومي وفهرس البحث)
+    تعمل كالمعتاد مع الحذف والتعديل والإضافة.
+    """
+    cursor = conn.cursor()
+    base = change_position(conn)
+    # لا يُغير خارج المعاملة، وبدونه لا يعمل تأجيل فحص المفاتيح الأجنبية
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.execute("BEGIN")
+    try:
+        drop_changelog_triggers(cursor)
+        cursor.executemany(f"INSERT INTO changelog ({', '.join(CHANGE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                           (change for change in changes if change[0] > base))
+        count = cursor.execute("SELECT COUNT(*) FROM changelog WHERE change_id > ?", (base,)).fetchone()[0]
+
+        # آخر صورة لكل صف
+        cursor.execute('''
+            CREATE TEMP TABLE last_changes AS
+            SELECT c.table_name, c.operation, c.row_id, c.row_data
+            FROM changelog c
+            JOIN (SELECT MAX(change_id) AS change_id FROM changelog
+                  WHERE change_id > ? GROUP BY table_name, row_id) l USING (change_id)
+        ''', (base,))
+        cursor.execute("CREATE INDEX temp.idx_last_changes ON last_changes(table_name, row_id)")
+        # الحذف قبل إعادة الإضافة قد يخالف المفاتيح الأجنبية مؤقتاً
+        cursor.execute("PRAGMA defer_foreign_keys = ON")
+
+        for table in JOURNALED_TABLES:
+            cursor.execute(f"PRAGMA table_info({table})")
+            info = cursor.fetchall()
+            columns = [row[1] for row in info]
+            key = [row[1] for row in info if row[5]][0]
+            values = [f"json_extract(l.row_data, '$.{column}')" for column in columns]
+            updated = [(column, value) for column, value in zip(columns, values) if column != key]
+
+            cursor.execute(f'''
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT row_id FROM last_changes WHERE table_name = ? AND operation = 'D')
+            ''', (table,))
+            # استعلام فرعي مرتبط بدل UPDATE ... FROM (يتطلب SQLite 3.33)
+            cursor.execute(f'''
+                UPDATE {table} SET ({", ".join(column for column, _ in updated)}) =
+                                   (SELECT {", ".join(value for _, value in updated)}
+                                    FROM last_changes l
+                                    WHERE l.table_name = ? AND l.row_id = {table}.rowid)
+                WHERE rowid IN (SELECT row_id FROM last_changes
+                                WHERE table_name = ? AND operation != 'D')
+            ''', (table, table))
+            cursor.execute(f'''
+                INSERT INTO {table} ({", ".join(columns)})
+                SELECT {", ".join(values)} FROM last_changes l
+                WHERE l.table_name = ? AND l.operation != 'D'
+                  AND l.row_id NOT IN (SELECT rowid FROM {table})
+            ''', (table,))
+
+        cursor.execute("DROP TABLE temp.last_changes")
+        create_changelog_triggers(cursor)
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+
+def main():
+    """استعادة قاعدة البيانات لوقت محدد من سطر الأوامر"""
+    args = [arg for arg in sys.argv[1:] if arg != "--restore"]
+    if not args:
+        print(__doc__)
+        return 1
+    # utils تستورد هذه الوحدة
+    from utils import BackupManager
+
+    target_time = args[0]
+    manager = BackupManager()
+    result = manager.recover_to_time(target_time, args[1] if len(args) > 1 else None)
+    if result is None:
+        print("تعذرت الاستعادة لهذا الوقت")
+        return 1
+    print(f"النسخة الأساسية: {result['base']}")
+    print(f"التغييرات المطبقة: {result['changes']} في {result['seconds']:.2f} ثانية")
+    print(f"قاعدة البيانات المستعادة: {result['path']}")
+
+    if "--restore" in sys.argv:
+        if not manager.restore_backup(result['path']):
+            print("فشل استبدال قاعدة البيانات الحالية")
+            return 1
+        print("تم استبدال قاعدة البيانات الحالية")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""مخزن النسخ الاحتياطية التزايدية بدون تكرار
+
+يُقسم ملف النسخة إلى أجزاء ثابتة الحجم (مضاعفات صفحات SQLite) ويُخزن كل
+جزء مرة واحدة فقط باسم بصمته (SHA-256). كل نسخة احتياطية هي ملف وصف صغير
+(manifest) يحتوي قائمة بصمات أجزائها، فالنسخة الجديدة لا تكتب إلا الصفحات
+التي تغيرت منذ النسخ السابقة. كل جزء له عداد مراجع يُحذف عند وصوله للصفر.
+
+ترتيب الكتابة يحمي من الانقطاع: الأجزاء ثم العدادات ثم ملف الوصف عند
+الإنشاء، وملف الوصف أولاً عند الحذف. الانقطاع قد يترك أجزاء زائدة
+(تُزال بـ collect_garbage) لكنه لا يحذف جزءاً تحتاجه نسخة موجودة.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+# قفل مشترك لجميع المخازن (النسخ اليدوي والتلقائي قد يعملان معاً)
+_store_lock = threading.Lock()
+
+class ChunkStore:
+    """مخزن أجزاء بعناوين المحتوى مع ملفات وصف وعدادات مراجع"""
+
+    # 64 كيلوبايت = 16 صفحة بالحجم الافتراضي، ومضاعف لأي حجم صفحة في SQLite
+    CHUNK_SIZE = 64 * 1024
+    MANIFEST_SUFFIX = ".manifest.json"
+
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.manifests_dir = os.path.join(root, "manifests")
+        self.refcounts_path = os.path.join(root, "refcounts.json")
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def chunk_path(self, digest):
+        """مسار الجزء (مجلد فرعي بأول حرفين حتى لا يكبر مجلد واحد)"""
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def manifest_path(self, name):
+        """مسار ملف وصف النسخة"""
+        return os.path.join(self.manifests_dir, name + self.MANIFEST_SUFFIX)
+
+    def store_file(self, path, name, progress=None, unique=False):
+        """تخزين ملف كنسخة جديدة وإرجاع ملف الوصف
+
+        progress(done, total) تُستدعى بعد كل جزء بعدد البايتات المقروءة.
+        اسم موجود يُرفض بـ FileExistsError (استبدال ملف وصفه يحسب أجزاءه
+        مرتين)، أو يُضاف إليه رقم مع unique=True، واسم النسخة في ملف الوصف.
+        """
+        total = os.path.getsize(path)
+        digests = []
+        new_bytes = 0
+        file_hash = hashlib.sha256()
+
+        with _store_lock:
+            name = self._available_name(name, unique)
+            with open(path, 'rb') as source:
+                while True:
+                    data = source.read(self.chunk_size)
+                    if not data:
+                        break
+                    file_hash.update(data)
+                    digest = hashlib.sha256(data).hexdigest()
+                    chunk_path = self.chunk_path(digest)
+                    if not os.path.exists(chunk_path):
+                        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                        self._write_atomic(chunk_path, data)
+                        new_bytes += len(data)
+                    digests.append(digest)
+                    if progress:
+                        progress(source.tell(), total)
+
+            # العدادات قبل ملف الوصف: الانقطاع بينهما يترك أجزاء زائدة فقط
+            refcounts = self._load_refcounts()
+            for digest in digests:
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+            self._save_refcounts(refcounts)
+
+            manifest = {
+                'name': name,
+                'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'size': total,
+                'chunk_size': self.chunk_size,
+                'sha256': file_hash.hexdigest(),
+                'new_bytes': new_bytes,
+                'chunks': digests,
+            }
+            self._write_atomic(self.manifest_path(name),
+                               json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        return manifest
+
+    def _available_name(self, name, unique):
+        """اسم لا يوجد له ملف وصف (يُستدعى داخل قفل المخزن)"""
+        if not os.path.exists(self.manifest_path(name)):
+            return name
+        if not unique:
+            raise FileExistsError(f"توجد نسخة بنفس الاسم: {name}")
+        number = 2
+        while os.path.exists(self.manifest_path(f"{name}_{number}")):
+            number += 1
+        return f"{name}_{number}"
+
+    def load_manifest(self, name):
+        """قراءة ملف وصف نسخة (None إن لم توجد)"""
+        try:
+            with open(self.manifest_path(name), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    def restore_to(self, name, target_path, progress=None):
+        """إعادة تجميع النسخة في ملف والتحقق من بصمتها"""
+        manifest = self.load_manifest(name)
+        if manifest is None:
+            raise FileNotFoundError(f"النسخة غير موجودة: {name}")
+
+        file_hash = hashlib.sha256()
+        done = 0
+        with open(target_path, 'wb') as target:
+            for digest in manifest['chunks']:
+                with open(self.chunk_path(digest), 'rb') as chunk_file:
+                    data = chunk_file.read()
+                file_hash.update(data)
+                target.write(data)
+                done += len(data)
+                if progress:
+                    progress(done, manifest['size'])
+            target.flush()
+            os.fsync(target.fileno())
+
+        if file_hash.hexdigest() != manifest['sha256']:
+            os.remove(target_path)
+            raise ValueError(f"بصمة النسخة المستعادة غير مطابقة: {name}")
+        return manifest
+
+    def delete(self, name):
+        """حذف نسخة وحذف أجزائها التي لم تعد مستخدمة، ويرجع عدد الأجزاء المحذوفة"""
+        with _store_lock:
+            manifest = self.load_manifest(name)
+            if manifest is None:
+                return 0
+            # ملف الوصف أولاً: الانقطاع بعده يترك أجزاء زائدة فقط
+            os.remove(self.manifest_path(name))
+
+            refcounts = self._load_refcounts()
+            freed = 0
+            for digest in manifest['chunks']:
+                count = refcounts.get(digest, 0) - 1
+                if count > 0:
+                    refcounts[digest] = count
+                elif digest in refcounts:
+                    del refcounts[digest]
+                    self._remove_chunk(digest)
+                    freed += 1
+            self._save_refcounts(refcounts)
+            return freed
+
+    def list_manifests(self):
+        """ملفات وصف جميع النسخ من الأحدث للأقدم"""
+        manifests = []
+        for file_name in os.listdir(self.manifests_dir):
+            if file_name.endswith(self.MANIFEST_SUFFIX):
+                manifest = self.load_manifest(file_name[:-len(self.MANIFEST_SUFFIX)])
+                if manifest is not None:
+                    manifests.append(manifest)
+        return sorted(manifests, key=lambda manifest: manifest['created'], reverse=True)
+
+    def collect_garbage(self):
+        """إعادة حساب العدادات من ملفات الوصف وحذف الأجزاء غير المستخدمة
+
+        يُصلح آثار أي انقطاع أثناء الإنشاء أو الحذف، ويرجع عدد الأجزاء المحذوفة.
+        """
+        with _store_lock:
+            refcounts = {}
+            for manifest in self.list_manifests():
+                for digest in manifest['chunks']:
+                    refcounts[digest] = refcounts.get(digest, 0) + 1
+
+            freed = 0
+            for directory, _, file_names in os.walk(self.chunks_dir):
+                for file_name in file_names:
+                    if file_name not in refcounts:
+                        os.remove(os.path.join(directory, file_name))
+                        freed += 1
+            self._save_refcounts(refcounts)
+            return freed
+
+    def stored_bytes(self):
+        """الحجم الفعلي لجميع الأجزاء المخزنة"""
+        return sum(os.path.getsize(os.path.join(directory, file_name))
+                   for directory, _, file_names in os.walk(self.chunks_dir)
+                   for file_name in file_names)
+
+    def _remove_chunk(self, digest):
+        """حذف ملف جزء"""
+        try:
+            os.remove(self.chunk_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _load_refcounts(self):
+        """قراءة عدادات المراجع"""
+        try:
+            with open(self.refcounts_path, 'r', encoding='utf-8') as refcounts_file:
+                return json.load(refcounts_file)
+        except FileNotFoundError:
+            return {}
+
+    def _save_refcounts(self, refcounts):
+        """حفظ عدادات المراجع"""
+        self._write_atomic(self.refcounts_path, json.dumps(refcounts).encode('utf-8'))
+
+    @staticmethod
+    def _write_atomic(path, data):
+        """كتابة ملف مؤقت ثم استبداله حتى لا يبقى ملف نصف مكتوب"""
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
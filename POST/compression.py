@@ -0,0 +1,121 @@
+"""ضغط النسخ الاحتياطية بالتدفق مع ضغط متوازٍ للكتل
+
+الملف يُقرأ كتلة بعد كتلة (لا يُحمل كاملاً في الذاكرة) وتُضغط كل كتلة
+كتيار مستقل في خيوط عاملة، ثم تُكتب النتائج بالترتيب. دوال الضغط في
+zlib و bz2 و lzma تحرر قفل GIL فتعمل الخيوط على أكثر من نواة فعلياً.
+الملف الناتج هو تتابع تيارات قياسية يفكه gzip/xz/bzip2 العادي وكذلك
+وحدات Python نفسها (كلها تدعم الملفات متعددة التيارات).
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# حجم الكتلة المضغوطة كتيار مستقل (أكبر = ضغط أفضل، أصغر = توازٍ أكثر)
+BLOCK_SIZE = 1024 * 1024
+
+# حجم القراءة عند فك الضغط
+READ_SIZE = 64 * 1024
+
+# الضغط الافتراضي للنسخ الاحتياطية
+DEFAULT_CODEC = 'gzip'
+
+# الاسم: (الامتداد، ضغط كتلة، فتح ملف مضغوط للقراءة)
+CODECS = {
+    'gzip': ('.gz',
+             lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+             lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode='rb')),
+    'lzma': ('.xz',
+             lambda data: lzma.compress(data, preset=6),
+             lambda fileobj: lzma.LZMAFile(fileobj, mode='rb')),
+    'bz2': ('.bz2',
+            lambda data: bz2.compress(data, compresslevel=9),
+            lambda fileobj: bz2.BZ2File(fileobj, mode='rb')),
+}
+
+def default_workers():
+    """عدد خيوط الضغط (محدود حتى لا تستهلك ذاكرة lzma الجهاز كله)"""
+    return max(1, min(os.cpu_count() or 1, 4))
+
+def codec_for_path(path):
+    """نوع الضغط من امتداد الملف (None لملف غير مضغوط)"""
+    for name, (extension, _, _) in CODECS.items():
+        if path.endswith(extension):
+            return name
+    return None
+
+def extension_for(codec):
+    """امتداد الملف لنوع الضغط"""
+    return CODECS[codec][0] if codec else ""
+
+def compress_file(source_path, target_path, codec=DEFAULT_CODEC, progress=None,
+                  workers=None, block_size=BLOCK_SIZE):
+    """ضغط ملف بالتدفق مع ضغط الكتل بالتوازي، ويرجع (الحجم الأصلي، الحجم المضغوط)
+
+    يُكتب الناتج في ملف مؤقت ثم يُستبدل، فلا يبقى ملف نصف مضغوط عند الانقطاع.
+    progress(done, total) تُستدعى بعد كتابة كل كتلة (من نفس الخيط).
+    """
+    compress_block = CODECS[codec][1]
+    workers = workers or default_workers()
+    total = os.path.getsize(source_path)
+    partial_path = target_path + ".partial"
+    done = 0
+
+    try:
+        with open(source_path, 'rb') as source, open(partial_path, 'wb') as target, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compress") as executor:
+            # كتل قيد الضغط بالترتيب (عددها محدود حتى تبقى الذاكرة ثابتة)
+            pending = deque()
+            while True:
+                data = source.read(block_size)
+                if data:
+                    pending.append((len(data), executor.submit(compress_block, data)))
+                if pending and (not data or len(pending) >= 2 * workers):
+                    size, future = pending.popleft()
+                    target.write(future.result())
+                    done += size
+                    if progress:
+                        progress(done, total)
+                if not data and not pending:
+                    break
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(partial_path, target_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return total, os.path.getsize(target_path)
+
+def decompress_file(source_path, target_path, progress=None):
+    """فك ضغط ملف بالتدفق إلى ملف مؤقت ثم استبداله، ويرجع الحجم الأصلي
+
+    progress(done, total) بعدد البايتات المضغوطة المقروءة من حجم الملف المضغوط.
+    """
+    codec = codec_for_path(source_path)
+    if codec is None:
+        raise ValueError(f"نوع ضغط غير معروف: {source_path}")
+    total = os.path.getsize(source_path)
+    partial_path = target_path + ".partial"
+    size = 0
+
+    try:
+        with open(source_path, 'rb') as raw, CODECS[codec][2](raw) as source, \
+                open(partial_path, 'wb') as target:
+            while True:
+                data = source.read(READ_SIZE)
+                if not data:
+                    break
+                target.write(data)
+                size += len(data)
+                if progress:
+                    progress(raw.tell(), total)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(partial_path, target_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return size
@@ -1,8 +1,342 @@
 import sqlite3
 import os
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+from urllib.parse import quote
 from datetime import datetime
 import shutil
 
+from arabic_text import normalize_sql
+
+# مهلة انتظار قفل الكتابة بالثواني قبل أن يعيد SQLite الخطأ "database is locked"
+BUSY_TIMEOUT = 5.0
+# عدد مرات إعادة محاولة معاملة الكتابة عند انشغال قاعدة البيانات
+BUSY_RETRIES = 3
+BUSY_RETRY_DELAY = 0.1
+
+# إعدادات PRAGMA التي تُطبق على كل اتصال جديد
+# WAL يسمح للتقارير بالقراءة أثناء الكتابة، و NORMAL يكتفي بمزامنة القرص عند نقاط التثبيت
+PRAGMA_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(BUSY_TIMEOUT * 1000),
+    'cache_size': -20000,           # حوالي 20 ميجابايت
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+    'wal_autocheckpoint': 1000,     # صفحات
+}
+
+# إعدادات لا تنطبق على اتصالات القراءة فقط
+WRITE_ONLY_PRAGMAS = ('journal_mode', 'wal_autocheckpoint')
+
+# عدد صفحات WAL التي يُنفذ بعدها تثبيت دوري إضافي من التطبيق
+CHECKPOINT_PAGES = 4000
+
+# النسخ الاحتياطي: عدد الصفحات في كل خطوة والانتظار بين الخطوات (بالثواني)
+# حتى لا يحتكر النسخ القرص أثناء البيع
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_DELAY = 0.005
+# عدد مرات إعادة النسخ بسبب الكتابة أثناءه قبل النسخ في خطوة واحدة
+BACKUP_MAX_RESTARTS = 3
+
+# الجداول التي تُسجل تغييراتها في changelog للاستعادة لوقت محدد، ومعها كل
+# جدول تشير إليه مفاتيحها الأجنبية حتى تبقى القاعدة المستعادة متسقة
+JOURNALED_TABLES = ('categories', 'suppliers', 'customers', 'products', 'sales', 'sale_details',
+                    'expenses', 'invoices')
+
+# نطاق إصدار البيانات لكل جدول: الكتابات من أي عملية ترفع عداد نطاقها في
+# data_versions فتكتشفها العمليات الأخرى (انظر DataVersion.sync في models)
+VERSIONED_TABLES = {
+    'products': 'products',
+    'product_barcodes': 'products',
+    'categories': 'categories',
+    'suppliers': 'suppliers',
+    'customers': 'customers',
+    'sales': 'sales',
+    'expenses': 'expenses',
+}
+
+# النطاقات التي تُسجل أيامها المتأثرة أيضاً (عمود التاريخ في كل جدول)، حتى لا
+# تُبطل كتابات اليوم من عملية أخرى تقارير الفترات المغلقة
+DAY_VERSIONED_TABLES = {
+    'sales': 'sales',
+    'expenses': 'expenses',
+}
+
+# وقت التغيير بالمللي ثانية وبالتوقيت المحلي (مثل تواريخ المبيعات)
+CHANGED_AT_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+def create_changelog_triggers(cursor):
+    """مشغلات تسجل صورة الصف كاملة (JSON) بعد كل إضافة أو تعديل وعند الحذف
+
+    قائمة الأعمدة تُؤخذ من الجدول وقت الإنشاء، فأي ترحيل يضيف عموداً لجدول
+    مسجل يستدعي drop_changelog_triggers ثم هذه الدالة من جديد.
+    """
+    for table in JOURNALED_TABLES:
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall()]
+        image = "json_object(" + ", ".join(f"'{column}', NEW.{column}" for column in columns) + ")"
+        log = "INSERT INTO changelog (table_name, operation, row_id, row_data) VALUES"
+
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_changelog_insert
+                           AFTER INSERT ON {table}
+                           BEGIN {log} ('{table}', 'I', NEW.rowid, {image}); END""")
+        # تغيير المعرف نفسه يُسجل كحذف للمعرف القديم
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_changelog_update
+                           AFTER UPDATE ON {table}
+                           BEGIN
+                               INSERT INTO changelog (table_name, operation, row_id)
+                               SELECT '{table}', 'D', OLD.rowid WHERE OLD.rowid != NEW.rowid;
+                               {log} ('{table}', 'U', NEW.rowid, {image});
+                           END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_changelog_delete
+                           AFTER DELETE ON {table}
+                           BEGIN {log} ('{table}', 'D', OLD.rowid, NULL); END""")
+
+def drop_changelog_triggers(cursor):
+    """حذف مشغلات سجل التغييرات (عند إعادة تطبيق السجل أو تغيير أعمدة الجداول)"""
+    for table in JOURNALED_TABLES:
+        for event in ("insert", "update", "delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_changelog_{event}")
+
+def apply_pragmas(conn, pragmas):
+    """تطبيق إعدادات PRAGMA على اتصال مفتوح"""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def is_busy_error(error):
+    """هل الخطأ ناتج عن قفل قاعدة البيانات من طرف آخر؟"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+class BackupRestarted(Exception):
+    """إعادة النسخ الاحتياطي مرات كثيرة بسبب الكتابة أثناءه"""
+
+def online_backup(db_name, backup_path, progress=None, pages=BACKUP_PAGES_PER_STEP,
+                  step_delay=BACKUP_STEP_DELAY):
+    """نسخ احتياطي متسق لقاعدة بيانات مفتوحة باستخدام واجهة النسخ في SQLite
+
+    بخلاف نسخ الملف، يقرأ SQLite الصفحات عبر WAL ويعيد النسخ تلقائياً إن
+    تغيرت قاعدة البيانات أثناءه، فلا تنتج نسخة ممزقة إذا تم بيع أثناء النسخ.
+    النسخة تُكتب في ملف مؤقت ويُفحص سلامتها (integrity_check) قبل نقلها
+    إلى مسارها النهائي. يُفضل تشغيلها في خيط عامل وليس في خيط الواجهة.
+
+    progress(copied, total): تُستدعى بعد كل خطوة بعدد الصفحات المنسوخة والكلي.
+    ترفع sqlite3.DatabaseError إن فشل فحص السلامة.
+    """
+    temp_path = backup_path + ".partial"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    restarts = 0
+    last_remaining = None
+
+    def on_step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            # كتابة من اتصال آخر أعادت النسخ من البداية
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted()
+        last_remaining = remaining
+        if progress:
+            progress(total - remaining, total)
+        if remaining and step_delay:
+            # إتاحة القرص لعمليات البيع بين الخطوات
+            time.sleep(step_delay)
+
+    source = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT)
+    target = sqlite3.connect(temp_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=on_step)
+        except BackupRestarted:
+            # البيع مستمر بكثافة: النسخ في خطوة واحدة داخل معاملة قراءة واحدة
+            # (في وضع WAL لا تمنع القراءة عمليات الكتابة)
+            last_remaining = None
+            source.backup(target, pages=-1, progress=on_step)
+        # النسخة ملف واحد مستقل بدون WAL
+        target.execute("PRAGMA journal_mode = DELETE")
+        result = [row[0] for row in target.execute("PRAGMA integrity_check")]
+    finally:
+        target.close()
+        source.close()
+
+    if result != ['ok']:
+        os.remove(temp_path)
+        raise sqlite3.DatabaseError(f"فشل فحص سلامة النسخة الاحتياطية: {'; '.join(result[:5])}")
+    os.replace(temp_path, backup_path)
+    return backup_path
+
+class ConnectionManager:
+    """مدير الاتصالات المشتركة بين جميع النماذج
+
+    يحتفظ باتصال دائم واحد لكل خيط ولكل ملف قاعدة بيانات بدلاً من
+    فتح الملف وإغلاقه مع كل استعلام.
+    """
+
+    def __init__(self, pragmas=None):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        self.pragmas = dict(PRAGMA_PROFILE if pragmas is None else pragmas)
+        self._reset_hooks = []
+        self._replace_hooks = []
+
+    def add_reset_hook(self, hook):
+        """تسجيل دالة تُستدعى بعد إعادة التهيئة (مثل مسح الذاكرة المؤقتة)"""
+        self._reset_hooks.append(hook)
+
+    def add_replace_hooks(self, before, after):
+        """تسجيل دالتين تُستدعيان قبل استبدال ملف قاعدة البيانات وبعده
+
+        لاتصالات تفتحها وحدات أخرى خارج المجمع (مثل متابعة الإصدارات)، حتى
+        تُغلق قبل الاستبدال (ويندوز يرفض استبدال ملف مفتوح) وتُفتح على الملف الجديد.
+        """
+        self._replace_hooks.append((before, after))
+
+    @contextmanager
+    def replacing(self, db_name):
+        """استبدال ملف قاعدة البيانات داخل الكتلة بعد إغلاق جميع الاتصالات به"""
+        for before, _ in self._replace_hooks:
+            before(db_name)
+        try:
+            self.reset(db_name)
+            yield
+        finally:
+            for _, after in self._replace_hooks:
+                after(db_name)
+
+    def configure(self, pragmas):
+        """تغيير إعدادات PRAGMA وإعادة فتح جميع الاتصالات بها"""
+        self.pragmas = dict(pragmas)
+        self.close_all()
+
+    def _open(self, db_name, read_only=False):
+        """فتح اتصال جديد بإعدادات PRAGMA الحالية"""
+        if read_only:
+            # قناة قراءة منفصلة لا يمكنها الكتابة ولا تحجز أقفال الكتابة
+            uri = f"file:{quote(os.path.abspath(db_name))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            pragmas = {k: v for k, v in self.pragmas.items() if k not in WRITE_ONLY_PRAGMAS}
+            pragmas['query_only'] = 'ON'
+        else:
+            conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            pragmas = self.pragmas
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, pragmas)
+        return conn
+
+    def get_connection(self, db_name, read_only=False):
+        """جلب الاتصال الدائم للخيط الحالي (يتم فتحه عند أول طلب)"""
+        key = (os.path.abspath(db_name), read_only)
+        if getattr(self._local, 'generation', None) != self._generation:
+            # التخلص من الاتصالات التي أُغلقت من خيط آخر
+            with self._lock:
+                live = {id(conn) for _, conn in self._connections}
+                generation = self._generation
+            connections = getattr(self._local, 'connections', {})
+            self._local.connections = {k: c for k, c in connections.items() if id(c) in live}
+            self._local.generation = generation
+
+        conn = self._local.connections.get(key)
+        if conn is None:
+            conn = self._open(db_name, read_only)
+            self._local.connections[key] = conn
+            with self._lock:
+                self._connections.append((key, conn))
+        return conn
+
+    def close_all(self, db_name=None):
+        """إغلاق جميع الاتصالات المفتوحة (أو اتصالات ملف محدد فقط)"""
+        path = os.path.abspath(db_name) if db_name else None
+        with self._lock:
+            remaining = []
+            # إغلاق اتصالات القراءة أولاً حتى يتمكن آخر اتصال كتابة من حذف ملف WAL
+            for conn_key, conn in sorted(self._connections, key=lambda item: not item[0][1]):
+                if path is None or conn_key[0] == path:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                else:
+                    remaining.append((conn_key, conn))
+            self._connections = remaining
+            # إجبار جميع الخيوط على فتح اتصالات جديدة عند الطلب التالي
+            self._generation += 1
+        # بعد الإغلاق قد يُحذف الملف أو يُستبدل (مثل الاستعادة)، فيُعاد التحقق من مخططه
+        with _schema_lock:
+            if path:
+                _bootstrapped_databases.discard(path)
+            else:
+                _bootstrapped_databases.clear()
+
+    @contextmanager
+    def snapshot(self, db_name):
+        """تثبيت لقطة قراءة متسقة عبر عدة استعلامات
+
+        جميع القراءات داخل الكتلة ترى نفس حالة قاعدة البيانات حتى لو تم
+        تسجيل مبيعات جديدة أثناء التقرير، دون أن تمنع نقطة البيع من الكتابة.
+        """
+        conn = self.get_connection(db_name, read_only=True)
+        if conn.in_transaction:
+            # لقطة متداخلة: نستخدم اللقطة المفتوحة بالفعل
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def checkpoint(self, db_name, mode='PASSIVE'):
+        """نقل صفحات WAL إلى ملف قاعدة البيانات
+
+        PASSIVE لا ينتظر القراء أو الكتّاب، و TRUNCATE يفرغ ملف WAL
+        تماماً (يُستخدم قبل نسخ الملف أو استبداله).
+        """
+        conn = self.get_connection(db_name)
+        try:
+            row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            # (busy, صفحات WAL، الصفحات المنقولة)
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            print(f"خطأ في تثبيت WAL: {e}")
+            return None
+
+    def maybe_checkpoint(self, db_name):
+        """سياسة التثبيت الدوري: تثبيت كامل عندما يكبر ملف WAL"""
+        try:
+            wal_size = os.path.getsize(f"{db_name}-wal")
+        except OSError:
+            return None
+        page_size = self.get_connection(db_name).execute("PRAGMA page_size").fetchone()[0]
+        # كل إطار في WAL = رأس 24 بايت + صفحة، بعد رأس الملف (32 بايت)
+        wal_pages = max(0, wal_size - 32) // (page_size + 24)
+        if wal_pages >= CHECKPOINT_PAGES:
+            return self.checkpoint(db_name, 'RESTART')
+        return self.checkpoint(db_name)
+
+    def reset(self, db_name=None):
+        """إعادة تهيئة المجمع بعد استعادة نسخة احتياطية"""
+        # النسخة المستعادة قد تكون بإصدار مخطط أقدم، وclose_all يعيد التحقق منه
+        self.close_all(db_name)
+        for hook in self._reset_hooks:
+            hook(db_name)
+
+# مدير الاتصالات المشترك لجميع النماذج
+connection_manager = ConnectionManager()
+atexit.register(connection_manager.close_all)
+
+# ملفات قواعد البيانات التي تم التحقق من مخططها في هذه العملية
+_bootstrapped_databases = set()
+_schema_lock = threading.Lock()
+
 class Database:
     def __init__(self, db_name="store_management.db"):
         self.db_name = db_name
@@ -12,8 +346,9 @@ class Database:
     def connect(self):
         """إنشاء اتصال بقاعدة البيانات"""
         try:
-            self.connection = sqlite3.connect(self.db_name)
+            self.connection = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT)
             self.connection.row_factory = sqlite3.Row  # للحصول على النتائج كقاموس
+            apply_pragmas(self.connection, connection_manager.pragmas)
             return self.connection
         except sqlite3.Error as e:
             print(f"خطأ في الاتصال بقاعدة البيانات: {e}")
@@ -25,139 +360,511 @@ class Database:
             self.connection.close()
     
     def create_database(self):
-        """إنشاء قاعدة البيانات والجداول"""
+        """التأكد من أن مخطط قاعدة البيانات محدّث
+
+        يتم تشغيل الترحيلات مرة واحدة فقط لكل ملف داخل العملية (حتى تُغلق
+        اتصالاته)، وبعدها لا يكلف إنشاء كائن Database أي عمليات على الملف.
+        """
+        key = os.path.abspath(self.db_name)
+        if key in _bootstrapped_databases:
+            return
+
+        with _schema_lock:
+            if key in _bootstrapped_databases:
+                return
+            if self.run_migrations():
+                _bootstrapped_databases.add(key)
+
+    def get_schema_version(self, cursor):
+        """جلب رقم إصدار المخطط الحالي"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        row = cursor.fetchone()
+        return row[0] or 0
+
+    def run_migrations(self):
+        """تطبيق الترحيلات المرقمة التي لم تُطبق بعد"""
         conn = self.connect()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # إنشاء جدول الفئات
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS categories (
-                        category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        category_name TEXT NOT NULL UNIQUE,
-                        description TEXT
-                    )
-                ''')
-                
-                # إنشاء جدول الموردين
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS suppliers (
-                        supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        supplier_name TEXT NOT NULL,
-                        contact_info TEXT
-                    )
-                ''')
-                
-                # إنشاء جدول العملاء
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS customers (
-                        customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        contact_info TEXT,
-                        purchase_history TEXT
-                    )
-                ''')
-                
-                # إنشاء جدول المنتجات
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS products (
-                        product_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        description TEXT,
-                        selling_price REAL NOT NULL,
-                        purchasing_price REAL NOT NULL,
-                        stock_quantity INTEGER NOT NULL DEFAULT 0,
-                        discount_percentage REAL DEFAULT 0,
-                        manual_discount REAL DEFAULT 0,
-                        category_id INTEGER,
-                        supplier_id INTEGER,
-                        invoice_number TEXT,
-                        FOREIGN KEY (category_id) REFERENCES categories (category_id),
-                        FOREIGN KEY (supplier_id) REFERENCES suppliers (supplier_id)
-                    )
-                ''')
-                
-                # إنشاء جدول المبيعات
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS sales (
-                        sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_id INTEGER,
-                        date TEXT NOT NULL,
-                        total_amount REAL NOT NULL,
-                        profit REAL NOT NULL,
-                        final_amount REAL NOT NULL,
-                        FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
-                    )
-                ''')
-                
-                # إنشاء جدول تفاصيل البيع
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS sale_details (
-                        sale_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        product_id INTEGER NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        selling_price REAL NOT NULL,
-                        purchasing_price REAL NOT NULL,
-                        discount_applied REAL DEFAULT 0,
-                        manual_discount REAL DEFAULT 0,
-                        final_price REAL NOT NULL,
-                        FOREIGN KEY (sale_id) REFERENCES sales (sale_id),
-                        FOREIGN KEY (product_id) REFERENCES products (product_id)
-                    )
-                ''')
-                
-                # إنشاء جدول المصروفات
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS expenses (
-                        expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        description TEXT NOT NULL,
-                        amount REAL NOT NULL,
-                        date TEXT NOT NULL
-                    )
-                ''')
+        if not conn:
+            return False
+        try:
+            # التحكم اليدوي في المعاملات حتى تُطبق الأوامر DDL داخل المعاملة
+            conn.isolation_level = None
+            cursor = conn.cursor()
+            # حجز قفل الكتابة حتى لا تطبق عمليتان نفس الترحيل
+            cursor.execute("BEGIN IMMEDIATE")
+            current = self.get_schema_version(cursor)
+            for version, description, migration in MIGRATIONS:
+                if version <= current:
+                    continue
+                migration(self, cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat()))
+                print(f"تم تطبيق الترحيل رقم {version}: {description}")
+            cursor.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            print(f"خطأ في إنشاء الجداول: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False
+        finally:
+            self.disconnect()
 
-                # إنشاء جدول استعلامات المنتجات
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS product_queries (
-                        query_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_id INTEGER,
-                        product_name TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        quantity INTEGER DEFAULT 1,
-                        notes TEXT,
-                        query_date TEXT NOT NULL,
-                        executed BOOLEAN DEFAULT FALSE,
-                        FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
-                    )
-                ''')
+    def create_base_tables(self, cursor):
+        """الترحيل 1: إنشاء الجداول الأساسية والبيانات التجريبية"""
+        # إنشاء جدول الفئات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category_name TEXT NOT NULL UNIQUE,
+                description TEXT
+            )
+        ''')
+        
+        # إنشاء جدول الموردين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS suppliers (
+                supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                supplier_name TEXT NOT NULL,
+                contact_info TEXT
+            )
+        ''')
+        
+        # إنشاء جدول العملاء
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS customers (
+                customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                contact_info TEXT,
+                purchase_history TEXT
+            )
+        ''')
+        
+        # إنشاء جدول المنتجات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                selling_price REAL NOT NULL,
+                purchasing_price REAL NOT NULL,
+                stock_quantity INTEGER NOT NULL DEFAULT 0,
+                discount_percentage REAL DEFAULT 0,
+                manual_discount REAL DEFAULT 0,
+                category_id INTEGER,
+                supplier_id INTEGER,
+                invoice_number TEXT,
+                FOREIGN KEY (category_id) REFERENCES categories (category_id),
+                FOREIGN KEY (supplier_id) REFERENCES suppliers (supplier_id)
+            )
+        ''')
+        
+        # إنشاء جدول المبيعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales (
+                sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                customer_id INTEGER,
+                date TEXT NOT NULL,
+                total_amount REAL NOT NULL,
+                profit REAL NOT NULL,
+                final_amount REAL NOT NULL,
+                FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
+            )
+        ''')
+        
+        # إنشاء جدول تفاصيل البيع
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sale_details (
+                sale_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                selling_price REAL NOT NULL,
+                purchasing_price REAL NOT NULL,
+                discount_applied REAL DEFAULT 0,
+                manual_discount REAL DEFAULT 0,
+                final_price REAL NOT NULL,
+                FOREIGN KEY (sale_id) REFERENCES sales (sale_id),
+                FOREIGN KEY (product_id) REFERENCES products (product_id)
+            )
+        ''')
+        
+        # إنشاء جدول المصروفات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expenses (
+                expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                description TEXT NOT NULL,
+                amount REAL NOT NULL,
+                date TEXT NOT NULL
+            )
+        ''')
 
-                # إنشاء جدول الفواتير (للاستعلام)
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS invoices (
-                        invoice_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        invoice_number TEXT UNIQUE NOT NULL,
-                        customer_name TEXT,
-                        issue_date TEXT NOT NULL,
-                        total_amount REAL NOT NULL,
-                        status TEXT DEFAULT 'active',
-                        FOREIGN KEY (sale_id) REFERENCES sales (sale_id)
-                    )
-                ''')
-                
-                conn.commit()
-                print("تم إنشاء قاعدة البيانات والجداول بنجاح")
-                
-                # إضافة بيانات تجريبية
-                self.insert_sample_data(cursor)
-                conn.commit()
-                
-            except sqlite3.Error as e:
-                print(f"خطأ في إنشاء الجداول: {e}")
-            finally:
-                self.disconnect()
+        # إنشاء جدول استعلامات المنتجات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_queries (
+                query_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                customer_id INTEGER,
+                product_name TEXT NOT NULL,
+                price REAL NOT NULL,
+                quantity INTEGER DEFAULT 1,
+                notes TEXT,
+                query_date TEXT NOT NULL,
+                executed BOOLEAN DEFAULT FALSE,
+                FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
+            )
+        ''')
+
+        # إنشاء جدول الفواتير (للاستعلام)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_id INTEGER NOT NULL,
+                invoice_number TEXT UNIQUE NOT NULL,
+                customer_name TEXT,
+                issue_date TEXT NOT NULL,
+                total_amount REAL NOT NULL,
+                status TEXT DEFAULT 'active',
+                FOREIGN KEY (sale_id) REFERENCES sales (sale_id)
+            )
+        ''')
+        
+        print("تم إنشاء قاعدة البيانات والجداول بنجاح")
+
+        # إضافة بيانات تجريبية
+        self.insert_sample_data(cursor)
+
+    def create_indexes(self, cursor):
+        """الترحيل 2: الفهارس الثانوية لتقارير التاريخ والفواتير"""
+        # فهرس تغطية للتقارير اليومية: التاريخ مع المبالغ المجمعة
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sales_date
+            ON sales (date, total_amount, profit, final_amount)
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_details_sale_id ON sale_details (sale_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_details_product_id ON sale_details (product_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_sale_id ON invoices (sale_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date, amount)")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_product_queries_executed_date
+            ON product_queries (executed, query_date)
+        ''')
+        cursor.execute("ANALYZE")
+
+    def create_daily_summary(self, cursor):
+        """الترحيل 3: جدول الملخص اليومي للمبيعات والمصروفات
+
+        يتم تحديثه تلقائياً بالمشغلات (triggers) مع كل إضافة أو تعديل أو حذف،
+        فتقرأ التقارير صفاً واحداً لكل يوم بدلاً من جميع العمليات.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                day TEXT PRIMARY KEY,
+                sales_count INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                profit REAL NOT NULL DEFAULT 0,
+                final_amount REAL NOT NULL DEFAULT 0,
+                expenses REAL NOT NULL DEFAULT 0
+            )
+        ''')
+
+        # مشغلات المبيعات
+        sales_add = '''
+            INSERT INTO daily_summary (day, sales_count, revenue, profit, final_amount)
+            VALUES (substr(NEW.date, 1, 10), 1, NEW.total_amount, NEW.profit, NEW.final_amount)
+            ON CONFLICT(day) DO UPDATE SET
+                sales_count = sales_count + 1,
+                revenue = revenue + excluded.revenue,
+                profit = profit + excluded.profit,
+                final_amount = final_amount + excluded.final_amount;
+        '''
+        sales_remove = '''
+            UPDATE daily_summary SET
+                sales_count = sales_count - 1,
+                revenue = revenue - OLD.total_amount,
+                profit = profit - OLD.profit,
+                final_amount = final_amount - OLD.final_amount
+            WHERE day = substr(OLD.date, 1, 10);
+        '''
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_summary_insert AFTER INSERT ON sales BEGIN {sales_add} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_sales_summary_delete AFTER DELETE ON sales BEGIN {sales_remove} END")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_sales_summary_update
+                           AFTER UPDATE OF date, total_amount, profit, final_amount ON sales
+                           BEGIN {sales_remove} {sales_add} END""")
+
+        # مشغلات المصروفات
+        expenses_add = '''
+            INSERT INTO daily_summary (day, expenses)
+            VALUES (substr(NEW.date, 1, 10), NEW.amount)
+            ON CONFLICT(day) DO UPDATE SET expenses = expenses + excluded.expenses;
+        '''
+        expenses_remove = '''
+            UPDATE daily_summary SET expenses = expenses - OLD.amount
+            WHERE day = substr(OLD.date, 1, 10);
+        '''
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_expenses_summary_insert AFTER INSERT ON expenses BEGIN {expenses_add} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_expenses_summary_delete AFTER DELETE ON expenses BEGIN {expenses_remove} END")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_expenses_summary_update
+                           AFTER UPDATE OF date, amount ON expenses
+                           BEGIN {expenses_remove} {expenses_add} END""")
+
+        # تعبئة الملخص من البيانات الموجودة
+        self.rebuild_daily_summary(cursor)
+
+    def rebuild_daily_summary(self, cursor):
+        """إعادة بناء الملخص اليومي بالكامل من جداول المبيعات والمصروفات"""
+        cursor.execute("DELETE FROM daily_summary")
+        cursor.execute('''
+            INSERT INTO daily_summary (day, sales_count, revenue, profit, final_amount, expenses)
+            SELECT day, SUM(sales_count), SUM(revenue), SUM(profit), SUM(final_amount), SUM(expenses)
+            FROM (
+                SELECT substr(date, 1, 10) AS day, COUNT(*) AS sales_count,
+                       SUM(total_amount) AS revenue, SUM(profit) AS profit,
+                       SUM(final_amount) AS final_amount, 0 AS expenses
+                FROM sales GROUP BY day
+                UNION ALL
+                SELECT substr(date, 1, 10) AS day, 0, 0, 0, 0, SUM(amount)
+                FROM expenses GROUP BY day
+            )
+            GROUP BY day
+        ''')
+
+    def create_product_search(self, cursor):
+        """الترحيل 4: فهرس البحث النصي الكامل (FTS5) للمنتجات
+
+        يخزن الاسم والوصف واسم الفئة بعد توحيد الحروف العربية، وتحافظ عليه
+        المشغلات متزامناً مع جدول المنتجات وأسماء الفئات.
+        """
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, description, category_name,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            # نسخة SQLite بدون FTS5: يرجع البحث إلى LIKE
+            print(f"تعذر إنشاء فهرس البحث: {e}")
+            return
+
+        category_name = normalize_sql(
+            "(SELECT category_name FROM categories WHERE category_id = NEW.category_id)")
+        product_add = f'''
+            INSERT INTO products_fts (rowid, name, description, category_name)
+            VALUES (NEW.product_id, {normalize_sql("NEW.name")},
+                    {normalize_sql("NEW.description")}, {category_name});
+        '''
+        product_remove = "DELETE FROM products_fts WHERE rowid = OLD.product_id;"
+
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products BEGIN {product_add} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products BEGIN {product_remove} END")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+                           AFTER UPDATE OF name, description, category_id ON products
+                           BEGIN {product_remove} {product_add} END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_categories_fts_update
+                           AFTER UPDATE OF category_name ON categories
+                           BEGIN
+                               UPDATE products_fts SET category_name = {normalize_sql("NEW.category_name")}
+                               WHERE rowid IN (SELECT product_id FROM products
+                                               WHERE category_id = NEW.category_id);
+                           END""")
+
+        # تعبئة الفهرس من المنتجات الموجودة
+        self.rebuild_product_search(cursor)
+
+    def rebuild_product_search(self, cursor):
+        """إعادة بناء فهرس البحث بالكامل من جدول المنتجات"""
+        cursor.execute("DELETE FROM products_fts")
+        cursor.execute(f'''
+            INSERT INTO products_fts (rowid, name, description, category_name)
+            SELECT p.product_id, {normalize_sql("p.name")},
+                   {normalize_sql("p.description")}, {normalize_sql("c.category_name")}
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.category_id
+        ''')
+
+    def create_barcodes(self, cursor):
+        """الترحيل 5: الباركود للمنتجات
+
+        عمود barcode في المنتجات للباركود الأساسي، وجدول product_barcodes
+        للباركودات الإضافية (عبوات بكميات مختلفة). المشغلات تمنع تكرار نفس
+        الباركود بين الجدولين.
+        """
+        cursor.execute("PRAGMA table_info(products)")
+        if 'barcode' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE products ADD COLUMN barcode TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode ON products(barcode)")
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_barcodes (
+                barcode TEXT PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                pack_quantity INTEGER NOT NULL DEFAULT 1,
+                FOREIGN KEY (product_id) REFERENCES products (product_id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_barcodes_product_id ON product_barcodes(product_id)")
+
+        duplicate = "SELECT RAISE(ABORT, 'UNIQUE constraint failed: barcode')"
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_product_barcodes_unique
+                           BEFORE INSERT ON product_barcodes
+                           WHEN EXISTS (SELECT 1 FROM products WHERE barcode = NEW.barcode)
+                           BEGIN {duplicate}; END""")
+        for event in ("INSERT", "UPDATE OF barcode"):
+            name = "insert" if event == "INSERT" else "update"
+            cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_barcode_{name}_unique
+                               BEFORE {event} ON products
+                               WHEN EXISTS (SELECT 1 FROM product_barcodes WHERE barcode = NEW.barcode)
+                               BEGIN {duplicate}; END""")
+
+    def create_sort_indexes(self, cursor):
+        """الترحيل 6: فهرس ترتيب المنتجات بالاسم للقوائم المقسمة إلى صفحات
+
+        الفهرس يحتوي المعرف ضمنياً، فيخدم ORDER BY name, product_id مع مفتاح
+        البحث دون فرز. المصروفات مرتبة بالتاريخ عبر idx_expenses_date.
+        """
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)")
+
+    def create_changelog(self, cursor):
+        """الترحيل 7: سجل تغييرات المبيعات والمنتجات والمصروفات والفواتير
+
+        كل كتابة تضيف صفاً بصورة الصف الجديدة في نفس المعاملة، فيمكن إعادة
+        تطبيق ما حدث بعد أي نسخة احتياطية حتى وقت محدد (انظر change_journal).
+        تُنقل الصفوف دورياً إلى أرشيف السجل في مجلد النسخ وتُحذف من هنا،
+        ويبقى رقم آخر تغيير في sqlite_sequence.
+        """
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS changelog (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                changed_at TEXT NOT NULL DEFAULT ({CHANGED_AT_SQL}),
+                table_name TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                row_data TEXT
+            )
+        ''')
+        create_changelog_triggers(cursor)
+
+    def create_data_versions(self, cursor):
+        """الترحيل 8: عدادات إصدار البيانات لكل نطاق
+
+        المشغلات ترفع عداد النطاق مع كل صف يتغير في نفس المعاملة، فتعرف أي
+        عملية أخرى تفتح نفس الملف أي نطاق تغير وتُبطل ذاكرتها المؤقتة له فقط.
+        تفاصيل المبيعات لا تحتاج مشغلاً: تُكتب دائماً مع صف البيع نفسه.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                scope TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        cursor.executemany("INSERT OR IGNORE INTO data_versions (scope) VALUES (?)",
+                           [(scope,) for scope in sorted(set(VERSIONED_TABLES.values()))])
+        for table, scope in VERSIONED_TABLES.items():
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                                   AFTER {event} ON {table}
+                                   BEGIN
+                                       UPDATE data_versions SET version = version + 1 WHERE scope = '{scope}';
+                                   END""")
+
+    def create_product_changes(self, cursor):
+        """الترحيل 9: سجل تعديلات المنتجات لتحديث فهرس البحث تدريجياً
+
+        صف واحد لكل منتج برقم آخر تعديل عليه (إضافة أو تعديل أو حذف)، فيجلب
+        الفهرس في الذاكرة المنتجات التي تغيرت بعد آخر رقم رآه فقط بدل الجدول
+        كاملاً. حجم الجدول لا يتجاوز عدد المنتجات.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_changes (
+                product_id INTEGER PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_changes_seq ON product_changes(seq)")
+
+        record = ("INSERT OR REPLACE INTO product_changes (product_id, seq) "
+                  "SELECT {id}, COALESCE((SELECT MAX(seq) FROM product_changes), 0) + 1")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_changes_insert
+                           AFTER INSERT ON products
+                           BEGIN {record.format(id='NEW.product_id')}; END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_changes_update
+                           AFTER UPDATE ON products
+                           BEGIN
+                               {record.format(id='OLD.product_id')} WHERE OLD.product_id != NEW.product_id;
+                               {record.format(id='NEW.product_id')};
+                           END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_changes_delete
+                           AFTER DELETE ON products
+                           BEGIN {record.format(id='OLD.product_id')}; END""")
+
+    def create_stock_version(self, cursor):
+        """الترحيل 10: نطاق المخزون منفصل عن نطاق المنتجات
+
+        البيع يغير كمية المخزون فقط، فيرفع عداد 'stock' ولا يرفع عداد
+        'products' الذي تمسح عنده ذاكرة الأسعار والباركود. أعمدة الشرط تُؤخذ من
+        الجدول وقت الإنشاء مثل مشغلات سجل التغييرات.
+        """
+        cursor.execute("INSERT OR IGNORE INTO data_versions (scope) VALUES ('stock')")
+        cursor.execute("PRAGMA table_info(products)")
+        other_columns = [row[1] for row in cursor.fetchall() if row[1] != 'stock_quantity']
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in other_columns)
+        bump = "UPDATE data_versions SET version = version + 1 WHERE scope = '{}';"
+
+        cursor.execute("DROP TRIGGER IF EXISTS trg_products_version_update")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_version_update
+                           AFTER UPDATE ON products WHEN {changed}
+                           BEGIN {bump.format('products')} END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_products_stock_version_update
+                           AFTER UPDATE OF stock_quantity ON products
+                           WHEN OLD.stock_quantity IS NOT NEW.stock_quantity
+                           BEGIN {bump.format('stock')} END""")
+
+    def create_data_version_days(self, cursor):
+        """الترحيل 11: الأيام المتأثرة بكل تغيير في المبيعات والمصروفات
+
+        صف لكل (نطاق، يوم) يحمل قيمة عداد النطاق عند آخر تغيير في ذلك اليوم،
+        فتعرف العمليات الأخرى من فرق العداد أي الأيام تغيرت. مشغلات هذين
+        النطاقين في الترحيل 8 تُستبدل بمشغلات ترفع العداد ثم تسجل اليوم بالترتيب.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version_days (
+                scope TEXT NOT NULL,
+                day TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (scope, day)
+            ) WITHOUT ROWID
+        ''')
+        bump = "UPDATE data_versions SET version = version + 1 WHERE scope = '{scope}';"
+        record = ("INSERT OR REPLACE INTO data_version_days (scope, day, version) "
+                  "SELECT scope, substr({row}.date, 1, 10), version FROM data_versions "
+                  "WHERE scope = '{scope}';")
+        rows = {"INSERT": ("NEW",), "UPDATE": ("OLD", "NEW"), "DELETE": ("OLD",)}
+        for table, scope in DAY_VERSIONED_TABLES.items():
+            for event, row_names in rows.items():
+                trigger = f"trg_{table}_version_{event.lower()}"
+                statements = bump.format(scope=scope) + "".join(
+                    record.format(row=row, scope=scope) for row in row_names)
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                cursor.execute(f"""CREATE TRIGGER {trigger}
+                                   AFTER {event} ON {table}
+                                   BEGIN {statements} END""")
+    
+    def journal_referenced_tables(self, cursor):
+        """الترحيل 12: تسجيل تغييرات الفئات والموردين والعملاء في changelog
+
+        المنتجات والمبيعات تشير إليها، فبدونها تنتج الاستعادة لوقت محدد صفوفاً
+        تشير إلى فئة أو عميل أُضيف بعد النسخة الأساسية. المشغلات الموجودة لا
+        تتغير (IF NOT EXISTS).
+        """
+        create_changelog_triggers(cursor)
     
     def insert_sample_data(self, cursor):
         """إضافة بيانات تجريبية"""
@@ -183,14 +890,14 @@ class Database:
         except sqlite3.Error as e:
             print(f"خطأ في إضافة البيانات التجريبية: {e}")
     
-    def backup_database(self, backup_path=None):
-        """إنشاء نسخة احتياطية من قاعدة البيانات"""
+    def backup_database(self, backup_path=None, progress=None):
+        """إنشاء نسخة احتياطية متسقة من قاعدة البيانات (بدون إيقاف البيع)"""
         if backup_path is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = f"backup_{timestamp}_{self.db_name}"
+            backup_path = f"backup_{timestamp}_{os.path.basename(self.db_name)}"
         
         try:
-            shutil.copy2(self.db_name, backup_path)
+            online_backup(self.db_name, backup_path, progress)
             print(f"تم إنشاء نسخة احتياطية: {backup_path}")
             return backup_path
         except Exception as e:
@@ -201,7 +908,11 @@ class Database:
         """استعادة قاعدة البيانات من نسخة احتياطية"""
         try:
             if os.path.exists(backup_path):
+                connection_manager.checkpoint(self.db_name, 'TRUNCATE')
+                connection_manager.reset(self.db_name)
                 shutil.copy2(backup_path, self.db_name)
+                # ترقية مخطط النسخة المستعادة إن كانت أقدم
+                self.create_database()
                 print(f"تم استعادة قاعدة البيانات من: {backup_path}")
                 return True
             else:
@@ -302,5 +1013,22 @@ class Database:
                 self.disconnect()
         return None
 
+# الترحيلات المرقمة: (الإصدار، الوصف، الدالة)
+# أي عمود أو فهرس جديد يُضاف كترحيل جديد في آخر القائمة ولا تُعدل الترحيلات السابقة
+MIGRATIONS = [
+    (1, "الجداول الأساسية", Database.create_base_tables),
+    (2, "فهارس التواريخ والفواتير", Database.create_indexes),
+    (3, "الملخص اليومي للمبيعات والمصروفات", Database.create_daily_summary),
+    (4, "فهرس البحث النصي للمنتجات", Database.create_product_search),
+    (5, "الباركود للمنتجات", Database.create_barcodes),
+    (6, "فهرس ترتيب المنتجات بالاسم", Database.create_sort_indexes),
+    (7, "سجل التغييرات للاستعادة لوقت محدد", Database.create_changelog),
+    (8, "عدادات إصدار البيانات بين العمليات", Database.create_data_versions),
+    (9, "سجل تعديلات المنتجات لفهرس البحث", Database.create_product_changes),
+    (10, "نطاق المخزون منفصل عن المنتجات", Database.create_stock_version),
+    (11, "الأيام المتأثرة بتغييرات المبيعات والمصروفات", Database.create_data_version_days),
+    (12, "سجل تغييرات الجداول المشار إليها", Database.journal_referenced_tables),
+]
+
 # إنشاء مثيل من قاعدة البيانات
 db = Database()
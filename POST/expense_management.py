@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from models import Expense
 from utils import ValidationUtils
+from treeview_helpers import PagedTreeview
+from background import worker
 from datetime import datetime
 from tkcalendar import DateEntry
 
@@ -15,6 +17,8 @@ class ExpenseManagementWindow:
         
         # إنشاء النموذج
         self.expense_model = Expense()
+        # فترة التصفية الحالية (None = جميع المصروفات)
+        self.expense_filter = (None, None)
         
         # متغيرات النموذج
         self.setup_variables()
@@ -114,6 +118,9 @@ class ExpenseManagementWindow:
         # إنشاء Treeview
         columns = ('ID', 'الوصف', 'المبلغ', 'التاريخ')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
+        # عرض افتراضي: صفحات تُجلب من قاعدة البيانات حسب موضع التمرير
+        self.tree_pages = PagedTreeview(self.tree, self.fetch_expenses_page, self.expense_row,
+                                        'expense_id', sort='date', descending=True, worker=worker)
         
         # تعريف العناوين وعرض الأعمدة
         self.tree.heading('ID', text='المعرف')
@@ -128,7 +135,9 @@ class ExpenseManagementWindow:
         
         # شريط التمرير
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # النقر على عنوان العمود يرتب القائمة في قاعدة البيانات
+        self.tree_pages.attach(scrollbar, {'ID': 'expense_id', 'الوصف': 'description',
+                                           'المبلغ': 'amount', 'التاريخ': 'date'})
         
         # تخطيط العناصر
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -141,31 +150,47 @@ class ExpenseManagementWindow:
         self.status_bar = ttk.Label(self.window, text="جاهز", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
     
-    def refresh_expenses_list(self):
+    def refresh_expenses_list(self, message=None):
         """تحديث قائمة المصروفات"""
-        # مسح القائمة الحالية
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # جلب المصروفات
-        expenses = self.expense_model.get_all_expenses()
-        
-        total_amount = 0
-        for expense in expenses:
-            values = (
-                expense['expense_id'],
-                expense['description'],
-                f"{expense['amount']:.2f}",
-                expense['date'][:10] if len(expense['date']) > 10 else expense['date']  # عرض التاريخ فقط
-            )
-            self.tree.insert('', tk.END, values=values)
-            total_amount += expense['amount']
-        
-        # تحديث الإجمالي
-        self.var_total_expenses.set(f"{total_amount:.2f}")
+        # تحديث شريط الحالة (رسالة العملية إن وجدت وإلا العدد والإجمالي)
+        self.show_expenses(None, None, lambda totals: message or
+                           f"تم تحميل {totals['count']} مصروف - الإجمالي: {totals['total']:.2f}")
+    
+    def show_expenses(self, start_date, end_date, status):
+        """عرض المصروفات (صفحات حسب التمرير) ثم العدد والإجمالي من SQL في الخلفية
+
+        status(totals) يرجع نص شريط الحالة بعد حساب الإجمالي.
+        """
+        if (start_date, end_date) != self.expense_filter:
+            self.expense_filter = (start_date, end_date)
+            self.tree_pages.reset()
+        else:
+            self.tree_pages.refresh()
         
-        # تحديث شريط الحالة
-        self.status_bar.config(text=f"تم تحميل {len(expenses)} مصروف - الإجمالي: {total_amount:.2f}")
+        def on_success(totals):
+            # تحديث الإجمالي
+            self.var_total_expenses.set(f"{totals['total']:.2f}")
+            self.status_bar.config(text=status(totals))
+        
+        # تصفية جديدة تلغي حساب إجمالي التصفية السابقة
+        worker.submit(self.window, self.expense_model.get_expenses_totals, start_date, end_date,
+                      on_success=on_success, key='totals')
+    
+    def fetch_expenses_page(self, seek, forward, limit, sort, descending, inclusive):
+        """جلب صفحة من المصروفات حسب فترة التصفية الحالية"""
+        start_date, end_date = self.expense_filter
+        return self.expense_model.get_expenses_page(seek, forward, limit, sort, descending,
+                                                    inclusive, start_date, end_date)
+    
+    def expense_row(self, expense):
+        """صف المصروف في الجدول: (المفتاح، القيم)"""
+        values = (
+            expense['expense_id'],
+            expense['description'],
+            f"{expense['amount']:.2f}",
+            expense['date'][:10] if len(expense['date']) > 10 else expense['date']  # عرض التاريخ فقط
+        )
+        return expense['expense_id'], values
     
     def show_today_expenses(self):
         """عرض مصروفات اليوم"""
@@ -192,30 +217,10 @@ class ExpenseManagementWindow:
     
     def show_expenses_by_date(self, start_date, end_date):
         """عرض المصروفات في فترة زمنية محددة"""
-        # مسح القائمة الحالية
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # جلب المصروفات في الفترة المحددة
-        expenses = self.expense_model.get_expenses_by_date_range(start_date, end_date)
-        
-        total_amount = 0
-        for expense in expenses:
-            values = (
-                expense['expense_id'],
-                expense['description'],
-                f"{expense['amount']:.2f}",
-                expense['date'][:10] if len(expense['date']) > 10 else expense['date']
-            )
-            self.tree.insert('', tk.END, values=values)
-            total_amount += expense['amount']
-        
-        # تحديث الإجمالي
-        self.var_total_expenses.set(f"{total_amount:.2f}")
-        
         # تحديث شريط الحالة
         period_text = f"من {start_date} إلى {end_date}" if start_date != end_date else start_date
-        self.status_bar.config(text=f"المصروفات {period_text}: {len(expenses)} مصروف - الإجمالي: {total_amount:.2f}")
+        self.show_expenses(start_date, end_date, lambda totals:
+                           f"المصروفات {period_text}: {totals['count']} مصروف - الإجمالي: {totals['total']:.2f}")
     
     def on_select(self, event):
         """عند تحديد مصروف من القائمة"""
@@ -247,30 +252,34 @@ class ExpenseManagementWindow:
         
         return True
 
+    def save_in_background(self, func, success_message, failure_message, error_message, **values):
+        """تنفيذ الحفظ في الخلفية ثم تحديث القائمة عند النجاح"""
+        def on_success(result):
+            if result:
+                messagebox.showinfo("نجح", success_message)
+                self.clear_form()
+                self.refresh_expenses_list(message=success_message)
+            else:
+                messagebox.showerror("خطأ", failure_message)
+                self.status_bar.config(text=failure_message)
+
+        def on_error(e):
+            messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            self.status_bar.config(text=error_message)
+
+        worker.submit(self.window, func, on_success=on_success, on_error=on_error, **values)
+
     def add_expense(self):
         """إضافة مصروف جديد"""
         if not self.validate_form():
             return
 
-        try:
-            expense_id = self.expense_model.add_expense(
-                description=self.var_description.get().strip(),
-                amount=float(self.var_amount.get()),
-                date=self.var_date.get()
-            )
-
-            if expense_id:
-                messagebox.showinfo("نجح", "تم إضافة المصروف بنجاح")
-                self.clear_form()
-                self.refresh_expenses_list()
-                self.status_bar.config(text="تم إضافة مصروف جديد بنجاح")
-            else:
-                messagebox.showerror("خطأ", "فشل في إضافة المصروف")
-                self.status_bar.config(text="فشل في إضافة المصروف")
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
-            self.status_bar.config(text="حدث خطأ أثناء إضافة المصروف")
+        self.save_in_background(self.expense_model.add_expense,
+                                "تم إضافة المصروف بنجاح", "فشل في إضافة المصروف",
+                                "حدث خطأ أثناء إضافة المصروف",
+                                description=self.var_description.get().strip(),
+                                amount=float(self.var_amount.get()),
+                                date=self.var_date.get())
 
     def update_expense(self):
         """تحديث مصروف موجود"""
@@ -281,26 +290,13 @@ class ExpenseManagementWindow:
         if not self.validate_form():
             return
 
-        try:
-            success = self.expense_model.update_expense(
-                expense_id=self.selected_expense_id,
-                description=self.var_description.get().strip(),
-                amount=float(self.var_amount.get()),
-                date=self.var_date.get()
-            )
-
-            if success:
-                messagebox.showinfo("نجح", "تم تحديث المصروف بنجاح")
-                self.clear_form()
-                self.refresh_expenses_list()
-                self.status_bar.config(text="تم تحديث المصروف بنجاح")
-            else:
-                messagebox.showerror("خطأ", "فشل في تحديث المصروف")
-                self.status_bar.config(text="فشل في تحديث المصروف")
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
-            self.status_bar.config(text="حدث خطأ أثناء تحديث المصروف")
+        self.save_in_background(self.expense_model.update_expense,
+                                "تم تحديث المصروف بنجاح", "فشل في تحديث المصروف",
+                                "حدث خطأ أثناء تحديث المصروف",
+                                expense_id=self.selected_expense_id,
+                                description=self.var_description.get().strip(),
+                                amount=float(self.var_amount.get()),
+                                date=self.var_date.get())
 
     def delete_expense(self):
         """حذف مصروف"""
@@ -310,21 +306,10 @@ class ExpenseManagementWindow:
 
         result = messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا المصروف؟")
         if result:
-            try:
-                success = self.expense_model.delete_expense(self.selected_expense_id)
-
-                if success:
-                    messagebox.showinfo("نجح", "تم حذف المصروف بنجاح")
-                    self.clear_form()
-                    self.refresh_expenses_list()
-                    self.status_bar.config(text="تم حذف المصروف بنجاح")
-                else:
-                    messagebox.showerror("خطأ", "فشل في حذف المصروف")
-                    self.status_bar.config(text="فشل في حذف المصروف")
-
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
-                self.status_bar.config(text="حدث خطأ أثناء حذف المصروف")
+            self.save_in_background(self.expense_model.delete_expense,
+                                    "تم حذف المصروف بنجاح", "فشل في حذف المصروف",
+                                    "حدث خطأ أثناء حذف المصروف",
+                                    expense_id=self.selected_expense_id)
 
     def clear_form(self):
         """مسح النموذج"""
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from models import Invoice
 from utils import ValidationUtils
+from background import worker
 import webbrowser
 import tempfile
 import os
@@ -14,8 +15,8 @@ class InvoiceInquiryWindow:
         self.window.geometry("900x700")
         self.window.configure(bg='#f0f0f0')
         
-        # إنشاء النموذج
-        self.invoice_model = Invoice()
+        # إنشاء النموذج (قراءة فقط حتى لا يعطل الاستعلام نقطة البيع)
+        self.invoice_model = Invoice(read_only=True)
         
         # متغيرات النموذج
         self.setup_variables()
@@ -179,13 +180,9 @@ class InvoiceInquiryWindow:
             messagebox.showwarning("تحذير", "يرجى إدخال رقم الفاتورة")
             return
         
-        try:
-            self.status_bar.config(text="جاري البحث عن الفاتورة...")
-            self.window.update()
-            
-            # البحث عن الفاتورة
-            invoice_data = self.invoice_model.get_invoice_by_number(invoice_number)
-            
+        self.status_bar.config(text="جاري البحث عن الفاتورة...")
+        
+        def on_success(invoice_data):
             if invoice_data:
                 self.current_invoice = invoice_data
                 self.display_invoice_details(invoice_data)
@@ -201,9 +198,13 @@ class InvoiceInquiryWindow:
                 self.status_bar.config(text="لم يتم العثور على الفاتورة")
                 messagebox.showinfo("نتيجة البحث", f"لم يتم العثور على فاتورة برقم: {invoice_number}")
         
-        except Exception as e:
+        def on_error(e):
             messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(e)}")
             self.status_bar.config(text="حدث خطأ أثناء البحث")
+        
+        # البحث عن الفاتورة (بحث جديد يلغي السابق إن لم يكتمل)
+        worker.submit(self.window, self.invoice_model.get_invoice_by_number, invoice_number,
+                      on_success=on_success, on_error=on_error, key='search')
     
     def display_invoice_details(self, invoice_data):
         """عرض تفاصيل الفاتورة"""
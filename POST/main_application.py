@@ -1,19 +1,38 @@
+import time
+
+# بداية قياس زمن التشغيل (قبل أي استيراد)
+STARTUP_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
+import importlib
 import sys
 import os
 from datetime import datetime
 
-# استيراد الوحدات
-from product_management import ProductManagementWindow
-from supplier_management import SupplierManagementWindow
-from sales_management import SalesManagementWindow
-from expense_management import ExpenseManagementWindow
-from reports import ReportsWindow
-from backup_system import BackupSystemWindow
-from invoice_inquiry import InvoiceInquiryWindow
-from product_inquiry import ProductInquiryWindow
-from database import Database
+# استيراد الوحدات (وحدات النوافذ تُحمل عند أول فتح لها فقط)
+from database import Database, connection_manager
+from background import worker
+from models import data_version
+
+IMPORTS_FINISHED = time.perf_counter()
+
+# الوحدة التي تحتوي كل نافذة
+WINDOW_MODULES = {
+    'ProductManagementWindow': 'product_management',
+    'SupplierManagementWindow': 'supplier_management',
+    'SalesManagementWindow': 'sales_management',
+    'ExpenseManagementWindow': 'expense_management',
+    'ReportsWindow': 'reports',
+    'BackupSystemWindow': 'backup_system',
+    'InvoiceInquiryWindow': 'invoice_inquiry',
+    'ProductInquiryWindow': 'product_inquiry',
+}
+
+def load_window(class_name):
+    """استيراد فئة النافذة عند أول فتح لها (الاستيراد التالي من ذاكرة Python)"""
+    module = importlib.import_module(WINDOW_MODULES[class_name])
+    return getattr(module, class_name)
 
 class MainApplication:
     def __init__(self):
@@ -30,6 +49,8 @@ class MainApplication:
         
         # إنشاء قاعدة البيانات
         self.db = Database()
+        # إبطال الذاكرة المؤقتة عند الكتابة من نقطة بيع أخرى على نفس الملف
+        data_version.watch(self.db.db_name)
         
         # متغيرات التطبيق
         self.current_user = "المدير"  # يمكن تطويرها لاحقاً لنظام المستخدمين
@@ -42,6 +63,12 @@ class MainApplication:
         
         # بدء النسخ الاحتياطي التلقائي
         self.schedule_auto_backup()
+        
+        # التثبيت الدوري لملف WAL
+        self.schedule_checkpoint()
+        
+        # الأرشفة الدورية لسجل التغييرات
+        self.schedule_journal_archive()
     
     def create_main_interface(self):
         """إنشاء الواجهة الرئيسية"""
@@ -235,22 +262,61 @@ class MainApplication:
         self.root.after(24 * 60 * 60 * 1000, self.auto_backup)
     
     def auto_backup(self):
-        """النسخ الاحتياطي التلقائي"""
-        try:
-            backup_path = self.db.backup_database()
+        """النسخ الاحتياطي التلقائي في الخلفية (البيع مستمر أثناء النسخ)
+
+        النسخة تزايدية في مجلد النسخ وتُحذف بعدها النسخ التلقائية القديمة
+        حسب سياسة الاحتفاظ.
+        """
+        # utils تُحمل عند أول نسخة تلقائية فقط (لا تبطئ التشغيل)
+        from utils import BackupManager
+        
+        def on_success(backup_path):
             if backup_path:
                 self.status_label.config(text="تم إنشاء نسخة احتياطية تلقائية")
-        except Exception as e:
+        
+        def on_progress(copied, total):
+            self.status_label.config(text=f"جاري النسخ الاحتياطي التلقائي... {copied * 100 // max(total, 1)}%")
+        
+        def on_error(e):
             print(f"خطأ في النسخ الاحتياطي التلقائي: {e}")
         
+        worker.submit(self.root, BackupManager(self.db.db_name).auto_backup,
+                      on_success=on_success, on_error=on_error,
+                      on_progress=on_progress, busy=False, key='auto_backup')
+        
         # جدولة النسخة التالية
         self.schedule_auto_backup()
     
+    def schedule_checkpoint(self):
+        """جدولة التثبيت الدوري لملف WAL (كل 5 دقائق)"""
+        self.root.after(5 * 60 * 1000, self.checkpoint_database)
+    
+    def checkpoint_database(self):
+        """نقل صفحات WAL إلى ملف قاعدة البيانات حتى لا يكبر بلا حدود
+
+        التثبيت ينتظر القراء والكاتبين حتى مهلة الانشغال، فيعمل في الخلفية.
+        """
+        worker.submit(self.root, connection_manager.maybe_checkpoint, self.db.db_name,
+                      busy=False, key='checkpoint')
+        self.schedule_checkpoint()
+    
+    def schedule_journal_archive(self):
+        """جدولة أرشفة سجل التغييرات (كل دقيقة، فلا يُفقد عند تلف القرص أكثر من دقيقة)"""
+        self.root.after(60 * 1000, self.archive_journal)
+    
+    def archive_journal(self):
+        """نقل التغييرات الجديدة إلى أرشيف السجل في الخلفية"""
+        # utils تُحمل عند أول أرشفة فقط (لا تبطئ التشغيل)
+        from utils import BackupManager
+        worker.submit(self.root, BackupManager(self.db.db_name).archive_journal,
+                      busy=False, key='journal')
+        self.schedule_journal_archive()
+    
     # وظائف فتح النوافذ
     def open_product_management(self):
         """فتح نافذة إدارة المنتجات"""
         try:
-            ProductManagementWindow(self.root)
+            load_window('ProductManagementWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة إدارة المنتجات")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة إدارة المنتجات: {str(e)}")
@@ -258,7 +324,7 @@ class MainApplication:
     def open_supplier_management(self):
         """فتح نافذة إدارة الموردين"""
         try:
-            SupplierManagementWindow(self.root)
+            load_window('SupplierManagementWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة إدارة الموردين")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة إدارة الموردين: {str(e)}")
@@ -266,7 +332,7 @@ class MainApplication:
     def open_sales_management(self):
         """فتح نافذة المبيعات"""
         try:
-            SalesManagementWindow(self.root)
+            load_window('SalesManagementWindow')(self.root)
             self.status_label.config(text="تم فتح نقطة البيع")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نقطة البيع: {str(e)}")
@@ -274,7 +340,7 @@ class MainApplication:
     def open_expense_management(self):
         """فتح نافذة إدارة المصروفات"""
         try:
-            ExpenseManagementWindow(self.root)
+            load_window('ExpenseManagementWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة إدارة المصروفات")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة إدارة المصروفات: {str(e)}")
@@ -282,7 +348,7 @@ class MainApplication:
     def open_reports(self):
         """فتح نافذة التقارير"""
         try:
-            ReportsWindow(self.root)
+            load_window('ReportsWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة التقارير")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة التقارير: {str(e)}")
@@ -290,7 +356,7 @@ class MainApplication:
     def open_backup_system(self):
         """فتح نظام النسخ الاحتياطي"""
         try:
-            BackupSystemWindow(self.root)
+            load_window('BackupSystemWindow')(self.root)
             self.status_label.config(text="تم فتح نظام النسخ الاحتياطي")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نظام النسخ الاحتياطي: {str(e)}")
@@ -298,7 +364,7 @@ class MainApplication:
     def open_invoice_inquiry(self):
         """فتح نافذة استعلام الفواتير"""
         try:
-            InvoiceInquiryWindow(self.root)
+            load_window('InvoiceInquiryWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة استعلام الفواتير")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة استعلام الفواتير: {str(e)}")
@@ -306,7 +372,7 @@ class MainApplication:
     def open_product_inquiry(self):
         """فتح نافذة استعلام المنتجات"""
         try:
-            ProductInquiryWindow(self.root)
+            load_window('ProductInquiryWindow')(self.root)
             self.status_label.config(text="تم فتح نافذة استعلام المنتجات")
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في فتح نافذة استعلام المنتجات: {str(e)}")
@@ -338,12 +404,41 @@ class MainApplication:
         """إغلاق التطبيق"""
         result = messagebox.askyesno("تأكيد الخروج", "هل أنت متأكد من إغلاق البرنامج؟")
         if result:
+            # انتظار الخيوط العاملة قبل إغلاق اتصالاتها؛ إن تجاوزت المهلة تُغلق
+            # الاتصالات عند خروج العملية (بعد انتهاء الخيوط)
+            if worker.shutdown():
+                connection_manager.checkpoint(self.db.db_name, 'TRUNCATE')
+                connection_manager.close_all()
             self.root.quit()
     
     def run(self):
         """تشغيل التطبيق"""
         self.root.mainloop()
+    
+    def measure_startup(self, init_finished):
+        """قياس زمن أول رسم للنافذة الرئيسية ثم طباعة التوقيتات والخروج
+
+        أول رسم = ظهور النافذة وانتهاء معالجة أحداث الرسم المعلقة.
+        """
+        def on_painted():
+            painted = time.perf_counter()
+            print(f"STARTUP imports_ms={(IMPORTS_FINISHED - STARTUP_STARTED) * 1000:.1f} "
+                  f"init_ms={(init_finished - IMPORTS_FINISHED) * 1000:.1f} "
+                  f"first_paint_ms={(painted - STARTUP_STARTED) * 1000:.1f}", flush=True)
+            if worker.shutdown():
+                connection_manager.close_all()
+            self.root.quit()
+        
+        def on_map(event):
+            if event.widget is self.root:
+                self.root.unbind('<Map>')
+                self.root.after_idle(on_painted)
+        
+        self.root.bind('<Map>', on_map)
 
 if __name__ == "__main__":
     app = MainApplication()
+    # وضع قياس زمن التشغيل (يستخدمه benchmark_startup.py)
+    if '--startup-timing' in sys.argv:
+        app.measure_startup(time.perf_counter())
     app.run()
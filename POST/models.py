@@ -1,15 +1,210 @@
-from database import Database
-from datetime import datetime
+from database import (Database, connection_manager, is_busy_error, BUSY_RETRIES, BUSY_RETRY_DELAY,
+                      DAY_VERSIONED_TABLES)
+from arabic_text import tokenize
+from datetime import datetime, timedelta
+from collections import deque
+import threading
 import sqlite3
+import time
+import os
+from urllib.parse import quote
+
+# نطاق خاص يُبطل جميع النتائج (مثل استعادة نسخة احتياطية)
+ALL_SCOPES = '*'
+
+class DataVersion:
+    """عداد إصدارات البيانات لإبطال النتائج المخزنة مؤقتاً
+
+    كل عملية كتابة ترفع العداد وتسجل نطاقها (مبيعات/مصروفات/منتجات) واليوم
+    المتأثر إن كان معروفاً، فلا تُبطل مبيعات اليوم تقارير الفترات المغلقة.
+    """
+
+    def __init__(self, history=1000):
+        self.version = 0
+        self._changes = deque(maxlen=history)
+        self._lock = threading.Lock()
+        # متابعة كتابات العمليات الأخرى على ملف قاعدة البيانات (انظر watch)
+        self._watch_lock = threading.Lock()
+        self._watch_path = None
+        self._watch_conn = None
+        self._watch_file = None
+        self._watch_data_version = None
+        self._watch_counts = {}
+
+    def bump(self, scope, day=None):
+        """تسجيل تغيير في نطاق معين (day=None يعني جميع الأيام)"""
+        with self._lock:
+            self.version += 1
+            self._changes.append((self.version, scope, day[:10] if day else None))
+            return self.version
+
+    def watch(self, db_name):
+        """متابعة الكتابات من العمليات الأخرى على ملف قاعدة البيانات
+
+        العداد نفسه في ذاكرة العملية، فنقطة بيع ثانية أو أداة سطر أوامر تكتب
+        في نفس الملف لا ترفعه. بعد المتابعة يفحص sync() قيمة PRAGMA
+        data_version باتصال خاص (تتغير عند أي كتابة من اتصال آخر)، ثم عدادات
+        النطاقات في جدول data_versions لمعرفة ما تغير.
+        """
+        with self._watch_lock:
+            self._close_watch()
+            self._watch_path = os.path.abspath(db_name)
+            self._open_watch()
+
+    def suspend_watch(self, db_name):
+        """إغلاق اتصال المتابعة قبل استبدال الملف المتابع (استعادة نسخة احتياطية)"""
+        with self._watch_lock:
+            if self._watch_path == os.path.abspath(db_name):
+                self._close_watch()
+
+    def resume_watch(self, db_name):
+        """فتح اتصال المتابعة على الملف الجديد بعد استبداله"""
+        with self._watch_lock:
+            if self._watch_path == os.path.abspath(db_name) and self._watch_conn is None:
+                self._open_watch()
+
+    def _open_watch(self):
+        """فتح اتصال المتابعة وتسجيل الحالة الحالية للملف"""
+        uri = f"file:{quote(self._watch_path)}?mode=ro"
+        try:
+            self._watch_file = self._file_identity(self._watch_path)
+            self._watch_conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._watch_data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+            self._watch_counts = self._read_counts()
+        except (OSError, sqlite3.Error) as e:
+            print(f"خطأ في متابعة تغييرات قاعدة البيانات: {e}")
+            self._close_watch()
+
+    def _close_watch(self):
+        """إغلاق اتصال المتابعة"""
+        if self._watch_conn is not None:
+            self._watch_conn.close()
+        self._watch_conn = None
+
+    @staticmethod
+    def _file_identity(path):
+        """هوية الملف على القرص (تتغير عند استبداله باستعادة نسخة)"""
+        stat = os.stat(path)
+        return stat.st_dev, stat.st_ino
+
+    def _read_counts(self):
+        """عدادات النطاقات في قاعدة البيانات"""
+        try:
+            return dict(self._watch_conn.execute("SELECT scope, version FROM data_versions").fetchall())
+        except sqlite3.OperationalError:
+            # قاعدة بيانات قبل الترحيل 8
+            return {}
+
+    def _changed_days(self, scope, seen):
+        """الأيام التي تغيرت في نطاق بعد قيمة عداده المعطاة (None إن لم تُعرف)"""
+        if seen is None:
+            return None
+        try:
+            days = [row[0] for row in self._watch_conn.execute(
+                "SELECT day FROM data_version_days WHERE scope = ? AND version > ?", (scope, seen))]
+        except sqlite3.OperationalError:
+            # قاعدة بيانات قبل الترحيل 11
+            return None
+        return days or None
+
+    def sync(self):
+        """رفع إصدار النطاقات التي كتبت فيها عمليات أخرى منذ آخر فحص
+
+        الفحص دون تغييرات استعلام PRAGMA واحد. كتابات هذه العملية تظهر هنا
+        أيضاً فتُبطل نطاقها مرة ثانية، لكن المبيعات والمصروفات تُبطل بأيامها
+        فقط (الترحيل 11) فتبقى تقارير الفترات المغلقة صالحة.
+        """
+        if self._watch_conn is None:
+            return
+        changed = []
+        with self._watch_lock:
+            if self._watch_conn is None:
+                return
+            try:
+                if self._file_identity(self._watch_path) != self._watch_file:
+                    # استُبدل الملف (استعادة نسخة احتياطية): كل البيانات تغيرت
+                    self._close_watch()
+                    self._open_watch()
+                    changed = [(ALL_SCOPES, None)]
+                else:
+                    data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+                    if data_version != self._watch_data_version:
+                        self._watch_data_version = data_version
+                        counts = self._read_counts()
+                        for scope, count in counts.items():
+                            seen = self._watch_counts.get(scope)
+                            if count == seen:
+                                continue
+                            days = (self._changed_days(scope, seen)
+                                    if scope in DAY_VERSIONED_TABLES.values() else None)
+                            changed.extend((scope, day) for day in days or [None])
+                        self._watch_counts = counts
+            except (OSError, sqlite3.Error) as e:
+                print(f"خطأ في فحص تغييرات قاعدة البيانات: {e}")
+                return
+        for scope, day in changed:
+            self.bump(scope, day)
+
+    def changed_since(self, version, scopes, start_day=None, end_day=None):
+        """هل حدث تغيير يمس النطاقات والفترة المحددة بعد الإصدار المعطى؟"""
+        self.sync()
+        with self._lock:
+            if version == self.version:
+                return False
+            if not self._changes or self._changes[0][0] > version + 1:
+                # السجل لا يغطي الفترة منذ هذا الإصدار
+                return True
+            for change_version, scope, day in reversed(self._changes):
+                if change_version <= version:
+                    break
+                if scope != ALL_SCOPES and scope not in scopes:
+                    continue
+                if day is None or start_day is None or start_day <= day <= end_day:
+                    return True
+            return False
+
+# عداد الإصدارات المشترك في العملية
+data_version = DataVersion()
+# استعادة نسخة احتياطية تغير جميع البيانات
+connection_manager.add_reset_hook(lambda db_name: data_version.bump(ALL_SCOPES))
+connection_manager.add_replace_hooks(data_version.suspend_watch, data_version.resume_watch)
+
+def date_range_bounds(start_date, end_date=None):
+    """تحويل فترة تواريخ شاملة إلى حدود نصف مفتوحة [البداية، اليوم التالي للنهاية)
+
+    التواريخ مخزنة بصيغة ISO لذلك تكفي المقارنة النصية، وهذا يسمح
+    باستخدام الفهارس بدلاً من DATE(date) التي تجبر على مسح الجدول كاملاً.
+    """
+    if end_date is None:
+        end_date = start_date
+    next_day = datetime.strptime(end_date[:10], '%Y-%m-%d') + timedelta(days=1)
+    return start_date[:10], next_day.strftime('%Y-%m-%d')
+
+class InUseError(Exception):
+    """حذف صف تشير إليه صفوف أخرى (المفاتيح الأجنبية مفعلة في كل اتصال)"""
 
 class BaseModel:
     """الفئة الأساسية لجميع النماذج"""
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db_name="store_management.db", read_only=False):
+        self.db = Database(db_name)
+        # النماذج للقراءة فقط (التقارير والاستعلامات) تستخدم قناة قراءة منفصلة
+        self.read_only = read_only
+    
+    # نطاق البيانات الذي ترفع كتابات النموذج إصداره (None = لا يؤثر على التقارير)
+    data_scope = None
+    
+    def bump_version(self, day=None):
+        """رفع إصدار البيانات بعد كتابة ناجحة"""
+        if self.data_scope:
+            data_version.bump(self.data_scope, day)
+    
+    def get_connection(self):
+        """جلب الاتصال المشترك من مدير الاتصالات"""
+        return connection_manager.get_connection(self.db.db_name, self.read_only)
     
     def execute_query(self, query, params=None):
         """تنفيذ استعلام قاعدة البيانات"""
-        conn = self.db.connect()
+        conn = self.get_connection()
         if conn:
             try:
                 cursor = conn.cursor()
@@ -17,15 +212,36 @@ class BaseModel:
                     cursor.execute(query, params)
                 else:
                     cursor.execute(query)
-                conn.commit()
+                if not self.read_only:
+                    conn.commit()
                 return cursor
             except sqlite3.Error as e:
                 print(f"خطأ في تنفيذ الاستعلام: {e}")
+                if not self.read_only:
+                    conn.rollback()
                 return None
-            finally:
-                self.db.disconnect()
         return None
     
+    def execute_delete(self, query, params, in_use_message):
+        """تنفيذ حذف قد يرفضه مفتاح أجنبي
+
+        ترفع InUseError برسالة واضحة إن كان الصف مستخدماً (مثل منتج له
+        مبيعات)، وترجع False لأي خطأ آخر كما في execute_query.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise InUseError(in_use_message)
+        except sqlite3.Error as e:
+            print(f"خطأ في تنفيذ الاستعلام: {e}")
+            conn.rollback()
+            return False
+        self.bump_version()
+        return cursor.rowcount > 0
+    
     def fetch_all(self, query, params=None):
         """جلب جميع النتائج"""
         cursor = self.execute_query(query, params)
@@ -39,14 +255,44 @@ class BaseModel:
         if cursor:
             return cursor.fetchone()
         return None
+    
+    def fetch_keyset_page(self, select, source, sort_expr, id_column, seek=None, forward=True,
+                          limit=100, descending=False, inclusive=False, where=None, params=()):
+        """جلب صفحة بالترقيم بمفتاح البحث (keyset) بدلاً من OFFSET
+
+        seek هو (قيمة الترتيب، المعرف) لآخر صف معروض: forward=True يجلب
+        الصفوف التي تليه و forward=False التي تسبقه، وفي الحالتين ترجع
+        الصفوف بترتيب العرض ومعها عمود sort_key لاستخدامه كمفتاح للصفحة التالية.
+        الاستعلام يقفز مباشرة إلى المفتاح عبر الفهرس مهما كان عمق الصفحة.
+        """
+        ascending = (not descending) if forward else descending
+        direction = "ASC" if ascending else "DESC"
+        conditions = [where] if where else []
+        params = tuple(params)
+        if seek is not None:
+            operator = (">" if ascending else "<") + ("=" if inclusive else "")
+            conditions.append(f"({sort_expr}, {id_column}) {operator} (?, ?)")
+            params += tuple(seek)
+
+        query = f"SELECT {select}, {sort_expr} AS sort_key FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+        query += f" ORDER BY {sort_expr} {direction}, {id_column} {direction} LIMIT ?"
+        rows = self.fetch_all(query, params + (limit,))
+        if not forward:
+            rows.reverse()
+        return rows
 
 class Category(BaseModel):
     """نموذج الفئات"""
+    data_scope = 'categories'
     
     def add_category(self, name, description=""):
         """إضافة فئة جديدة"""
         query = "INSERT INTO categories (category_name, description) VALUES (?, ?)"
         cursor = self.execute_query(query, (name, description))
+        if cursor:
+            self.bump_version()
         return cursor.lastrowid if cursor else None
     
     def get_all_categories(self):
@@ -63,21 +309,25 @@ class Category(BaseModel):
         """تحديث فئة"""
         query = "UPDATE categories SET category_name = ?, description = ? WHERE category_id = ?"
         cursor = self.execute_query(query, (name, description, category_id))
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
     
     def delete_category(self, category_id):
-        """حذف فئة"""
+        """حذف فئة (ترفع InUseError إن كان مستخدماً)"""
         query = "DELETE FROM categories WHERE category_id = ?"
-        cursor = self.execute_query(query, (category_id,))
-        return cursor.rowcount > 0 if cursor else False
+        return self.execute_delete(query, (category_id,), "لا يمكن حذف الفئة لأن بها منتجات")
 
 class Supplier(BaseModel):
     """نموذج الموردين"""
+    data_scope = 'suppliers'
     
     def add_supplier(self, name, contact_info=""):
         """إضافة مورد جديد"""
         query = "INSERT INTO suppliers (supplier_name, contact_info) VALUES (?, ?)"
         cursor = self.execute_query(query, (name, contact_info))
+        if cursor:
+            self.bump_version()
         return cursor.lastrowid if cursor else None
     
     def get_all_suppliers(self):
@@ -94,21 +344,25 @@ class Supplier(BaseModel):
         """تحديث مورد"""
         query = "UPDATE suppliers SET supplier_name = ?, contact_info = ? WHERE supplier_id = ?"
         cursor = self.execute_query(query, (name, contact_info, supplier_id))
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
     
     def delete_supplier(self, supplier_id):
-        """حذف مورد"""
+        """حذف مورد (ترفع InUseError إن كان مستخدماً)"""
         query = "DELETE FROM suppliers WHERE supplier_id = ?"
-        cursor = self.execute_query(query, (supplier_id,))
-        return cursor.rowcount > 0 if cursor else False
+        return self.execute_delete(query, (supplier_id,), "لا يمكن حذف المورد لأن له منتجات")
 
 class Customer(BaseModel):
     """نموذج العملاء"""
+    data_scope = 'customers'
     
     def add_customer(self, name, contact_info=""):
         """إضافة عميل جديد"""
         query = "INSERT INTO customers (name, contact_info) VALUES (?, ?)"
         cursor = self.execute_query(query, (name, contact_info))
+        if cursor:
+            self.bump_version()
         return cursor.lastrowid if cursor else None
     
     def get_all_customers(self):
@@ -125,28 +379,34 @@ class Customer(BaseModel):
         """تحديث عميل"""
         query = "UPDATE customers SET name = ?, contact_info = ? WHERE customer_id = ?"
         cursor = self.execute_query(query, (name, contact_info, customer_id))
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
     
     def delete_customer(self, customer_id):
-        """حذف عميل"""
+        """حذف عميل (ترفع InUseError إن كان مستخدماً)"""
         query = "DELETE FROM customers WHERE customer_id = ?"
-        cursor = self.execute_query(query, (customer_id,))
-        return cursor.rowcount > 0 if cursor else False
+        return self.execute_delete(query, (customer_id,), "لا يمكن حذف العميل لأن له مبيعات أو استعلامات")
 
 class Product(BaseModel):
     """نموذج المنتجات"""
+    data_scope = 'products'
     
     def add_product(self, name, description, selling_price, purchasing_price, 
                    stock_quantity, discount_percentage=0, manual_discount=0,
-                   category_id=None, supplier_id=None, invoice_number=""):
+                   category_id=None, supplier_id=None, invoice_number="", barcode=None):
         """إضافة منتج جديد"""
         query = """INSERT INTO products 
                    (name, description, selling_price, purchasing_price, stock_quantity,
-                    discount_percentage, manual_discount, category_id, supplier_id, invoice_number)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+                    discount_percentage, manual_discount, category_id, supplier_id, invoice_number,
+                    barcode)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULLIF(?, ''))"""
         params = (name, description, selling_price, purchasing_price, stock_quantity,
-                 discount_percentage, manual_discount, category_id, supplier_id, invoice_number)
+                 discount_percentage, manual_discount, category_id, supplier_id, invoice_number,
+                 barcode)
         cursor = self.execute_query(query, params)
+        if cursor:
+            self.bump_version()
         return cursor.lastrowid if cursor else None
     
     def get_all_products(self):
@@ -158,6 +418,37 @@ class Product(BaseModel):
                    ORDER BY p.name"""
         return self.fetch_all(query)
     
+    # أعمدة الترتيب المسموحة (مفتاح العمود ← تعبير SQL)
+    SORT_COLUMNS = {
+        'product_id': "p.product_id",
+        'name': "p.name",
+        'selling_price': "p.selling_price",
+        'purchasing_price': "p.purchasing_price",
+        'stock_quantity': "p.stock_quantity",
+        'discount_percentage': "COALESCE(p.discount_percentage, 0)",
+        'manual_discount': "COALESCE(p.manual_discount, 0)",
+        'final_price': """MAX(0, p.selling_price * (1 - COALESCE(p.discount_percentage, 0) / 100.0)
+                                 - COALESCE(p.manual_discount, 0))""",
+        'category_name': "COALESCE(c.category_name, '')",
+        'supplier_name': "COALESCE(s.supplier_name, '')",
+    }
+    
+    def get_products_page(self, seek=None, forward=True, limit=100, sort='name',
+                          descending=False, inclusive=False):
+        """جلب صفحة من المنتجات مرتبة في SQL (للقوائم الكبيرة)"""
+        return self.fetch_keyset_page(
+            "p.*, c.category_name, s.supplier_name",
+            """products p
+               LEFT JOIN categories c ON p.category_id = c.category_id
+               LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id""",
+            self.SORT_COLUMNS.get(sort, self.SORT_COLUMNS['name']), "p.product_id",
+            seek, forward, limit, descending, inclusive)
+    
+    def count_products(self):
+        """عدد المنتجات"""
+        result = self.fetch_one("SELECT COUNT(*) AS count FROM products")
+        return result['count'] if result else 0
+    
     def get_product_by_id(self, product_id):
         """جلب منتج بالمعرف"""
         query = """SELECT p.*, c.category_name, s.supplier_name 
@@ -169,30 +460,95 @@ class Product(BaseModel):
     
     def update_product(self, product_id, name, description, selling_price, purchasing_price,
                       stock_quantity, discount_percentage=0, manual_discount=0,
-                      category_id=None, supplier_id=None, invoice_number=""):
-        """تحديث منتج"""
+                      category_id=None, supplier_id=None, invoice_number="", barcode=None):
+        """تحديث منتج (barcode=None يبقي الباركود الحالي و "" يحذفه)"""
         query = """UPDATE products SET 
                    name = ?, description = ?, selling_price = ?, purchasing_price = ?,
                    stock_quantity = ?, discount_percentage = ?, manual_discount = ?,
-                   category_id = ?, supplier_id = ?, invoice_number = ?
+                   category_id = ?, supplier_id = ?, invoice_number = ?,
+                   barcode = NULLIF(COALESCE(?, barcode), '')
                    WHERE product_id = ?"""
         params = (name, description, selling_price, purchasing_price, stock_quantity,
                  discount_percentage, manual_discount, category_id, supplier_id, 
-                 invoice_number, product_id)
+                 invoice_number, barcode, product_id)
         cursor = self.execute_query(query, params)
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
     
     def delete_product(self, product_id):
-        """حذف منتج"""
+        """حذف منتج (ترفع InUseError إن كان مستخدماً)"""
         query = "DELETE FROM products WHERE product_id = ?"
-        cursor = self.execute_query(query, (product_id,))
+        return self.execute_delete(query, (product_id,), "لا يمكن حذف المنتج لأن له مبيعات مسجلة")
+    
+    # جميع الباركودات (الأساسي + العبوات) مع عدد الوحدات في كل منها
+    BARCODES_QUERY = """SELECT barcode, product_id, 1 AS pack_quantity FROM products
+                        WHERE barcode IS NOT NULL
+                        UNION ALL
+                        SELECT barcode, product_id, pack_quantity FROM product_barcodes"""
+    
+    def get_by_barcode(self, barcode):
+        """جلب منتج بالباركود الأساسي أو أحد باركودات العبوات
+
+        يرجع بيانات المنتج مع pack_quantity (عدد الوحدات في العبوة الممسوحة).
+        """
+        query = """SELECT p.*, c.category_name, s.supplier_name, b.pack_quantity
+                   FROM (SELECT product_id, 1 AS pack_quantity FROM products WHERE barcode = ?
+                         UNION ALL
+                         SELECT product_id, pack_quantity FROM product_barcodes WHERE barcode = ?) b
+                   JOIN products p ON p.product_id = b.product_id
+                   LEFT JOIN categories c ON p.category_id = c.category_id
+                   LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
+                   LIMIT 1"""
+        return self.fetch_one(query, (barcode, barcode))
+    
+    def get_all_barcode_products(self, limit=None):
+        """جلب المنتجات لكل باركود (لتعبئة الذاكرة المؤقتة دفعة واحدة)"""
+        query = f"""SELECT p.*, c.category_name, s.supplier_name,
+                           b.barcode AS scanned_barcode, b.pack_quantity
+                    FROM ({self.BARCODES_QUERY}) b
+                    JOIN products p ON p.product_id = b.product_id
+                    LEFT JOIN categories c ON p.category_id = c.category_id
+                    LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id"""
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return self.fetch_all(query)
+    
+    def add_barcode(self, product_id, barcode, pack_quantity=1):
+        """إضافة باركود إضافي للمنتج (مثل عبوة من عدة وحدات)"""
+        query = "INSERT INTO product_barcodes (barcode, product_id, pack_quantity) VALUES (?, ?, ?)"
+        cursor = self.execute_query(query, (barcode, product_id, pack_quantity))
+        if cursor:
+            self.bump_version()
+        return cursor is not None
+    
+    def remove_barcode(self, barcode):
+        """حذف باركود إضافي"""
+        query = "DELETE FROM product_barcodes WHERE barcode = ?"
+        cursor = self.execute_query(query, (barcode,))
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
     
+    def get_barcodes(self, product_id):
+        """جلب جميع باركودات المنتج (الأساسي أولاً ثم العبوات)"""
+        query = """SELECT barcode, 1 AS pack_quantity FROM products
+                   WHERE product_id = ? AND barcode IS NOT NULL
+                   UNION ALL
+                   SELECT barcode, pack_quantity FROM (
+                       SELECT barcode, pack_quantity FROM product_barcodes
+                       WHERE product_id = ? ORDER BY pack_quantity)"""
+        return self.fetch_all(query, (product_id, product_id))
+    
     def update_stock(self, product_id, quantity_sold):
-        """تحديث المخزون بعد البيع"""
-        query = "UPDATE products SET stock_quantity = stock_quantity - ? WHERE product_id = ?"
-        cursor = self.execute_query(query, (quantity_sold, product_id))
-        return cursor.rowcount > 0 if cursor else False
+        """تحديث المخزون بعد البيع (يفشل إذا كانت الكمية المتاحة غير كافية)"""
+        query = """UPDATE products SET stock_quantity = stock_quantity - ?
+                   WHERE product_id = ? AND stock_quantity >= ?"""
+        cursor = self.execute_query(query, (quantity_sold, product_id, quantity_sold))
+        updated = bool(cursor) and cursor.rowcount > 0
+        if updated:
+            data_version.bump('stock')
+        return updated
     
     def calculate_discounted_price(self, selling_price, discount_percentage, manual_discount):
         """حساب السعر بعد الخصم"""
@@ -204,62 +560,117 @@ class Product(BaseModel):
 
 class Sale(BaseModel):
     """نموذج المبيعات"""
+    data_scope = 'sales'
 
     def add_sale(self, customer_id, total_amount, profit, final_amount, sale_items):
-        """إضافة عملية بيع جديدة مع تفاصيلها"""
-        conn = self.db.connect()
-        if conn:
-            try:
-                cursor = conn.cursor()
+        """إضافة عملية بيع جديدة مع تفاصيلها
 
-                # إضافة البيع الرئيسي
-                sale_query = """INSERT INTO sales (customer_id, date, total_amount, profit, final_amount)
-                               VALUES (?, ?, ?, ?, ?)"""
-                cursor.execute(sale_query, (customer_id, datetime.now().isoformat(),
-                                          total_amount, profit, final_amount))
-                sale_id = cursor.lastrowid
-
-                # إضافة تفاصيل البيع
-                for item in sale_items:
-                    detail_query = """INSERT INTO sale_details
-                                     (sale_id, product_id, quantity, selling_price, purchasing_price,
-                                      discount_applied, manual_discount, final_price)
-                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
-                    cursor.execute(detail_query, (sale_id, item['product_id'], item['quantity'],
-                                                item['selling_price'], item['purchasing_price'],
-                                                item['discount_applied'], item['manual_discount'],
-                                                item['final_price']))
-
-                    # تحديث المخزون
-                    update_stock_query = """UPDATE products SET stock_quantity = stock_quantity - ?
-                                           WHERE product_id = ?"""
-                    cursor.execute(update_stock_query, (item['quantity'], item['product_id']))
-
-                conn.commit()
-
-                # إنشاء فاتورة تلقائياً
-                if sale_id:
-                    try:
-                        invoice_model = Invoice()
-                        customer_name = "عميل عادي"
-                        if customer_id:
-                            customer = Customer().get_customer_by_id(customer_id)
-                            if customer:
-                                customer_name = customer['name']
-
-                        invoice_model.create_invoice(sale_id, customer_name)
-                    except Exception as e:
-                        print(f"خطأ في إنشاء الفاتورة: {e}")
-
-                return sale_id
+        ترجع رقم البيع أو None، ولمعرفة سبب فشل كل بند استخدم checkout.
+        """
+        result = self.checkout(customer_id, total_amount, profit, final_amount, sale_items)
+        return result['sale_id']
 
+    def checkout(self, customer_id, total_amount, profit, final_amount, sale_items,
+                 before_commit=None):
+        """تنفيذ عملية البيع مع حجز المخزون بشكل آمن بين نقاط البيع المتعددة
+
+        ترجع قاموساً: {'success', 'sale_id', 'lines'} حيث يحتوي كل عنصر في
+        lines على product_id و requested و available و ok. عند الفشل لسبب غير
+        المخزون (مثل عميل محذوف) يحتوي القاموس أيضاً على error برسالة واضحة.
+        before_commit(sale_id, date) تُستدعى قبل تثبيت المعاملة مباشرة (لتسجيل
+        البيع في سجل السلة)، واستثناؤها يلغي البيع.
+        """
+        conn = self.get_connection()
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return self._checkout_once(conn, customer_id, total_amount, profit,
+                                           final_amount, sale_items, before_commit)
             except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                if is_busy_error(e) and attempt < BUSY_RETRIES:
+                    time.sleep(BUSY_RETRY_DELAY * (attempt + 1))
+                    continue
                 print(f"خطأ في إضافة البيع: {e}")
+                error = ("بيانات البيع تشير إلى منتج أو عميل غير موجود"
+                         if isinstance(e, sqlite3.IntegrityError) else "فشل في حفظ البيع")
+                return {'success': False, 'sale_id': None, 'lines': [], 'error': error}
+
+    def _checkout_once(self, conn, customer_id, total_amount, profit, final_amount, sale_items,
+                       before_commit=None):
+        """محاولة واحدة لتنفيذ البيع داخل معاملة كتابة محجوزة مسبقاً"""
+        cursor = conn.cursor()
+        # حجز قفل الكتابة من البداية حتى لا يبيع جهاز آخر نفس الوحدات
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # العميل قد يكون حُذف من جهاز آخر بعد تحميل القائمة
+        customer_name = "عميل عادي"
+        if customer_id:
+            cursor.execute("SELECT name FROM customers WHERE customer_id = ?", (customer_id,))
+            customer = cursor.fetchone()
+            if customer is None:
                 conn.rollback()
-                return None
-            finally:
-                self.db.disconnect()
-        return None
+                return {'success': False, 'sale_id': None, 'lines': [],
+                        'error': "العميل المحدد غير موجود (ربما تم حذفه)"}
+            customer_name = customer['name']
+
+        # خصم المخزون فقط عند توفر الكمية المطلوبة
+        lines = []
+        for item in sale_items:
+            cursor.execute("""UPDATE products SET stock_quantity = stock_quantity - ?
+                              WHERE product_id = ? AND stock_quantity >= ?""",
+                           (item['quantity'], item['product_id'], item['quantity']))
+            ok = cursor.rowcount > 0
+            line = {'product_id': item['product_id'], 'requested': item['quantity'], 'ok': ok}
+            cursor.execute("SELECT stock_quantity FROM products WHERE product_id = ?",
+                           (item['product_id'],))
+            row = cursor.fetchone()
+            line['available'] = row['stock_quantity'] + (item['quantity'] if ok else 0) if row else None
+            lines.append(line)
+
+        if not all(line['ok'] for line in lines):
+            conn.rollback()
+            return {'success': False, 'sale_id': None, 'lines': lines}
+
+        # إضافة البيع الرئيسي
+        sale_query = """INSERT INTO sales (customer_id, date, total_amount, profit, final_amount)
+                       VALUES (?, ?, ?, ?, ?)"""
+        sale_date = datetime.now().isoformat()
+        cursor.execute(sale_query, (customer_id, sale_date, total_amount, profit, final_amount))
+        sale_id = cursor.lastrowid
+
+        # إضافة تفاصيل البيع دفعة واحدة
+        detail_query = """INSERT INTO sale_details
+                         (sale_id, product_id, quantity, selling_price, purchasing_price,
+                          discount_applied, manual_discount, final_price)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+        cursor.executemany(detail_query, [
+            (sale_id, item['product_id'], item['quantity'],
+             item['selling_price'], item['purchasing_price'],
+             item['discount_applied'], item['manual_discount'],
+             item['final_price'])
+            for item in sale_items
+        ])
+
+        # إنشاء الفاتورة من المبالغ الموجودة في الذاكرة
+        Invoice.insert_invoice(cursor, sale_id, customer_name, final_amount)
+
+        if before_commit is not None:
+            try:
+                before_commit(sale_id, sale_date)
+            except Exception:
+                conn.rollback()
+                raise
+        conn.commit()
+        self.bump_version(sale_date)
+        # البيع يغير المخزون فقط (الأسعار والأسماء والباركود كما هي)
+        data_version.bump('stock')
+        return {'success': True, 'sale_id': sale_id, 'lines': lines}
+
+    def sale_exists(self, sale_id, date):
+        """هل ثُبت البيع في قاعدة البيانات؟ (الرقم وحده قد يُعاد استخدامه بعد إلغاء معاملة)"""
+        return self.fetch_one("SELECT 1 FROM sales WHERE sale_id = ? AND date = ?",
+                              (sale_id, date)) is not None
 
     def get_all_sales(self):
         """جلب جميع المبيعات"""
@@ -286,28 +697,44 @@ class Sale(BaseModel):
             return {'sale': sale, 'details': details}
         return None
 
-    def get_sales_by_date_range(self, start_date, end_date):
-        """جلب المبيعات في فترة زمنية محددة"""
+    def get_sales_by_date_range(self, start_date, end_date, limit=None, offset=0):
+        """جلب المبيعات في فترة زمنية محددة (مع إمكانية جلب صفحة واحدة فقط)"""
         query = """SELECT s.*, c.name as customer_name
                    FROM sales s
                    LEFT JOIN customers c ON s.customer_id = c.customer_id
-                   WHERE DATE(s.date) BETWEEN ? AND ?
+                   WHERE s.date >= ? AND s.date < ?
                    ORDER BY s.date DESC"""
-        return self.fetch_all(query, (start_date, end_date))
+        params = date_range_bounds(start_date, end_date)
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += (limit, offset)
+        return self.fetch_all(query, params)
+
+    def get_sales_summary_by_date_range(self, start_date, end_date):
+        """إجماليات المبيعات في فترة زمنية محسوبة داخل قاعدة البيانات"""
+        query = """SELECT
+                       COUNT(*) as total_sales,
+                       COALESCE(SUM(total_amount), 0) as total_revenue,
+                       COALESCE(SUM(profit), 0) as total_profit,
+                       COALESCE(SUM(final_amount), 0) as total_final_amount
+                   FROM sales
+                   WHERE date >= ? AND date < ?"""
+        return self.fetch_one(query, date_range_bounds(start_date, end_date))
 
     def get_daily_sales_report(self, date):
         """تقرير المبيعات اليومية"""
         query = """SELECT
                        COUNT(*) as total_sales,
-                       SUM(total_amount) as total_revenue,
-                       SUM(profit) as total_profit,
-                       SUM(final_amount) as total_final_amount
+                       COALESCE(SUM(total_amount), 0) as total_revenue,
+                       COALESCE(SUM(profit), 0) as total_profit,
+                       COALESCE(SUM(final_amount), 0) as total_final_amount
                    FROM sales
-                   WHERE DATE(date) = ?"""
-        return self.fetch_one(query, (date,))
+                   WHERE date >= ? AND date < ?"""
+        return self.fetch_one(query, date_range_bounds(date))
 
 class Expense(BaseModel):
     """نموذج المصروفات"""
+    data_scope = 'expenses'
 
     def add_expense(self, description, amount, date=None):
         """إضافة مصروف جديد"""
@@ -315,6 +742,8 @@ class Expense(BaseModel):
             date = datetime.now().isoformat()
         query = "INSERT INTO expenses (description, amount, date) VALUES (?, ?, ?)"
         cursor = self.execute_query(query, (description, amount, date))
+        if cursor:
+            self.bump_version(date)
         return cursor.lastrowid if cursor else None
 
     def get_all_expenses(self):
@@ -322,6 +751,33 @@ class Expense(BaseModel):
         query = "SELECT * FROM expenses ORDER BY date DESC"
         return self.fetch_all(query)
 
+    # أعمدة الترتيب المسموحة (مفتاح العمود ← تعبير SQL)
+    SORT_COLUMNS = {
+        'expense_id': "expense_id",
+        'description': "COALESCE(description, '')",
+        'amount': "amount",
+        'date': "date",
+    }
+    
+    def get_expenses_page(self, seek=None, forward=True, limit=100, sort='date',
+                          descending=True, inclusive=False, start_date=None, end_date=None):
+        """جلب صفحة من المصروفات مرتبة في SQL، مع تصفية اختيارية بفترة زمنية"""
+        where, params = None, ()
+        if start_date:
+            where, params = "date >= ? AND date < ?", date_range_bounds(start_date, end_date)
+        return self.fetch_keyset_page(
+            "*", "expenses", self.SORT_COLUMNS.get(sort, self.SORT_COLUMNS['date']), "expense_id",
+            seek, forward, limit, descending, inclusive, where, params)
+    
+    def get_expenses_totals(self, start_date=None, end_date=None):
+        """عدد المصروفات وإجماليها (جميع المصروفات أو فترة محددة)"""
+        query = "SELECT COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total FROM expenses"
+        params = ()
+        if start_date:
+            query += " WHERE date >= ? AND date < ?"
+            params = date_range_bounds(start_date, end_date)
+        return self.fetch_one(query, params)
+    
     def get_expense_by_id(self, expense_id):
         """جلب مصروف بالمعرف"""
         query = "SELECT * FROM expenses WHERE expense_id = ?"
@@ -331,27 +787,85 @@ class Expense(BaseModel):
         """تحديث مصروف"""
         query = "UPDATE expenses SET description = ?, amount = ?, date = ? WHERE expense_id = ?"
         cursor = self.execute_query(query, (description, amount, date, expense_id))
+        if cursor:
+            # التاريخ القديم غير معروف هنا لذلك يُبطل التغيير جميع الأيام
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
 
     def delete_expense(self, expense_id):
         """حذف مصروف"""
         query = "DELETE FROM expenses WHERE expense_id = ?"
         cursor = self.execute_query(query, (expense_id,))
+        if cursor:
+            self.bump_version()
         return cursor.rowcount > 0 if cursor else False
 
-    def get_expenses_by_date_range(self, start_date, end_date):
-        """جلب المصروفات في فترة زمنية محددة"""
+    def get_expenses_by_date_range(self, start_date, end_date, limit=None, offset=0):
+        """جلب المصروفات في فترة زمنية محددة (مع إمكانية جلب صفحة واحدة فقط)"""
         query = """SELECT * FROM expenses
-                   WHERE DATE(date) BETWEEN ? AND ?
+                   WHERE date >= ? AND date < ?
                    ORDER BY date DESC"""
-        return self.fetch_all(query, (start_date, end_date))
+        params = date_range_bounds(start_date, end_date)
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += (limit, offset)
+        return self.fetch_all(query, params)
+
+    def get_total_expenses_by_date_range(self, start_date, end_date):
+        """جلب إجمالي المصروفات في فترة زمنية محددة"""
+        query = "SELECT COALESCE(SUM(amount), 0) as total FROM expenses WHERE date >= ? AND date < ?"
+        result = self.fetch_one(query, date_range_bounds(start_date, end_date))
+        return result['total'] if result else 0
 
     def get_total_expenses_by_date(self, date):
         """جلب إجمالي المصروفات في تاريخ محدد"""
-        query = "SELECT SUM(amount) as total FROM expenses WHERE DATE(date) = ?"
-        result = self.fetch_one(query, (date,))
+        query = "SELECT SUM(amount) as total FROM expenses WHERE date >= ? AND date < ?"
+        result = self.fetch_one(query, date_range_bounds(date))
         return result['total'] if result and result['total'] else 0
 
+class DailySummary(BaseModel):
+    """نموذج الملخص اليومي (يتم تحديثه تلقائياً بالمشغلات)"""
+
+    def get_day(self, date):
+        """ملخص يوم واحد"""
+        query = "SELECT * FROM daily_summary WHERE day = ?"
+        return self.fetch_one(query, (date[:10],))
+
+    def get_range_totals(self, start_date, end_date):
+        """إجماليات فترة زمنية من صفوف الأيام فقط"""
+        query = """SELECT
+                       COALESCE(SUM(sales_count), 0) as total_sales,
+                       COALESCE(SUM(revenue), 0) as total_revenue,
+                       COALESCE(SUM(profit), 0) as total_profit,
+                       COALESCE(SUM(final_amount), 0) as total_final_amount,
+                       COALESCE(SUM(expenses), 0) as total_expenses
+                   FROM daily_summary
+                   WHERE day >= ? AND day < ?"""
+        return self.fetch_one(query, date_range_bounds(start_date, end_date))
+
+    def get_days(self, start_date, end_date):
+        """صفوف الأيام في فترة زمنية (للرسوم البيانية)"""
+        query = """SELECT * FROM daily_summary
+                   WHERE day >= ? AND day < ?
+                   ORDER BY day"""
+        return self.fetch_all(query, date_range_bounds(start_date, end_date))
+
+    def rebuild(self):
+        """إصلاح الملخص بإعادة بنائه من البيانات الأصلية"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            self.db.rebuild_daily_summary(cursor)
+            conn.commit()
+            data_version.bump('sales')
+            data_version.bump('expenses')
+            return True
+        except sqlite3.Error as e:
+            print(f"خطأ في إعادة بناء الملخص اليومي: {e}")
+            conn.rollback()
+            return False
+
 class ProductQuery(BaseModel):
     """نموذج استعلامات المنتجات"""
 
@@ -400,36 +914,121 @@ class ProductQuery(BaseModel):
         cursor = self.execute_query(query, (query_id,))
         return cursor.rowcount > 0 if cursor else False
 
-    def search_products(self, search_term):
-        """البحث عن المنتجات"""
+    # أوزان الترتيب: الاسم ثم الفئة ثم الوصف
+    SEARCH_WEIGHTS = (10.0, 2.0, 5.0)
+
+    def search_products(self, search_term, limit=None):
+        """البحث عن المنتجات
+
+        يستخدم فهرس FTS5 مع توحيد الحروف العربية، وكل كلمة تطابق كبادئة
+        (مفت ← مفتاح)، والنتائج مرتبة حسب درجة التطابق.
+        """
+        tokens = tokenize(search_term)
+        if not tokens:
+            query = """SELECT p.*, c.category_name, s.supplier_name
+                       FROM products p
+                       LEFT JOIN categories c ON p.category_id = c.category_id
+                       LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
+                       ORDER BY p.name"""
+            return self.fetch_all(query + (f" LIMIT {int(limit)}" if limit else ""))
+
+        match = " ".join(f'"{token}"*' for token in tokens)
+        weights = ", ".join(str(weight) for weight in self.SEARCH_WEIGHTS)
+        query = f"""SELECT p.*, c.category_name, s.supplier_name
+                    FROM products_fts
+                    JOIN products p ON p.product_id = products_fts.rowid
+                    LEFT JOIN categories c ON p.category_id = c.category_id
+                    LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
+                    WHERE products_fts MATCH ?
+                    ORDER BY bm25(products_fts, {weights}), p.name"""
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(query, (match,))
+            return cursor.fetchall()
+        except sqlite3.Error:
+            # فهرس البحث غير متوفر - البحث التقليدي
+            return self._search_products_like(search_term, limit)
+
+    def product_changes_position(self):
+        """رقم آخر تعديل في سجل تعديلات المنتجات (0 إن لم يوجد)"""
+        row = self.fetch_one("SELECT COALESCE(MAX(seq), 0) AS position FROM product_changes")
+        return row['position'] if row else 0
+
+    def get_product_changes(self, after_seq, rows=True):
+        """المنتجات التي تغيرت بعد رقم تعديل معين: (آخر رقم، المعرفات، الصفوف الحالية)
+
+        المعرفات التي لا يقابلها صف هي منتجات محذوفة. الصفوف تُجلب بعد
+        المعرفات، فالتعديل بينهما يظهر بقيمته الأحدث ويُجلب مرة أخرى لاحقاً.
+        rows=False يرجع المعرفات فقط (لحذف منتجات محددة من ذاكرة مؤقتة).
+        """
+        changes = self.fetch_all("SELECT product_id, seq FROM product_changes WHERE seq > ? ORDER BY seq",
+                                 (after_seq,))
+        if not changes:
+            return after_seq, [], []
+        if not rows:
+            return changes[-1]['seq'], [change['product_id'] for change in changes], []
+        rows = self.fetch_all("""SELECT p.*, c.category_name, s.supplier_name
+                                 FROM product_changes pc
+                                 JOIN products p ON p.product_id = pc.product_id
+                                 LEFT JOIN categories c ON p.category_id = c.category_id
+                                 LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
+                                 WHERE pc.seq > ?""", (after_seq,))
+        return changes[-1]['seq'], [change['product_id'] for change in changes], rows
+
+    def _search_products_like(self, search_term, limit=None):
+        """البحث بـ LIKE عند عدم توفر فهرس FTS5"""
         query = """SELECT p.*, c.category_name, s.supplier_name
                    FROM products p
                    LEFT JOIN categories c ON p.category_id = c.category_id
                    LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
                    WHERE p.name LIKE ? OR p.description LIKE ? OR c.category_name LIKE ?
                    ORDER BY p.name"""
+        if limit:
+            query += f" LIMIT {int(limit)}"
         search_pattern = f"%{search_term}%"
         return self.fetch_all(query, (search_pattern, search_pattern, search_pattern))
 
 class Invoice(BaseModel):
     """نموذج الفواتير"""
 
-    def create_invoice(self, sale_id, customer_name="عميل عادي"):
-        """إنشاء فاتورة جديدة"""
-        # جلب بيانات البيع
-        sale = Sale().get_sale_by_id(sale_id)
-        if not sale:
-            return None
-
-        # إنشاء رقم فاتورة فريد
+    @staticmethod
+    def insert_invoice(cursor, sale_id, customer_name, total_amount):
+        """إدراج فاتورة باستخدام مؤشر معاملة قائمة (بدون حفظ)"""
+        # إنشاء رقم فاتورة فريد، مع لاحقة عند إعادة إصدار فاتورة لنفس البيع
         invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{sale_id:04d}"
+        cursor.execute("SELECT COUNT(*) FROM invoices WHERE sale_id = ?", (sale_id,))
+        issued = cursor.fetchone()[0]
+        if issued:
+            invoice_number = f"{invoice_number}-{issued + 1}"
 
         query = """INSERT INTO invoices
                    (sale_id, invoice_number, customer_name, issue_date, total_amount)
                    VALUES (?, ?, ?, ?, ?)"""
-        cursor = self.execute_query(query, (sale_id, invoice_number, customer_name,
-                                          datetime.now().isoformat(), sale['sale']['final_amount']))
-        return cursor.lastrowid if cursor else None
+        cursor.execute(query, (sale_id, invoice_number, customer_name,
+                               datetime.now().isoformat(), total_amount))
+        return cursor.lastrowid
+
+    def create_invoice(self, sale_id, customer_name="عميل عادي"):
+        """إنشاء فاتورة جديدة"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # جلب مبلغ البيع فقط
+            cursor.execute("SELECT final_amount FROM sales WHERE sale_id = ?", (sale_id,))
+            sale = cursor.fetchone()
+            if not sale:
+                return None
+
+            invoice_id = self.insert_invoice(cursor, sale_id, customer_name, sale['final_amount'])
+            conn.commit()
+            return invoice_id
+        except sqlite3.Error as e:
+            print(f"خطأ في إنشاء الفاتورة: {e}")
+            conn.rollback()
+            return None
 
     def get_invoice_by_number(self, invoice_number):
         """جلب فاتورة برقم الفاتورة"""
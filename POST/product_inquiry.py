@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models import ProductQuery, Customer
-from utils import ValidationUtils
+from models import ProductQuery
+from utils import ValidationUtils, entity_cache
+from background import worker, change_bus
 from datetime import datetime
 
 class ProductInquiryWindow:
@@ -14,7 +15,11 @@ class ProductInquiryWindow:
         
         # إنشاء النماذج
         self.query_model = ProductQuery()
-        self.customer_model = Customer()
+        # البحث والعرض عبر قناة القراءة فقط حتى لا يعطل نقطة البيع
+        self.search_model = ProductQuery(read_only=True)
+        # فهرس مشترك في الذاكرة للبحث أثناء الكتابة دون الرجوع لقاعدة البيانات
+        self.product_index = entity_cache.product_index()
+        self.live_search_job = None
         
         # متغيرات النموذج
         self.setup_variables()
@@ -24,6 +29,10 @@ class ProductInquiryWindow:
         
         # تحديث البيانات
         self.refresh_data()
+        
+        # تحديث العملاء والنتائج عند تغيرها من نافذة أخرى
+        change_bus.subscribe(self.window, ('customers',), self.refresh_customers)
+        change_bus.subscribe(self.window, self.product_index.SCOPES, self.schedule_live_search)
     
     def setup_variables(self):
         """إعداد متغيرات النموذج"""
@@ -31,6 +40,9 @@ class ProductInquiryWindow:
         self.var_customer = tk.StringVar()
         self.var_notes = tk.StringVar()
         self.var_quantity = tk.StringVar(value="1")
+        
+        # البحث الفوري مع كل تغيير في نص البحث
+        self.var_search_term.trace_add('write', lambda *args: self.schedule_live_search())
     
     def create_widgets(self):
         """إنشاء عناصر الواجهة"""
@@ -58,7 +70,7 @@ class ProductInquiryWindow:
         ttk.Button(search_row, text="عرض الكل", command=self.show_all_products).pack(side=tk.LEFT)
         
         # تلميح البحث
-        hint_label = ttk.Label(search_frame, text="يمكنك البحث باسم المنتج أو الوصف أو الفئة", 
+        hint_label = ttk.Label(search_frame, text="تظهر النتائج أثناء الكتابة - اضغط Enter للبحث في الوصف أيضاً", 
                               font=('Arial', 9), foreground='gray')
         hint_label.pack(anchor=tk.W, pady=(5, 0))
         
@@ -144,14 +156,57 @@ class ProductInquiryWindow:
     def refresh_data(self):
         """تحديث البيانات"""
         # تحديث قائمة العملاء
-        customers = self.customer_model.get_all_customers()
-        customer_values = ["عميل عادي"] + [f"{cust['customer_id']} - {cust['name']}" for cust in customers]
-        self.customer_combo['values'] = customer_values
+        self.refresh_customers()
         self.customer_combo.set("عميل عادي")
         
         # عرض جميع المنتجات في البداية
         self.show_all_products()
     
+    def refresh_customers(self):
+        """تحديث قائمة العملاء من الذاكرة المشتركة"""
+        worker.submit(self.window, entity_cache.customers,
+                      on_success=self.display_customers, key='customers')
+    
+    def display_customers(self, customers):
+        """عرض العملاء في القائمة المنسدلة"""
+        customer_values = ["عميل عادي"] + [f"{cust['customer_id']} - {cust['name']}" for cust in customers]
+        self.customer_combo['values'] = customer_values
+    
+    # مهلة انتظار توقف الكتابة قبل البحث (بالمللي ثانية)
+    LIVE_SEARCH_DELAY = 150
+    
+    def schedule_live_search(self):
+        """جدولة البحث الفوري بعد توقف الكتابة لتجنب البحث مع كل ضغطة مفتاح"""
+        if self.live_search_job:
+            self.window.after_cancel(self.live_search_job)
+        self.live_search_job = self.window.after(self.LIVE_SEARCH_DELAY, self.live_search)
+    
+    def search_index(self, search_term):
+        """تحديث فهرس الذاكرة ثم البحث فيه (في الخلفية: البناء الأول يستغرق وقتاً)"""
+        self.product_index.refresh()
+        return self.product_index.search(search_term)
+    
+    def live_search(self):
+        """البحث في فهرس الذاكرة أثناء الكتابة"""
+        self.live_search_job = None
+        if not self.window.winfo_exists():
+            return
+        search_term = self.var_search_term.get().strip()
+        
+        def on_success(products):
+            self.display_products(products)
+            if search_term:
+                self.status_bar.config(text=f"تم العثور على {len(products)} منتج")
+            else:
+                self.status_bar.config(text=f"تم عرض {len(products)} منتج")
+        
+        def on_error(e):
+            self.status_bar.config(text=f"حدث خطأ أثناء البحث: {str(e)}")
+        
+        # بحث جديد يلغي البحث السابق إن لم يكتمل بعد
+        worker.submit(self.window, self.search_index, search_term, on_success=on_success,
+                      on_error=on_error, key='search', busy=False)
+    
     def search_products(self):
         """البحث عن المنتجات"""
         search_term = self.var_search_term.get().strip()
@@ -160,35 +215,36 @@ class ProductInquiryWindow:
             messagebox.showwarning("تحذير", "يرجى إدخال كلمة البحث")
             return
         
-        try:
-            self.status_bar.config(text="جاري البحث...")
-            self.window.update()
-            
-            # البحث عن المنتجات
-            products = self.query_model.search_products(search_term)
-            
+        self.status_bar.config(text="جاري البحث...")
+        
+        def on_success(products):
             # عرض النتائج
             self.display_products(products)
-            
             self.status_bar.config(text=f"تم العثور على {len(products)} منتج")
-            
-        except Exception as e:
+        
+        def on_error(e):
             messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(e)}")
             self.status_bar.config(text="حدث خطأ أثناء البحث")
+        
+        # البحث عن المنتجات
+        worker.submit(self.window, self.search_model.search_products, search_term,
+                      on_success=on_success, on_error=on_error, key='search')
     
     def show_all_products(self):
         """عرض جميع المنتجات"""
-        try:
-            # جلب جميع المنتجات
-            products = self.query_model.search_products("")
-            
+        self.status_bar.config(text="جاري تحميل المنتجات...")
+        
+        def on_success(products):
             # عرض النتائج
             self.display_products(products)
-            
             self.status_bar.config(text=f"تم عرض {len(products)} منتج")
-            
-        except Exception as e:
+        
+        def on_error(e):
             messagebox.showerror("خطأ", f"حدث خطأ أثناء جلب المنتجات: {str(e)}")
+        
+        # جلب جميع المنتجات من الفهرس (يُبنى عند أول استدعاء)
+        worker.submit(self.window, self.search_index, "", on_success=on_success,
+                      on_error=on_error, key='search')
     
     def display_products(self, products):
         """عرض المنتجات في الجدول"""
@@ -252,16 +308,7 @@ class ProductInquiryWindow:
         # الحصول على معرف العميل
         customer_id = self.get_customer_id()
         
-        try:
-            # حفظ الاستعلام
-            query_id = self.query_model.add_query(
-                customer_id=customer_id,
-                product_name=self.selected_product['name'],
-                price=self.selected_product['price'],
-                quantity=quantity,
-                notes=self.var_notes.get()
-            )
-            
+        def on_success(query_id):
             if query_id:
                 messagebox.showinfo("نجح", "تم حفظ طلب المنتج بنجاح")
                 self.clear_form()
@@ -269,8 +316,17 @@ class ProductInquiryWindow:
             else:
                 messagebox.showerror("خطأ", "فشل في حفظ الطلب")
         
-        except Exception as e:
+        def on_error(e):
             messagebox.showerror("خطأ", f"حدث خطأ أثناء حفظ الطلب: {str(e)}")
+        
+        # حفظ الاستعلام
+        worker.submit(self.window, self.query_model.add_query,
+                      customer_id=customer_id,
+                      product_name=self.selected_product['name'],
+                      price=self.selected_product['price'],
+                      quantity=quantity,
+                      notes=self.var_notes.get(),
+                      on_success=on_success, on_error=on_error)
     
     def get_customer_id(self):
         """الحصول على معرف العميل"""
@@ -305,6 +361,8 @@ class SavedQueriesWindow:
         
         # إنشاء النموذج
         self.query_model = ProductQuery()
+        # عرض القائمة عبر قناة القراءة فقط
+        self.search_model = ProductQuery(read_only=True)
         
         # إنشاء الواجهة
         self.create_widgets()
@@ -366,14 +424,16 @@ class SavedQueriesWindow:
         self.filter_queries(None)
     
     def filter_queries(self, executed):
-        """تصفية الطلبات"""
+        """تصفية الطلبات (تصفية جديدة تلغي السابقة إن لم تكتمل)"""
+        worker.submit(self.window, self.search_model.get_all_queries, executed,
+                      on_success=self.display_queries, key='queries')
+    
+    def display_queries(self, queries):
+        """عرض الطلبات في الجدول"""
         # مسح الجدول
         for item in self.queries_tree.get_children():
             self.queries_tree.delete(item)
         
-        # جلب الطلبات
-        queries = self.query_model.get_all_queries(executed)
-        
         for query in queries:
             status = "منفذ" if query['executed'] else "غير منفذ"
             values = (
@@ -400,18 +460,16 @@ class SavedQueriesWindow:
         
         result = messagebox.askyesno("تأكيد التنفيذ", "هل تريد تنفيذ هذا الطلب وإنشاء فاتورة؟")
         if result:
-            try:
-                # تحديد الطلب كمنفذ
-                success = self.query_model.mark_as_executed(query_id)
-                
+            def on_success(success):
                 if success:
                     messagebox.showinfo("نجح", "تم تنفيذ الطلب بنجاح")
                     self.refresh_queries()
                 else:
                     messagebox.showerror("خطأ", "فشل في تنفيذ الطلب")
             
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            # تحديد الطلب كمنفذ
+            worker.submit(self.window, self.query_model.mark_as_executed, query_id,
+                          on_success=on_success)
     
     def delete_query(self):
         """حذف الطلب"""
@@ -425,17 +483,15 @@ class SavedQueriesWindow:
         
         result = messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا الطلب؟")
         if result:
-            try:
-                success = self.query_model.delete_query(query_id)
-                
+            def on_success(success):
                 if success:
                     messagebox.showinfo("نجح", "تم حذف الطلب بنجاح")
                     self.refresh_queries()
                 else:
                     messagebox.showerror("خطأ", "فشل في حذف الطلب")
             
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            worker.submit(self.window, self.query_model.delete_query, query_id,
+                          on_success=on_success)
 
 # تشغيل النافذة إذا تم تشغيل الملف مباشرة
 if __name__ == "__main__":
@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models import Product, Category, Supplier
-from utils import ValidationUtils, CalculationUtils
+from models import Product, InUseError
+from utils import ValidationUtils, CalculationUtils, entity_cache
+from treeview_helpers import PagedTreeview
+from background import worker, change_bus
 
 class ProductManagementWindow:
     def __init__(self, parent=None):
@@ -13,8 +15,6 @@ class ProductManagementWindow:
         
         # إنشاء النماذج
         self.product_model = Product()
-        self.category_model = Category()
-        self.supplier_model = Supplier()
         
         # متغيرات النموذج
         self.setup_variables()
@@ -25,6 +25,10 @@ class ProductManagementWindow:
         # تحديث القوائم
         self.refresh_data()
         
+        # تحديث القوائم عند تغيرها من نافذة أخرى
+        change_bus.subscribe(self.window, ('categories', 'suppliers'), self.refresh_lookups)
+        change_bus.subscribe(self.window, ('products', 'stock'), self.refresh_products_list)
+        
         # تحديد المنتج المحدد
         self.selected_product_id = None
     
@@ -40,6 +44,7 @@ class ProductManagementWindow:
         self.var_category = tk.StringVar()
         self.var_supplier = tk.StringVar()
         self.var_invoice_number = tk.StringVar()
+        self.var_barcode = tk.StringVar()
         self.var_final_price = tk.StringVar()
     
     def create_widgets(self):
@@ -106,6 +111,9 @@ class ProductManagementWindow:
         row4 = ttk.Frame(form_frame)
         row4.pack(fill=tk.X, pady=5)
         
+        ttk.Label(row4, text="الباركود:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Entry(row4, textvariable=self.var_barcode, width=18).pack(side=tk.LEFT, padx=(0, 20))
+        
         ttk.Label(row4, text="الوصف:").pack(side=tk.LEFT, padx=(0, 5))
         ttk.Entry(row4, textvariable=self.var_description, width=50).pack(side=tk.LEFT, fill=tk.X, expand=True)
         
@@ -126,6 +134,9 @@ class ProductManagementWindow:
         # إنشاء Treeview
         columns = ('ID', 'الاسم', 'سعر البيع', 'سعر الشراء', 'الكمية', 'الخصم%', 'الخصم اليدوي', 'السعر النهائي', 'الفئة', 'المورد')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
+        # عرض افتراضي: صفحات تُجلب من قاعدة البيانات حسب موضع التمرير
+        self.tree_pages = PagedTreeview(self.tree, self.product_model.get_products_page,
+                                        self.product_row, 'product_id', sort='name', worker=worker)
         
         # تعريف العناوين
         for col in columns:
@@ -134,7 +145,10 @@ class ProductManagementWindow:
         
         # شريط التمرير
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # النقر على عنوان العمود يرتب القائمة في قاعدة البيانات
+        self.tree_pages.attach(scrollbar, dict(zip(columns, (
+            'product_id', 'name', 'selling_price', 'purchasing_price', 'stock_quantity',
+            'discount_percentage', 'manual_discount', 'final_price', 'category_name', 'supplier_name'))))
         
         # تخطيط العناصر
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -157,50 +171,51 @@ class ProductManagementWindow:
     
     def refresh_data(self):
         """تحديث البيانات"""
-        # تحديث قائمة الفئات
-        categories = self.category_model.get_all_categories()
+        self.refresh_lookups()
+        
+        # تحديث قائمة المنتجات
+        self.refresh_products_list()
+    
+    def refresh_lookups(self):
+        """تحديث قائمتي الفئات والموردين من الذاكرة المشتركة (في الخلفية عند أول جلب)"""
+        worker.submit(self.window, lambda: (entity_cache.categories(), entity_cache.suppliers()),
+                      on_success=self.display_lookups, key='lookups')
+    
+    def display_lookups(self, lookups):
+        """عرض الفئات والموردين في القوائم المنسدلة"""
+        categories, suppliers = lookups
         category_values = [""] + [f"{cat['category_id']} - {cat['category_name']}" for cat in categories]
         self.category_combo['values'] = category_values
         
-        # تحديث قائمة الموردين
-        suppliers = self.supplier_model.get_all_suppliers()
         supplier_values = [""] + [f"{sup['supplier_id']} - {sup['supplier_name']}" for sup in suppliers]
         self.supplier_combo['values'] = supplier_values
-        
-        # تحديث قائمة المنتجات
-        self.refresh_products_list()
     
     def refresh_products_list(self):
-        """تحديث قائمة المنتجات"""
-        # مسح القائمة الحالية
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # جلب المنتجات
-        products = self.product_model.get_all_products()
-        
-        for product in products:
-            # حساب السعر النهائي
-            final_price = CalculationUtils.calculate_discount(
-                product['selling_price'], 
-                product['discount_percentage'], 
-                product['manual_discount']
-            )
-            
-            values = (
-                product['product_id'],
-                product['name'],
-                f"{product['selling_price']:.2f}",
-                f"{product['purchasing_price']:.2f}",
-                product['stock_quantity'],
-                f"{product['discount_percentage']:.1f}",
-                f"{product['manual_discount']:.2f}",
-                f"{final_price:.2f}",
-                product['category_name'] or "غير محدد",
-                product['supplier_name'] or "غير محدد"
-            )
-            
-            self.tree.insert('', tk.END, values=values)
+        """تحديث قائمة المنتجات (الصفوف المعروضة فقط مع الإبقاء على موضع التمرير)"""
+        self.tree_pages.refresh()
+    
+    def product_row(self, product):
+        """صف المنتج في الجدول: (المفتاح، القيم)"""
+        # حساب السعر النهائي
+        final_price = CalculationUtils.calculate_discount(
+            product['selling_price'], 
+            product['discount_percentage'], 
+            product['manual_discount']
+        )
+        
+        values = (
+            product['product_id'],
+            product['name'],
+            f"{product['selling_price']:.2f}",
+            f"{product['purchasing_price']:.2f}",
+            product['stock_quantity'],
+            f"{product['discount_percentage']:.1f}",
+            f"{product['manual_discount']:.2f}",
+            f"{final_price:.2f}",
+            product['category_name'] or "غير محدد",
+            product['supplier_name'] or "غير محدد"
+        )
+        return product['product_id'], values
 
     def on_select(self, event):
         """عند تحديد منتج من القائمة"""
@@ -219,28 +234,33 @@ class ProductManagementWindow:
             self.var_discount_percentage.set(values[5])
             self.var_manual_discount.set(values[6])
 
-            # جلب باقي البيانات
-            product = self.product_model.get_product_by_id(self.selected_product_id)
-            if product:
-                self.var_description.set(product['description'] or "")
-                self.var_invoice_number.set(product['invoice_number'] or "")
-
-                # تحديد الفئة والمورد
-                if product['category_id']:
-                    category_text = f"{product['category_id']} - {product['category_name']}"
-                    self.var_category.set(category_text)
-                else:
-                    self.var_category.set("")
-
-                if product['supplier_id']:
-                    supplier_text = f"{product['supplier_id']} - {product['supplier_name']}"
-                    self.var_supplier.set(supplier_text)
-                else:
-                    self.var_supplier.set("")
+            # جلب باقي البيانات (تحديد منتج آخر يلغي الجلب السابق)
+            worker.submit(self.window, self.product_model.get_product_by_id, self.selected_product_id,
+                          on_success=self.display_product_details, key='select')
 
             # حساب السعر النهائي
             self.calculate_final_price()
 
+    def display_product_details(self, product):
+        """عرض باقي بيانات المنتج المحدد"""
+        if product:
+            self.var_description.set(product['description'] or "")
+            self.var_invoice_number.set(product['invoice_number'] or "")
+            self.var_barcode.set(product['barcode'] or "")
+
+            # تحديد الفئة والمورد
+            if product['category_id']:
+                category_text = f"{product['category_id']} - {product['category_name']}"
+                self.var_category.set(category_text)
+            else:
+                self.var_category.set("")
+
+            if product['supplier_id']:
+                supplier_text = f"{product['supplier_id']} - {product['supplier_name']}"
+                self.var_supplier.set(supplier_text)
+            else:
+                self.var_supplier.set("")
+
     def validate_form(self):
         """التحقق من صحة النموذج"""
         if not ValidationUtils.validate_required_field(self.var_name.get()):
@@ -279,34 +299,51 @@ class ProductManagementWindow:
             return int(supplier_text.split(" - ")[0])
         return None
 
+    def form_values(self):
+        """قيم النموذج بالأنواع التي يتوقعها نموذج المنتجات"""
+        return dict(
+            name=self.var_name.get(),
+            description=self.var_description.get(),
+            selling_price=float(self.var_selling_price.get()),
+            purchasing_price=float(self.var_purchasing_price.get()),
+            stock_quantity=int(self.var_stock_quantity.get()),
+            discount_percentage=float(self.var_discount_percentage.get() or 0),
+            manual_discount=float(self.var_manual_discount.get() or 0),
+            category_id=self.get_category_id(),
+            supplier_id=self.get_supplier_id(),
+            invoice_number=self.var_invoice_number.get(),
+            barcode=self.var_barcode.get().strip()
+        )
+
+    def save_in_background(self, func, success_message, failure_message, **values):
+        """تنفيذ الحفظ في الخلفية ثم تحديث القائمة عند النجاح"""
+        def on_success(result):
+            if result:
+                messagebox.showinfo("نجح", success_message)
+                self.clear_form()
+                self.refresh_products_list()
+            else:
+                messagebox.showerror("خطأ", failure_message)
+
+        def on_error(e):
+            # InUseError تحمل سبب رفض الحذف (مثل منتج له مبيعات)
+            messagebox.showerror("خطأ", str(e) if isinstance(e, InUseError) else f"{failure_message}: {e}")
+
+        worker.submit(self.window, func, on_success=on_success, on_error=on_error, **values)
+
     def add_product(self):
         """إضافة منتج جديد"""
         if not self.validate_form():
             return
 
         try:
-            product_id = self.product_model.add_product(
-                name=self.var_name.get(),
-                description=self.var_description.get(),
-                selling_price=float(self.var_selling_price.get()),
-                purchasing_price=float(self.var_purchasing_price.get()),
-                stock_quantity=int(self.var_stock_quantity.get()),
-                discount_percentage=float(self.var_discount_percentage.get() or 0),
-                manual_discount=float(self.var_manual_discount.get() or 0),
-                category_id=self.get_category_id(),
-                supplier_id=self.get_supplier_id(),
-                invoice_number=self.var_invoice_number.get()
-            )
-
-            if product_id:
-                messagebox.showinfo("نجح", "تم إضافة المنتج بنجاح")
-                self.clear_form()
-                self.refresh_products_list()
-            else:
-                messagebox.showerror("خطأ", "فشل في إضافة المنتج")
-
-        except Exception as e:
+            values = self.form_values()
+        except ValueError as e:
             messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            return
+
+        self.save_in_background(self.product_model.add_product,
+                                "تم إضافة المنتج بنجاح", "فشل في إضافة المنتج", **values)
 
     def update_product(self):
         """تحديث منتج موجود"""
@@ -318,29 +355,14 @@ class ProductManagementWindow:
             return
 
         try:
-            success = self.product_model.update_product(
-                product_id=self.selected_product_id,
-                name=self.var_name.get(),
-                description=self.var_description.get(),
-                selling_price=float(self.var_selling_price.get()),
-                purchasing_price=float(self.var_purchasing_price.get()),
-                stock_quantity=int(self.var_stock_quantity.get()),
-                discount_percentage=float(self.var_discount_percentage.get() or 0),
-                manual_discount=float(self.var_manual_discount.get() or 0),
-                category_id=self.get_category_id(),
-                supplier_id=self.get_supplier_id(),
-                invoice_number=self.var_invoice_number.get()
-            )
-
-            if success:
-                messagebox.showinfo("نجح", "تم تحديث المنتج بنجاح")
-                self.clear_form()
-                self.refresh_products_list()
-            else:
-                messagebox.showerror("خطأ", "فشل في تحديث المنتج")
-
-        except Exception as e:
+            values = self.form_values()
+        except ValueError as e:
             messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            return
+
+        self.save_in_background(self.product_model.update_product,
+                                "تم تحديث المنتج بنجاح", "فشل في تحديث المنتج",
+                                product_id=self.selected_product_id, **values)
 
     def delete_product(self):
         """حذف منتج"""
@@ -350,18 +372,9 @@ class ProductManagementWindow:
 
         result = messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا المنتج؟")
         if result:
-            try:
-                success = self.product_model.delete_product(self.selected_product_id)
-
-                if success:
-                    messagebox.showinfo("نجح", "تم حذف المنتج بنجاح")
-                    self.clear_form()
-                    self.refresh_products_list()
-                else:
-                    messagebox.showerror("خطأ", "فشل في حذف المنتج")
-
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
+            self.save_in_background(self.product_model.delete_product,
+                                    "تم حذف المنتج بنجاح", "فشل في حذف المنتج",
+                                    product_id=self.selected_product_id)
 
     def clear_form(self):
         """مسح النموذج"""
@@ -376,6 +389,7 @@ class ProductManagementWindow:
         self.var_category.set("")
         self.var_supplier.set("")
         self.var_invoice_number.set("")
+        self.var_barcode.set("")
         self.var_final_price.set("")
 
 # تشغيل النافذة إذا تم تشغيل الملف مباشرة
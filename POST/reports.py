@@ -1,10 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from utils import ReportGenerator
+from background import worker
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.dates as mdates
+
+# عدد المبيعات المعروضة مع التقارير الأسبوعية والشهرية والسنوية
+SALES_DETAILS_LIMIT = 10
 
 class ReportsWindow:
     def __init__(self, parent=None):
@@ -50,7 +51,9 @@ class ReportsWindow:
         ttk.Button(buttons_row1, text="تقرير يومي", command=self.show_daily_report_dialog).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(buttons_row1, text="تقرير أسبوعي", command=self.show_weekly_report_dialog).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(buttons_row1, text="تقرير شهري", command=self.show_monthly_report_dialog).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(buttons_row1, text="تقرير سنوي", command=self.show_yearly_report_dialog).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(buttons_row1, text="تقرير المنتجات", command=self.generate_product_report).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(buttons_row1, text="إعادة بناء الملخص", command=self.rebuild_summary).pack(side=tk.RIGHT)
         
         # إطار النتائج
         results_frame = ttk.Frame(main_frame)
@@ -80,18 +83,38 @@ class ReportsWindow:
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
     
     def setup_chart(self, parent):
-        """إعداد الرسم البياني"""
+        """إعداد إطار الرسم البياني (matplotlib لا يُحمل إلا عند أول رسم)"""
+        self.chart_frame = parent
+        self.fig = self.ax = self.canvas = None
+        self.chart_available = True
+    
+    def ensure_chart(self):
+        """تحميل matplotlib وإنشاء الرسم عند أول حاجة إليه
+
+        يُستخدم Figure مباشرة بدلاً من pyplot لتجنب تحميل واجهاته الرسومية
+        الأخرى، فيبقى فتح البرنامج ونافذة التقارير سريعاً.
+        """
+        if self.canvas is not None or not self.chart_available:
+            return self.canvas is not None
         try:
-            self.fig, self.ax = plt.subplots(figsize=(6, 4))
-            self.canvas = FigureCanvasTkAgg(self.fig, parent)
-            self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+            import matplotlib
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
             
             # إعداد الخط العربي إذا كان متاحاً
-            plt.rcParams['font.family'] = ['Arial Unicode MS', 'Tahoma', 'DejaVu Sans']
+            matplotlib.rcParams['font.family'] = ['Arial Unicode MS', 'Tahoma', 'DejaVu Sans']
+            
+            self.fig = Figure(figsize=(6, 4))
+            self.ax = self.fig.add_subplot()
+            self.canvas = FigureCanvasTkAgg(self.fig, self.chart_frame)
+            self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+            return True
             
         except Exception as e:
             # في حالة عدم توفر matplotlib
-            ttk.Label(parent, text="الرسم البياني غير متاح\nيرجى تثبيت matplotlib").pack(expand=True)
+            self.chart_available = False
+            ttk.Label(self.chart_frame, text="الرسم البياني غير متاح\nيرجى تثبيت matplotlib").pack(expand=True)
+            return False
     
     def show_daily_report_dialog(self):
         """عرض حوار التقرير اليومي"""
@@ -162,64 +185,108 @@ class ReportsWindow:
                   command=lambda: [self.generate_monthly_report(), dialog.destroy()]).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="إلغاء", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
     
+    def show_yearly_report_dialog(self):
+        """عرض حوار التقرير السنوي"""
+        dialog = tk.Toplevel(self.window)
+        dialog.title("تقرير سنوي")
+        dialog.geometry("300x150")
+        dialog.transient(self.window)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="اختر السنة:", font=('Arial', 12)).pack(pady=10)
+        
+        year_entry = ttk.Entry(dialog, textvariable=self.var_year, font=('Arial', 12))
+        year_entry.pack(pady=5)
+        
+        buttons_frame = ttk.Frame(dialog)
+        buttons_frame.pack(pady=20)
+        
+        ttk.Button(buttons_frame, text="إنشاء التقرير", 
+                  command=lambda: [self.generate_yearly_report(), dialog.destroy()]).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="إلغاء", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def run_report(self, compute, show, status):
+        """حساب التقرير في الخلفية ثم عرضه (تقرير جديد يلغي السابق قبل انتهائه)"""
+        self.status_bar.config(text="جاري إنشاء التقرير...")
+        
+        def on_success(report):
+            show(report)
+            self.status_bar.config(text=status(report))
+        
+        def on_error(e):
+            self.status_bar.config(text="جاهز")
+            messagebox.showerror("خطأ", f"حدث خطأ في إنشاء التقرير: {str(e)}")
+        
+        worker.submit(self.window, compute, on_success=on_success, on_error=on_error, key='report')
+    
     def generate_daily_report(self):
         """إنشاء التقرير اليومي"""
-        try:
-            date = self.var_report_date.get()
-            report = self.report_generator.generate_daily_report(date)
-            
+        date = self.var_report_date.get()
+        
+        def show(report):
             # عرض التقرير
             self.display_report(f"التقرير اليومي - {date}", report)
             
             # رسم بياني بسيط
             self.draw_daily_chart(report)
-            
-            self.status_bar.config(text=f"تم إنشاء التقرير اليومي لتاريخ {date}")
-            
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في إنشاء التقرير: {str(e)}")
+        
+        self.run_report(lambda: self.report_generator.generate_daily_report(date), show,
+                        lambda report: f"تم إنشاء التقرير اليومي لتاريخ {date}")
     
     def generate_weekly_report(self):
         """إنشاء التقرير الأسبوعي"""
-        try:
-            start_date = self.var_week_start.get()
-            report = self.report_generator.generate_weekly_report(start_date)
-            
-            # عرض التقرير
-            self.display_report(f"التقرير الأسبوعي - {report['period']}", report)
-            
-            self.status_bar.config(text=f"تم إنشاء التقرير الأسبوعي للفترة {report['period']}")
-            
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في إنشاء التقرير: {str(e)}")
+        start_date = self.var_week_start.get()
+        self.run_report(
+            lambda: self.report_generator.generate_weekly_report(start_date, SALES_DETAILS_LIMIT),
+            lambda report: self.display_report(f"التقرير الأسبوعي - {report['period']}", report),
+            lambda report: f"تم إنشاء التقرير الأسبوعي للفترة {report['period']}")
     
     def generate_monthly_report(self):
         """إنشاء التقرير الشهري"""
         try:
             year = int(self.var_year.get())
             month = int(self.var_month.get())
-            report = self.report_generator.generate_monthly_report(year, month)
-            
-            # عرض التقرير
-            self.display_report(f"التقرير الشهري - {report['period']}", report)
-            
-            self.status_bar.config(text=f"تم إنشاء التقرير الشهري للفترة {report['period']}")
-            
-        except Exception as e:
+        except ValueError as e:
             messagebox.showerror("خطأ", f"حدث خطأ في إنشاء التقرير: {str(e)}")
+            return
+        
+        self.run_report(
+            lambda: self.report_generator.generate_monthly_report(year, month, SALES_DETAILS_LIMIT),
+            lambda report: self.display_report(f"التقرير الشهري - {report['period']}", report),
+            lambda report: f"تم إنشاء التقرير الشهري للفترة {report['period']}")
     
-    def generate_product_report(self):
-        """إنشاء تقرير المنتجات"""
+    def generate_yearly_report(self):
+        """إنشاء التقرير السنوي"""
         try:
-            report = self.report_generator.generate_product_report()
-            
-            # عرض التقرير
-            self.display_product_report(report)
-            
-            self.status_bar.config(text="تم إنشاء تقرير المنتجات والمخزون")
-            
-        except Exception as e:
+            year = int(self.var_year.get())
+        except ValueError as e:
             messagebox.showerror("خطأ", f"حدث خطأ في إنشاء التقرير: {str(e)}")
+            return
+        
+        self.run_report(
+            lambda: self.report_generator.generate_yearly_report(year, SALES_DETAILS_LIMIT),
+            lambda report: self.display_report(f"التقرير السنوي - {report['period']}", report),
+            lambda report: f"تم إنشاء التقرير السنوي لسنة {report['period']}")
+    
+    def rebuild_summary(self):
+        """إعادة بناء الملخص اليومي من البيانات الأصلية"""
+        if not messagebox.askyesno("تأكيد", "هل تريد إعادة بناء الملخص اليومي من جميع المبيعات والمصروفات؟"):
+            return
+        
+        def on_success(rebuilt):
+            if rebuilt:
+                messagebox.showinfo("نجح", "تم إعادة بناء الملخص اليومي بنجاح")
+                self.status_bar.config(text="تم إعادة بناء الملخص اليومي")
+            else:
+                messagebox.showerror("خطأ", "فشل في إعادة بناء الملخص اليومي")
+        
+        self.status_bar.config(text="جاري إعادة بناء الملخص اليومي...")
+        worker.submit(self.window, self.report_generator.rebuild_summary, on_success=on_success)
+    
+    def generate_product_report(self):
+        """إنشاء تقرير المنتجات"""
+        self.run_report(self.report_generator.generate_product_report, self.display_product_report,
+                        lambda report: "تم إنشاء تقرير المنتجات والمخزون")
     
     def display_report(self, title, report):
         """عرض التقرير في منطقة النص"""
@@ -243,14 +310,16 @@ class ReportsWindow:
         content += "📈 النتيجة النهائية:\n"
         content += f"   صافي الربح: {report['net_profit']:.2f}\n\n"
         
-        # تفاصيل إضافية للتقارير الأسبوعية والشهرية
-        if 'sales_details' in report and report['sales_details']:
+        # تفاصيل إضافية للتقارير الأسبوعية والشهرية (أول 10 مبيعات، تُجلب مع التقرير في الخلفية)
+        if 'sales_details' in report:
+            sales_details = report['sales_details']
             content += "📋 تفاصيل المبيعات:\n"
-            for sale in report['sales_details'][:10]:  # أول 10 مبيعات
+            for sale in sales_details:
                 content += f"   - فاتورة #{sale['sale_id']}: {sale['final_amount']:.2f} (ربح: {sale['profit']:.2f})\n"
             
-            if len(report['sales_details']) > 10:
-                content += f"   ... و {len(report['sales_details']) - 10} مبيعة أخرى\n"
+            remaining = report['sales']['total_sales'] - len(sales_details)
+            if remaining > 0:
+                content += f"   ... و {remaining} مبيعة أخرى\n"
         
         self.text_area.insert(tk.END, content)
     
@@ -284,6 +353,8 @@ class ReportsWindow:
     
     def draw_daily_chart(self, report):
         """رسم بياني للتقرير اليومي"""
+        if not self.ensure_chart():
+            return
         try:
             self.ax.clear()
             
@@ -307,8 +378,8 @@ class ReportsWindow:
                 self.ax.text(bar.get_x() + bar.get_width()/2., height + max(values)*0.01,
                            f'{value:.1f}', ha='center', va='bottom')
             
-            plt.xticks(rotation=45)
-            plt.tight_layout()
+            self.ax.tick_params(axis='x', labelrotation=45)
+            self.fig.tight_layout()
             self.canvas.draw()
             
         except Exception as e:
@@ -0,0 +1,469 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from utils import entity_cache
+from background import worker, change_bus
+from cart import CartEngine, CartJournal
+
+class SalesManagementWindow:
+    """نافذة نقطة البيع
+
+    السلة تعمل في الذاكرة بالكامل: كل مسح يحدث صفاً واحداً في الجدول
+    وإجماليات السلة، ولا تُكتب عملية البيع في قاعدة البيانات إلا عند الدفع.
+    """
+
+    # مهلة انتظار توقف الكتابة قبل البحث (بالمللي ثانية)
+    LIVE_SEARCH_DELAY = 150
+    # أقصى عدد لنتائج البحث بالاسم
+    SEARCH_LIMIT = 50
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.window = tk.Toplevel(parent) if parent else tk.Tk()
+        self.window.title("نقطة البيع")
+        self.window.geometry("1100x750")
+        self.window.configure(bg='#f0f0f0')
+
+        # إنشاء النماذج
+        # ذاكرة الباركود والفهرس مشتركان فيبقيان جاهزين عند فتح النافذة مرة أخرى
+        self.barcode_cache = entity_cache.barcode_cache()
+        self.cart = CartEngine(barcode_cache=self.barcode_cache)
+        # سجل السلة لاستعادتها بعد توقف مفاجئ
+        self.cart.journal = CartJournal(CartJournal.path_for(self.cart.db_name))
+        self.product_index = entity_cache.product_index()
+        self.live_search_job = None
+        self.search_results = {}
+        self.customer_ids = {}
+        # عملية البيع الجارية في الخلفية (السلة لا تتغير حتى تنتهي)
+        self.checkout_task = None
+        # فحص السلة السابقة في الخلفية (السلة لا تتغير حتى ينتهي)
+        self.restore_task = None
+
+        # متغيرات النموذج
+        self.setup_variables()
+
+        # إنشاء الواجهة
+        self.create_widgets()
+
+        # تحديث البيانات
+        self.refresh_data()
+        change_bus.subscribe(self.window, ('customers',), self.refresh_customers)
+
+        # استعادة سلة لم تكتمل قبل توقف البرنامج
+        self.restore_cart()
+        self.window.protocol("WM_DELETE_WINDOW", self.close_window)
+
+    def setup_variables(self):
+        """إعداد متغيرات النموذج"""
+        self.var_scan = tk.StringVar()
+        self.var_quantity = tk.StringVar(value="1")
+        self.var_customer = tk.StringVar()
+
+        # البحث بالاسم أثناء الكتابة
+        self.var_scan.trace_add('write', lambda *args: self.schedule_live_search())
+
+    def create_widgets(self):
+        """إنشاء عناصر الواجهة"""
+        # الإطار الرئيسي
+        main_frame = ttk.Frame(self.window)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # إطار المسح
+        scan_frame = ttk.LabelFrame(main_frame, text="مسح المنتجات", padding=10)
+        scan_frame.pack(fill=tk.X, pady=(0, 10))
+
+        scan_row = ttk.Frame(scan_frame)
+        scan_row.pack(fill=tk.X, pady=5)
+
+        ttk.Label(scan_row, text="الباركود أو الاسم:", font=('Arial', 12)).pack(side=tk.LEFT, padx=(0, 10))
+        self.scan_entry = ttk.Entry(scan_row, textvariable=self.var_scan, font=('Arial', 12), width=30)
+        self.scan_entry.pack(side=tk.LEFT, padx=(0, 10))
+        self.scan_entry.bind('<Return>', lambda e: self.scan_product())
+        self.scan_entry.bind('<Down>', lambda e: self.focus_search_results())
+
+        ttk.Label(scan_row, text="الكمية:", font=('Arial', 12)).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Entry(scan_row, textvariable=self.var_quantity, width=8).pack(side=tk.LEFT, padx=(0, 10))
+
+        ttk.Button(scan_row, text="إضافة", command=self.scan_product).pack(side=tk.LEFT)
+
+        # نتائج البحث بالاسم
+        self.search_tree = ttk.Treeview(scan_frame, columns=('المنتج', 'السعر', 'المخزون', 'الفئة'),
+                                        show='headings', height=4)
+        for col in ('المنتج', 'السعر', 'المخزون', 'الفئة'):
+            self.search_tree.heading(col, text=col)
+            self.search_tree.column(col, width=250 if col == 'المنتج' else 120, anchor=tk.CENTER)
+        self.search_tree.pack(fill=tk.X, pady=(5, 0))
+        self.search_tree.bind('<Double-1>', lambda e: self.add_selected_result())
+        self.search_tree.bind('<Return>', lambda e: self.add_selected_result())
+
+        # إطار السلة
+        cart_frame = ttk.LabelFrame(main_frame, text="السلة", padding=10)
+        cart_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+
+        columns = ('المنتج', 'الكمية', 'السعر', 'الخصم', 'السعر النهائي', 'الإجمالي')
+        self.cart_tree = ttk.Treeview(cart_frame, columns=columns, show='headings', height=12)
+        for col in columns:
+            self.cart_tree.heading(col, text=col)
+            self.cart_tree.column(col, width=250 if col == 'المنتج' else 110, anchor=tk.CENTER)
+        self.cart_tree.tag_configure('short', background='#f8d7da')
+
+        cart_scrollbar = ttk.Scrollbar(cart_frame, orient=tk.VERTICAL, command=self.cart_tree.yview)
+        self.cart_tree.configure(yscrollcommand=cart_scrollbar.set)
+        self.cart_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        cart_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.cart_tree.bind('<Delete>', lambda e: self.remove_line())
+
+        # أزرار السلة
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Button(buttons_frame, text="تعديل الكمية", command=self.update_line_quantity).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(buttons_frame, text="حذف البند", command=self.remove_line).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(buttons_frame, text="تفريغ السلة", command=self.clear_cart).pack(side=tk.LEFT, padx=(0, 5))
+
+        ttk.Label(buttons_frame, text="العميل:", font=('Arial', 11)).pack(side=tk.LEFT, padx=(20, 5))
+        self.customer_combo = ttk.Combobox(buttons_frame, textvariable=self.var_customer,
+                                          width=25, state='readonly')
+        self.customer_combo.pack(side=tk.LEFT)
+
+        ttk.Button(buttons_frame, text="إتمام البيع (F12)", command=self.complete_sale,
+                  style='Accent.TButton').pack(side=tk.RIGHT)
+        self.window.bind('<F12>', lambda e: self.complete_sale())
+
+        # الإجماليات
+        totals_frame = ttk.LabelFrame(main_frame, text="الإجماليات", padding=10)
+        totals_frame.pack(fill=tk.X)
+
+        self.totals_labels = {}
+        for key, label in (('item_count', "عدد القطع"), ('total_amount', "الإجمالي"),
+                           ('discount', "الخصم"), ('final_amount', "المطلوب")):
+            ttk.Label(totals_frame, text=f"{label}:", font=('Arial', 12)).pack(side=tk.LEFT, padx=(0, 5))
+            self.totals_labels[key] = ttk.Label(totals_frame, text="0", font=('Arial', 14, 'bold'))
+            self.totals_labels[key].pack(side=tk.LEFT, padx=(0, 30))
+
+        # شريط الحالة
+        self.status_bar = tk.Label(self.window, text="جاهز للمسح", relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.scan_entry.focus_set()
+
+    def refresh_data(self):
+        """تحديث البيانات"""
+        self.refresh_customers()
+        self.customer_combo.set("عميل عادي")
+
+        # تعبئة الذاكرة المؤقتة والفهرس في الخلفية حتى يكون أول مسح فورياً
+        worker.submit(self.window, self.warm_caches, key='warm', busy=False)
+
+    def warm_caches(self):
+        """تعبئة ذاكرة الباركود وفهرس البحث (في الخيط العامل)"""
+        self.barcode_cache.warm()
+        self.product_index.refresh()
+
+    def refresh_customers(self):
+        """تحديث قائمة العملاء من الذاكرة المشتركة"""
+        worker.submit(self.window, entity_cache.customers,
+                      on_success=self.display_customers, key='customers', busy=False)
+
+    def display_customers(self, customers):
+        """عرض العملاء في القائمة المنسدلة"""
+        self.customer_ids = {f"{cust['customer_id']} - {cust['name']}": cust['customer_id']
+                             for cust in customers}
+        self.customer_combo['values'] = ["عميل عادي"] + list(self.customer_ids)
+
+    def restore_cart(self):
+        """عرض السلة غير المكتملة من الجلسة السابقة إن وجدت
+
+        قراءة السجل والتحقق من آخر بيع فيه يتمان في الخيط العامل.
+        """
+        def on_done(entries):
+            self.restore_task = None
+            self.show_pending_cart(entries)
+
+        def on_error(e):
+            self.restore_task = None
+            messagebox.showerror("خطأ", f"تعذرت قراءة السلة السابقة: {str(e)}")
+
+        self.restore_task = worker.submit(self.window, self.cart.pending_entries,
+                                          on_success=on_done, on_error=on_error, key='restore')
+
+    def show_pending_cart(self, entries):
+        """سؤال المستخدم عن استعادة السلة السابقة بعد فحصها"""
+        if not entries:
+            return
+        if messagebox.askyesno("استعادة السلة",
+                               "تم العثور على سلة غير مكتملة من جلسة سابقة.\nهل تريد استعادتها؟"):
+            count = self.cart.restore(entries)
+            for line in self.cart.lines.values():
+                self.show_line(line)
+            self.status_bar.config(text=f"تمت استعادة {count} بند من الجلسة السابقة")
+        else:
+            self.cart.clear()
+
+    def close_window(self):
+        """إغلاق النافذة (السلة غير المكتملة تبقى في السجل)"""
+        if self.cart_locked():
+            return
+        self.cart.journal.close()
+        self.window.destroy()
+
+    def cart_locked(self):
+        """هل يجري حفظ البيع أو فحص السلة السابقة الآن؟ (تعديل السلة أثناءهما يُرفض)"""
+        if self.checkout_task is not None:
+            self.status_bar.config(text="جاري حفظ البيع، انتظر لحظة...")
+        elif self.restore_task is not None:
+            self.status_bar.config(text="جاري فحص السلة السابقة، انتظر لحظة...")
+        else:
+            return False
+        self.window.bell()
+        return True
+
+    def get_quantity(self):
+        """قراءة الكمية المدخلة (1 عند الخطأ)"""
+        try:
+            quantity = int(self.var_quantity.get())
+            return quantity if quantity > 0 else 1
+        except ValueError:
+            return 1
+
+    def scan_product(self):
+        """إضافة منتج بالباركود، أو أول نتيجة بحث إن لم يكن باركوداً
+
+        الباركود المخزن في الذاكرة يُضاف فوراً، وغيره يُبحث عنه في الخيط
+        العامل. الحقل يُفرغ مباشرة حتى يستمر المسح أثناء البحث.
+        """
+        code = self.var_scan.get().strip()
+        if not code or self.cart_locked():
+            return
+        quantity = self.get_quantity()
+        self.reset_scan()
+
+        found, product = self.barcode_cache.peek(code)
+        if found and product is not None:
+            self.show_line(self.cart.add_scanned(product, quantity))
+            return
+
+        # المسحات المتتالية لا تلغي بعضها (بدون مفتاح)
+        worker.submit(self.window, self.find_scanned, code,
+                      on_success=lambda result: self.add_found(code, result, quantity), busy=False)
+
+    def find_scanned(self, code):
+        """البحث عن المنتج بالباركود ثم بالاسم في فهرس الذاكرة (في الخيط العامل)
+
+        يرجع (True، المنتج) للباركود و (False، المنتج) لنتيجة البحث بالاسم، أو None.
+        """
+        product = self.barcode_cache.lookup(code)
+        if product is not None:
+            return True, product
+        results = self.product_index.search(code, 1)
+        return (False, results[0]) if results else None
+
+    def add_found(self, code, result, quantity):
+        """إضافة المنتج الذي وُجد في الخلفية إلى السلة"""
+        if result is None:
+            self.status_bar.config(text=f"لم يتم العثور على المنتج: {code}")
+            self.window.bell()
+            return
+        if self.cart_locked():
+            return
+        by_barcode, product = result
+        if by_barcode:
+            self.show_line(self.cart.add_scanned(product, quantity))
+        else:
+            self.show_line(self.cart.add_product(product, quantity))
+
+    def add_selected_result(self):
+        """إضافة المنتج المحدد من نتائج البحث"""
+        selection = self.search_tree.selection()
+        if not selection or self.cart_locked():
+            return
+        line = self.cart.add_product(self.search_results[selection[0]], self.get_quantity())
+        self.show_line(line)
+        self.reset_scan()
+        self.scan_entry.focus_set()
+
+    def reset_scan(self):
+        """تجهيز حقل المسح للمنتج التالي"""
+        self.var_scan.set("")
+        self.var_quantity.set("1")
+        # مسح الحقل يجدول بحثاً لا حاجة له
+        if self.live_search_job:
+            self.window.after_cancel(self.live_search_job)
+            self.live_search_job = None
+        self.show_search_results([])
+
+    def schedule_live_search(self):
+        """جدولة البحث بالاسم بعد توقف الكتابة (قارئ الباركود أسرع من المهلة)"""
+        if self.live_search_job:
+            self.window.after_cancel(self.live_search_job)
+        self.live_search_job = self.window.after(self.LIVE_SEARCH_DELAY, self.live_search)
+
+    def search_index(self, term):
+        """تحديث فهرس الذاكرة ثم البحث فيه (في الخيط العامل)"""
+        self.product_index.refresh()
+        return self.product_index.search(term, self.SEARCH_LIMIT)
+
+    def live_search(self):
+        """البحث بالاسم في فهرس الذاكرة"""
+        self.live_search_job = None
+        if not self.window.winfo_exists():
+            return
+        term = self.var_scan.get().strip()
+        if not term:
+            self.show_search_results([])
+            return
+
+        def on_success(products):
+            # الحقل قد يكون مُسح أو تغير بعد بدء البحث
+            if self.var_scan.get().strip() == term:
+                self.show_search_results(products)
+
+        # بحث جديد يلغي البحث السابق إن لم يكتمل بعد
+        worker.submit(self.window, self.search_index, term, on_success=on_success,
+                      key='search', busy=False)
+
+    def show_search_results(self, products):
+        """عرض نتائج البحث بالاسم"""
+        self.search_tree.delete(*self.search_tree.get_children())
+        self.search_results = {}
+        for product in products:
+            item_id = self.search_tree.insert('', tk.END, values=(
+                product['name'],
+                f"{product['selling_price']:.2f}",
+                product['stock_quantity'],
+                product['category_name'] or "غير محدد"
+            ))
+            self.search_results[item_id] = product
+
+    def focus_search_results(self):
+        """الانتقال إلى نتائج البحث بالأسهم"""
+        children = self.search_tree.get_children()
+        if children:
+            self.search_tree.focus_set()
+            self.search_tree.selection_set(children[0])
+            self.search_tree.focus(children[0])
+
+    def show_line(self, line):
+        """تحديث صف البند في الجدول والإجماليات (بدون إعادة رسم السلة)"""
+        if line is not None:
+            item_id = str(line['product_id'])
+            values = (
+                line['name'],
+                line['quantity'],
+                f"{line['selling_price']:.2f}",
+                f"{line['discount_applied'] + line['manual_discount']:.2f}",
+                f"{line['final_price']:.2f}",
+                f"{self.cart.line_total(line['product_id']):.2f}"
+            )
+            tags = ('short',) if self.cart.is_short(line['product_id']) else ()
+            if self.cart_tree.exists(item_id):
+                self.cart_tree.item(item_id, values=values, tags=tags)
+            else:
+                self.cart_tree.insert('', tk.END, iid=item_id, values=values, tags=tags)
+            self.cart_tree.see(item_id)
+
+            if tags:
+                self.status_bar.config(text=f"تنبيه: المخزون المتاح من {line['name']} هو {line['stock_quantity']} فقط")
+            else:
+                self.status_bar.config(text=f"تمت إضافة {line['name']}")
+        self.update_totals()
+
+    def update_totals(self):
+        """عرض إجماليات السلة"""
+        totals = self.cart.totals()
+        self.totals_labels['item_count'].config(text=str(totals['item_count']))
+        for key in ('total_amount', 'discount', 'final_amount'):
+            self.totals_labels[key].config(text=f"{totals[key]:.2f}")
+
+    def selected_product_id(self):
+        """معرف المنتج المحدد في السلة"""
+        selection = self.cart_tree.selection()
+        return int(selection[0]) if selection else None
+
+    def update_line_quantity(self):
+        """تعديل كمية البند المحدد إلى الكمية المدخلة"""
+        product_id = self.selected_product_id()
+        if product_id is None:
+            messagebox.showwarning("تحذير", "يرجى تحديد بند من السلة")
+            return
+        if self.cart_locked():
+            return
+        try:
+            quantity = int(self.var_quantity.get())
+        except ValueError:
+            messagebox.showerror("خطأ", "الكمية غير صحيحة")
+            return
+
+        line = self.cart.set_quantity(product_id, quantity)
+        if line is None:
+            self.cart_tree.delete(str(product_id))
+        self.show_line(line)
+        self.var_quantity.set("1")
+
+    def remove_line(self):
+        """حذف البند المحدد من السلة"""
+        product_id = self.selected_product_id()
+        if product_id is None or self.cart_locked():
+            return
+        self.cart.remove(product_id)
+        self.cart_tree.delete(str(product_id))
+        self.update_totals()
+
+    def clear_cart(self):
+        """تفريغ السلة"""
+        if self.cart_locked():
+            return
+        if self.cart.lines and not messagebox.askyesno("تأكيد", "هل تريد تفريغ السلة؟"):
+            return
+        self.cart.clear()
+        self.cart_tree.delete(*self.cart_tree.get_children())
+        self.update_totals()
+        self.scan_entry.focus_set()
+
+    def complete_sale(self):
+        """إتمام البيع وحفظه في قاعدة البيانات (في الخلفية: قد ينتظر قفل الكتابة)"""
+        if self.cart_locked():
+            return
+        if not self.cart.lines:
+            messagebox.showwarning("تحذير", "السلة فارغة")
+            return
+
+        final_amount = self.cart.totals()['final_amount']
+        customer_id = self.customer_ids.get(self.var_customer.get())
+
+        def on_error(e):
+            self.checkout_task = None
+            messagebox.showerror("خطأ", f"فشل في حفظ البيع: {str(e)}")
+            self.scan_entry.focus_set()
+
+        self.status_bar.config(text="جاري حفظ البيع...")
+        self.checkout_task = worker.submit(
+            self.window, self.cart.checkout, customer_id,
+            on_success=lambda result: self.show_checkout_result(result, final_amount),
+            on_error=on_error, key='checkout')
+
+    def show_checkout_result(self, result, final_amount):
+        """عرض نتيجة البيع بعد انتهائه في الخلفية"""
+        self.checkout_task = None
+        if result['success']:
+            self.cart_tree.delete(*self.cart_tree.get_children())
+            self.update_totals()
+            self.customer_combo.set("عميل عادي")
+            self.status_bar.config(text=f"تم حفظ البيع رقم {result['sale_id']} - المبلغ {final_amount:.2f}")
+            messagebox.showinfo("نجح", f"تم إتمام البيع رقم {result['sale_id']}\nالمبلغ المطلوب: {final_amount:.2f}")
+        else:
+            short_lines = [status for status in result['lines'] if not status['ok']]
+            for status in short_lines:
+                self.show_line(self.cart.lines.get(status['product_id']))
+            if short_lines:
+                details = "\n".join(
+                    f"{self.cart.lines[status['product_id']]['name']}: المطلوب {status['requested']} - المتاح {status['available']}"
+                    for status in short_lines if status['product_id'] in self.cart.lines)
+                messagebox.showerror("خطأ", f"المخزون غير كافٍ:\n{details}")
+            else:
+                messagebox.showerror("خطأ", result.get('error', "فشل في حفظ البيع"))
+        self.scan_entry.focus_set()
+
+# تشغيل النافذة إذا تم تشغيل الملف مباشرة
+if __name__ == "__main__":
+    app = SalesManagementWindow()
+    app.window.mainloop()
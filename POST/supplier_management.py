@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models import Supplier
-from utils import ValidationUtils
+from models import Supplier, InUseError
+from utils import ValidationUtils, entity_cache
+from treeview_helpers import KeyedTreeview
+from background import worker, change_bus
 
 class SupplierManagementWindow:
     def __init__(self, parent=None):
@@ -22,6 +24,7 @@ class SupplierManagementWindow:
         
         # تحديث القائمة
         self.refresh_suppliers_list()
+        change_bus.subscribe(self.window, ('suppliers',), self.refresh_suppliers_list)
         
         # تحديد المورد المحدد
         self.selected_supplier_id = None
@@ -76,6 +79,7 @@ class SupplierManagementWindow:
         # إنشاء Treeview
         columns = ('ID', 'اسم المورد', 'معلومات الاتصال')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
+        self.tree_rows = KeyedTreeview(self.tree)
         
         # تعريف العناوين وعرض الأعمدة
         self.tree.heading('ID', text='المعرف')
@@ -103,20 +107,21 @@ class SupplierManagementWindow:
     
     def refresh_suppliers_list(self):
         """تحديث قائمة الموردين"""
-        # مسح القائمة الحالية
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # جلب الموردين
-        suppliers = self.supplier_model.get_all_suppliers()
-        
-        for supplier in suppliers:
-            values = (
+        # جلب الموردين من الذاكرة المشتركة في الخلفية (تُجلب من قاعدة البيانات بعد أي تغيير فقط)
+        worker.submit(self.window, entity_cache.suppliers,
+                      on_success=self.display_suppliers, key='suppliers')
+    
+    def display_suppliers(self, suppliers):
+        """عرض الموردين في الجدول"""
+        # تحديث الصفوف المتغيرة فقط
+        self.tree_rows.sync(
+            (supplier['supplier_id'], (
                 supplier['supplier_id'],
                 supplier['supplier_name'],
                 supplier['contact_info'] or "غير محدد"
-            )
-            self.tree.insert('', tk.END, values=values)
+            ))
+            for supplier in suppliers
+        )
         
         # تحديث شريط الحالة
         self.status_bar.config(text=f"تم تحميل {len(suppliers)} مورد")
@@ -218,6 +223,9 @@ class SupplierManagementWindow:
                     messagebox.showerror("خطأ", "فشل في حذف المورد")
                     self.status_bar.config(text="فشل في حذف المورد")
             
+            except InUseError as e:
+                messagebox.showwarning("تنبيه", str(e))
+                self.status_bar.config(text=str(e))
             except Exception as e:
                 messagebox.showerror("خطأ", f"حدث خطأ: {str(e)}")
                 self.status_bar.config(text="حدث خطأ أثناء حذف المورد")
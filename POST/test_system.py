@@ -11,15 +11,33 @@ import unittest
 import os
 import sys
 import tempfile
+import sqlite3
+import threading
+import subprocess
 import shutil
-from datetime import datetime
+import time
+import gzip
+import lzma
+import bz2
+from datetime import datetime, timedelta
 
 # إضافة المسار الحالي لاستيراد الوحدات
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import Database
-from models import Product, Category, Supplier, Customer, Sale, Expense, ProductQuery, Invoice
-from utils import CalculationUtils, ValidationUtils, ReportGenerator, BackupManager
+import database
+from unittest import mock
+from database import Database, ConnectionManager, connection_manager, online_backup, JOURNALED_TABLES
+from models import Product, Category, Supplier, Customer, Sale, Expense, ProductQuery, Invoice, DailySummary, DataVersion, ALL_SCOPES, InUseError, data_version
+from arabic_text import normalize_arabic
+from cart import CartEngine, CartJournal
+from treeview_helpers import KeyedTreeview, PagedTreeview
+from background import BackgroundWorker, ChangeBus
+from chunk_store import ChunkStore
+from backup_catalog import BackupCatalog, DATE_FORMAT, file_checksum, select_expired
+from change_journal import JournalArchive, apply_changes, change_position
+from compression import compress_file, decompress_file, codec_for_path, extension_for
+from benchmark_startup import parse_import_times
+from utils import CalculationUtils, ValidationUtils, ReportGenerator, BackupManager, ReportCache, report_cache, ProductIndex, BarcodeCache, EntityCache
 
 class TestDatabase(unittest.TestCase):
     """اختبار قاعدة البيانات"""
@@ -31,6 +49,7 @@ class TestDatabase(unittest.TestCase):
     
     def tearDown(self):
         """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
         if os.path.exists(self.test_db):
             os.remove(self.test_db)
     
@@ -44,6 +63,242 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(conn)
         self.db.disconnect()
 
+class TestSchemaMigrations(unittest.TestCase):
+    """اختبار ترحيلات المخطط"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_migrations.db"
+        self.db = Database(self.test_db)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def get_versions(self):
+        """جلب الإصدارات المطبقة"""
+        conn = self.db.connect()
+        rows = conn.execute("SELECT version FROM schema_version ORDER BY version").fetchall()
+        self.db.disconnect()
+        return [row['version'] for row in rows]
+    
+    def test_schema_version_recorded(self):
+        """اختبار تسجيل جميع الترحيلات"""
+        expected = [version for version, _, _ in database.MIGRATIONS]
+        self.assertEqual(self.get_versions(), expected)
+    
+    def test_bootstrap_runs_once(self):
+        """اختبار عدم تكرار المخطط عند إنشاء النماذج"""
+        with mock.patch.object(Database, 'run_migrations') as run_migrations, \
+                mock.patch.object(database.os, 'stat') as stat:
+            Database(self.test_db)
+            Product(self.test_db)
+            run_migrations.assert_not_called()
+            stat.assert_not_called()
+    
+    def test_new_migration_applied(self):
+        """اختبار تطبيق ترحيل جديد على قاعدة موجودة"""
+        def add_column(db, cursor):
+            cursor.execute("ALTER TABLE expenses ADD COLUMN notes TEXT")
+        
+        latest = database.MIGRATIONS[-1][0]
+        migrations = database.MIGRATIONS + [(latest + 1, "عمود تجريبي", add_column)]
+        connection_manager.reset(self.test_db)
+        with mock.patch.object(database, 'MIGRATIONS', migrations):
+            Database(self.test_db)
+        self.assertEqual(self.get_versions()[-1], latest + 1)
+        
+        # إعادة التشغيل لا تعيد تطبيق الترحيل
+        connection_manager.reset(self.test_db)
+        with mock.patch.object(database, 'MIGRATIONS', migrations):
+            self.assertTrue(Database(self.test_db).run_migrations())
+
+class TestQueryPlans(unittest.TestCase):
+    """اختبار استخدام الفهارس في استعلامات التواريخ والفواتير"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_plans.db"
+        self.db = Database(self.test_db)
+        self.sale = Sale(self.test_db)
+        self.expense = Expense(self.test_db)
+        self.product_query = ProductQuery(self.test_db)
+        self.invoice = Invoice(self.test_db)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def explain(self, model, method, *args):
+        """تنفيذ دالة النموذج وإرجاع خطط جميع استعلاماتها"""
+        plans = []
+        original = model.execute_query
+        
+        def capture(query, params=None):
+            conn = model.get_connection()
+            rows = conn.execute("EXPLAIN QUERY PLAN " + query, params or ()).fetchall()
+            plans.append(" | ".join(row['detail'] for row in rows))
+            return original(query, params)
+        
+        with mock.patch.object(model, 'execute_query', side_effect=capture):
+            getattr(model, method)(*args)
+        return plans
+    
+    def assert_uses_index(self, plans, index_name):
+        """التأكد من استخدام الفهرس وعدم مسح الجدول"""
+        self.assertTrue(any(index_name in plan for plan in plans), plans)
+    
+    def test_sales_date_filters_use_index(self):
+        """اختبار تقارير المبيعات"""
+        plans = self.explain(self.sale, 'get_daily_sales_report', '2024-01-15')
+        self.assert_uses_index(plans, 'COVERING INDEX idx_sales_date')
+        plans = self.explain(self.sale, 'get_sales_by_date_range', '2024-01-01', '2024-01-31')
+        self.assert_uses_index(plans, 'idx_sales_date')
+    
+    def test_expense_date_filters_use_index(self):
+        """اختبار تقارير المصروفات"""
+        plans = self.explain(self.expense, 'get_total_expenses_by_date', '2024-01-15')
+        self.assert_uses_index(plans, 'COVERING INDEX idx_expenses_date')
+        plans = self.explain(self.expense, 'get_expenses_by_date_range', '2024-01-01', '2024-01-31')
+        self.assert_uses_index(plans, 'idx_expenses_date')
+    
+    def test_sale_details_lookup_uses_index(self):
+        """اختبار جلب تفاصيل الفاتورة"""
+        sale_id = self.sale.add_sale(None, 25.0, 10.0, 25.0, [])
+        plans = self.explain(self.sale, 'get_sale_by_id', sale_id)
+        self.assert_uses_index(plans, 'idx_sale_details_sale_id')
+    
+    def test_pending_queries_use_index(self):
+        """اختبار جلب الاستعلامات غير المنفذة"""
+        plans = self.explain(self.product_query, 'get_all_queries', False)
+        self.assert_uses_index(plans, 'idx_product_queries_executed_date')
+    
+    def test_half_open_range_boundaries(self):
+        """اختبار حدود الفترة الزمنية"""
+        self.expense.add_expense("قبل", 1.0, "2024-01-14T23:59:59")
+        self.expense.add_expense("بداية اليوم", 2.0, "2024-01-15")
+        self.expense.add_expense("نهاية اليوم", 4.0, "2024-01-15T23:59:59.999999")
+        self.expense.add_expense("بعد", 8.0, "2024-01-16T00:00:00")
+        
+        self.assertEqual(self.expense.get_total_expenses_by_date("2024-01-15"), 6.0)
+        rows = self.expense.get_expenses_by_date_range("2024-01-15", "2024-01-16")
+        self.assertEqual(sorted(row['amount'] for row in rows), [2.0, 4.0, 8.0])
+
+class TestReadOnlySnapshots(unittest.TestCase):
+    """اختبار قناة القراءة فقط واللقطات المتسقة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_snapshots.db"
+        self.db = Database(self.test_db)
+        self.expense = Expense(self.test_db)
+        self.reader = Expense(self.test_db, read_only=True)
+        self.expense.add_expense("إيجار", 100.0, "2024-01-15")
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_read_only_model_cannot_write(self):
+        """اختبار منع الكتابة عبر قناة القراءة"""
+        self.assertIsNone(self.reader.add_expense("ممنوع", 1.0, "2024-01-15"))
+        self.assertEqual(self.expense.get_total_expenses_by_date("2024-01-15"), 100.0)
+    
+    def test_snapshot_is_consistent_across_queries(self):
+        """اختبار ثبات اللقطة أثناء كتابة نقطة البيع"""
+        with connection_manager.snapshot(self.test_db):
+            before = self.reader.get_total_expenses_by_date("2024-01-15")
+            self.expense.add_expense("كهرباء", 50.0, "2024-01-15")
+            during = self.reader.get_total_expenses_by_date("2024-01-15")
+        after = self.reader.get_total_expenses_by_date("2024-01-15")
+        self.assertEqual(before, during)
+        self.assertEqual(after, 150.0)
+    
+    def test_reports_do_not_block_writer(self):
+        """اختبار عدم منع الكتابة أثناء تقرير مفتوح"""
+        report_generator = ReportGenerator(self.test_db)
+        with connection_manager.snapshot(self.test_db):
+            report = report_generator.generate_daily_report("2024-01-15")
+            self.assertIsNotNone(self.expense.add_expense("أثناء التقرير", 5.0, "2024-01-15"))
+        self.assertEqual(report['expenses']['total_expenses'], 100.0)
+
+class TestConnectionManager(unittest.TestCase):
+    """اختبار مدير الاتصالات المشتركة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_pool.db"
+        self.db = Database(self.test_db)
+        self.manager = ConnectionManager()
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        self.manager.close_all()
+        connection_manager.close_all(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_connection_reused_per_thread(self):
+        """اختبار إعادة استخدام نفس الاتصال داخل الخيط"""
+        first = self.manager.get_connection(self.test_db)
+        second = self.manager.get_connection(self.test_db)
+        self.assertIs(first, second)
+    
+    def test_separate_connection_per_thread(self):
+        """اختبار وجود اتصال مستقل لكل خيط"""
+        import threading
+        main_conn = self.manager.get_connection(self.test_db)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.manager.get_connection(self.test_db)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(main_conn, other[0])
+    
+    def test_reset_reopens_connection(self):
+        """اختبار إعادة فتح الاتصال بعد إعادة التهيئة"""
+        first = self.manager.get_connection(self.test_db)
+        self.manager.reset(self.test_db)
+        second = self.manager.get_connection(self.test_db)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.execute("SELECT 1").fetchone()[0], 1)
+    
+    def test_pragma_profile_applied(self):
+        """اختبار تطبيق إعدادات PRAGMA على الاتصالات الجديدة"""
+        conn = self.manager.get_connection(self.test_db)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0],
+                         database.PRAGMA_PROFILE['busy_timeout'])
+    
+    def test_configure_replaces_profile(self):
+        """اختبار تغيير ملف الإعدادات"""
+        self.manager.configure({'synchronous': 'FULL'})
+        conn = self.manager.get_connection(self.test_db)
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+    
+    def test_checkpoint_truncates_wal(self):
+        """اختبار تثبيت WAL"""
+        conn = self.manager.get_connection(self.test_db)
+        conn.execute("INSERT INTO expenses (description, amount, date) VALUES ('x', 1, '2024-01-01')")
+        conn.commit()
+        self.assertIsNotNone(self.manager.maybe_checkpoint(self.test_db))
+        busy, _, _ = self.manager.checkpoint(self.test_db, 'TRUNCATE')
+        self.assertEqual(busy, 0)
+        self.assertEqual(os.path.getsize(self.test_db + "-wal"), 0)
+    
+    def test_models_share_connection(self):
+        """اختبار مشاركة النماذج لنفس الاتصال"""
+        category = Category(self.test_db)
+        product = Product(self.test_db)
+        self.assertIs(category.get_connection(), product.get_connection())
+
 class TestModels(unittest.TestCase):
     """اختبار النماذج"""
     
@@ -193,6 +448,1455 @@ class TestModels(unittest.TestCase):
             self.assertIsNotNone(invoice_data)
             self.assertEqual(invoice_data['invoice']['customer_name'], "عميل تجريبي")
 
+class TestProductSearch(unittest.TestCase):
+    """اختبار البحث النصي عن المنتجات"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_search.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.category = Category(self.test_db)
+        self.search = ProductQuery(self.test_db, read_only=True)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def names(self, term):
+        """أسماء نتائج البحث"""
+        return [row['name'] for row in self.search.search_products(term)]
+    
+    def test_normalize_arabic(self):
+        """اختبار توحيد الحروف العربية"""
+        self.assertEqual(normalize_arabic("إضاءة"), "اضاءه")
+        self.assertEqual(normalize_arabic("مـصـبـاح"), "مصباح")
+        self.assertEqual(normalize_arabic("كَهْرُبَاء"), "كهرباء")
+        self.assertEqual(normalize_arabic("مستشفى LED"), "مستشفي led")
+    
+    def test_prefix_and_normalized_match(self):
+        """اختبار مطابقة البادئة مع اختلاف طريقة الكتابة"""
+        self.product.add_product("إضاءة ليد", "لمبة موفرة", 50.0, 30.0, 5)
+        self.product.add_product("مفتاح كهرباء", "", 15.0, 8.0, 5)
+        
+        self.assertEqual(self.names("اضاءه"), ["إضاءة ليد"])
+        self.assertEqual(self.names("مفت"), ["مفتاح كهرباء"])
+        self.assertEqual(self.names("مِفْتَاح كهر"), ["مفتاح كهرباء"])
+        self.assertEqual(self.names("غير موجود"), [])
+    
+    def test_ranking_prefers_name(self):
+        """اختبار ترتيب النتائج: التطابق في الاسم أولاً"""
+        self.product.add_product("كابل توصيل", "يناسب مفاتيح الحائط", 20.0, 10.0, 5)
+        self.product.add_product("مفاتيح ثلاثية", "", 25.0, 12.0, 5)
+        self.assertEqual(self.names("مفاتيح"), ["مفاتيح ثلاثية", "كابل توصيل"])
+    
+    def test_index_follows_changes(self):
+        """اختبار تحديث الفهرس مع تعديل وحذف المنتجات والفئات"""
+        category_id = self.category.add_category("إنارة")
+        product_id = self.product.add_product("لمبة", "", 10.0, 5.0, 5, category_id=category_id)
+        self.assertEqual(self.names("انارة"), ["لمبة"])
+        
+        self.category.update_category(category_id, "مصابيح")
+        self.assertEqual(self.names("مصابيح"), ["لمبة"])
+        self.assertEqual(self.names("انارة"), [])
+        
+        self.product.update_product(product_id, "كشاف", "", 10.0, 5.0, 5, category_id=category_id)
+        self.assertEqual(self.names("كشاف"), ["كشاف"])
+        self.assertEqual(self.names("لمبة"), [])
+        
+        self.product.delete_product(product_id)
+        self.assertEqual(self.names("كشاف"), [])
+    
+    def test_empty_term_lists_all(self):
+        """اختبار عرض جميع المنتجات عند البحث الفارغ"""
+        self.product.add_product("ب منتج", "", 10.0, 5.0, 5)
+        self.product.add_product("أ منتج", "", 10.0, 5.0, 5)
+        self.assertEqual(len(self.search.search_products("")), 2)
+        self.assertEqual(len(self.search.search_products("  ؟ ")), 2)
+
+class TestProductIndex(unittest.TestCase):
+    """اختبار فهرس البحث الفوري في الذاكرة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_product_index.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.category = Category(self.test_db)
+        self.supplier = Supplier(self.test_db)
+        self.index = ProductIndex(self.test_db)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def names(self, term):
+        """أسماء نتائج البحث"""
+        return [row['name'] for row in self.index.search(term)]
+    
+    def test_prefix_search_and_ranking(self):
+        """اختبار البحث بالبادئات وترتيب النتائج"""
+        supplier_id = self.supplier.add_supplier("مفاتيح مصر")
+        self.product.add_product("كابل", "", 20.0, 10.0, 5, supplier_id=supplier_id)
+        self.product.add_product("مفاتيح ثلاثية", "", 25.0, 12.0, 5)
+        self.product.add_product("إضاءة ليد", "", 50.0, 30.0, 5)
+        self.index.refresh()
+        
+        self.assertEqual(self.names("مفا"), ["مفاتيح ثلاثية", "كابل"])
+        self.assertEqual(self.names("اضاءه ل"), ["إضاءة ليد"])
+        self.assertEqual(self.names("مفا ثلا"), ["مفاتيح ثلاثية"])
+        self.assertEqual(self.names("غير"), [])
+    
+    def test_refresh_only_on_change(self):
+        """اختبار التحديث التدريجي عند تغير المنتجات فقط"""
+        product_id = self.product.add_product("لمبة", "", 10.0, 5.0, 5)
+        self.assertTrue(self.index.refresh())
+        self.assertFalse(self.index.refresh())
+        
+        self.product.update_product(product_id, "كشاف", "", 10.0, 5.0, 5)
+        self.assertTrue(self.index.refresh())
+        self.assertEqual(self.names("لمب"), [])
+        self.assertEqual(self.names("كشا"), ["كشاف"])
+        
+        self.product.delete_product(product_id)
+        self.index.refresh()
+        self.assertEqual(self.names("كشا"), [])
+    
+    def test_refresh_fetches_changed_rows_only(self):
+        """بعد البناء الأول يُجلب المنتج المعدل فقط لا جدول المنتجات كاملاً"""
+        for number in range(20):
+            self.product.add_product(f"منتج {number}", "", 10.0, 5.0, 5)
+        product_id = self.product.add_product("مثقاب", "", 80.0, 60.0, 5)
+        self.index.refresh()
+        
+        self.product.update_product(product_id, "مثقاب ليزر", "", 80.0, 60.0, 5)
+        with mock.patch.object(self.index.search_model, 'search_products') as search_products, \
+                mock.patch.object(self.index.search_model, 'get_product_changes',
+                                  wraps=self.index.search_model.get_product_changes) as get_changes:
+            self.assertTrue(self.index.refresh())
+        search_products.assert_not_called()
+        get_changes.assert_called_once()
+        self.assertEqual(self.names("ليز"), ["مثقاب ليزر"])
+        self.assertEqual(len(self.index), 21)
+
+    def test_category_rename_refreshes(self):
+        """اختبار تحديث الفهرس عند تغيير اسم الفئة"""
+        category_id = self.category.add_category("إنارة")
+        self.product.add_product("لمبة", "", 10.0, 5.0, 5, category_id=category_id)
+        self.index.refresh()
+        self.assertEqual(self.names("انار"), ["لمبة"])
+        
+        self.category.update_category(category_id, "مصابيح")
+        self.index.refresh()
+        self.assertEqual(self.names("انار"), [])
+        self.assertEqual(self.names("مصاب"), ["لمبة"])
+
+class TestBarcodes(unittest.TestCase):
+    """اختبار الباركود والذاكرة المؤقتة للمسح"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_barcodes.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.cache = BarcodeCache(self.test_db)
+        self.product_id = self.product.add_product("لمبة ليد", "", 10.0, 6.0, 50,
+                                                   barcode="6221000000017")
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_lookup_primary_and_pack_barcodes(self):
+        """اختبار البحث بالباركود الأساسي وباركود العبوة"""
+        self.assertTrue(self.product.add_barcode(self.product_id, "6221000000024", 12))
+        
+        product = self.product.get_by_barcode("6221000000017")
+        self.assertEqual(product['product_id'], self.product_id)
+        self.assertEqual(product['pack_quantity'], 1)
+        
+        pack = self.product.get_by_barcode("6221000000024")
+        self.assertEqual(pack['product_id'], self.product_id)
+        self.assertEqual(pack['pack_quantity'], 12)
+        
+        self.assertIsNone(self.product.get_by_barcode("0000"))
+        self.assertEqual([row['barcode'] for row in self.product.get_barcodes(self.product_id)],
+                         ["6221000000017", "6221000000024"])
+    
+    def test_peek_answers_from_memory_only(self):
+        """البحث في الذاكرة لا يستعلم: باركود جديد أو ذاكرة تنتظر الإبطال تُحال للخيط العامل"""
+        self.assertEqual(self.cache.peek("6221000000017"), (False, None))
+        self.assertEqual(self.cache.lookup("6221000000017")['product_id'], self.product_id)
+        
+        with mock.patch.object(self.cache.product_model, 'get_by_barcode') as get_by_barcode:
+            found, product = self.cache.peek("6221000000017")
+            get_by_barcode.assert_not_called()
+        self.assertTrue(found)
+        self.assertEqual(product['product_id'], self.product_id)
+        
+        # تعديل المنتج: الإبطال يحتاج استعلاماً فلا يُجاب من الذاكرة
+        self.product.update_product(self.product_id, "لمبة ليد", "", 12.0, 6.0, 50)
+        with mock.patch.object(self.cache.changes_model, 'product_changes_position') as position:
+            self.assertEqual(self.cache.peek("6221000000017"), (False, None))
+            position.assert_not_called()
+    
+    def test_barcodes_are_unique(self):
+        """اختبار منع تكرار الباركود بين المنتجات والعبوات"""
+        self.assertIsNone(self.product.add_product("آخر", "", 5.0, 3.0, 5, barcode="6221000000017"))
+        self.assertFalse(self.product.add_barcode(self.product_id, "6221000000017", 6))
+        
+        self.product.add_barcode(self.product_id, "6221000000024", 12)
+        self.assertIsNone(self.product.add_product("آخر", "", 5.0, 3.0, 5, barcode="6221000000024"))
+        
+        # المنتجات بدون باركود لا تتعارض
+        self.assertIsNotNone(self.product.add_product("أ", "", 5.0, 3.0, 5, barcode=""))
+        self.assertIsNotNone(self.product.add_product("ب", "", 5.0, 3.0, 5))
+    
+    def test_update_keeps_or_clears_barcode(self):
+        """اختبار الإبقاء على الباركود عند التحديث أو حذفه"""
+        self.product.update_product(self.product_id, "لمبة", "", 10.0, 6.0, 50)
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['barcode'], "6221000000017")
+        
+        self.product.update_product(self.product_id, "لمبة", "", 10.0, 6.0, 50, barcode="")
+        self.assertIsNone(self.product.get_product_by_id(self.product_id)['barcode'])
+    
+    def test_cache_hits_and_invalidation(self):
+        """اختبار خدمة المسح المتكرر من الذاكرة وإبطالها عند التغيير"""
+        for _ in range(5):
+            self.assertEqual(self.cache.lookup("6221000000017")['name'], "لمبة ليد")
+        self.assertIsNone(self.cache.lookup("unknown"))
+        self.assertIsNone(self.cache.lookup("unknown"))
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 5)
+        
+        # باركود غير معروف يصبح معروفاً بعد إضافته
+        self.product.add_barcode(self.product_id, "unknown", 6)
+        self.assertEqual(self.cache.lookup("unknown")['pack_quantity'], 6)
+        
+        self.product.update_product(self.product_id, "لمبة موفرة", "", 12.0, 6.0, 50)
+        self.assertEqual(self.cache.lookup("6221000000017")['selling_price'], 12.0)
+    
+    def test_sale_drops_only_sold_products(self):
+        """البيع يرفع نطاق المخزون فقط ويحذف المنتج المباع وحده من الذاكرة"""
+        other_id = self.product.add_product("كابل", "", 20.0, 12.0, 10, barcode="6221000000031")
+        self.assertEqual(self.cache.warm(), 2)
+        version = data_version.version
+        
+        sale = Sale(self.test_db).checkout(None, 10.0, 4.0, 10.0, [{
+            'product_id': self.product_id, 'quantity': 2, 'selling_price': 10.0,
+            'purchasing_price': 6.0, 'discount_applied': 0, 'manual_discount': 0, 'final_price': 10.0}])
+        self.assertTrue(sale['success'])
+        self.assertFalse(data_version.changed_since(version, ('products',)))
+        self.assertTrue(data_version.changed_since(version, ('stock',)))
+        
+        self.assertEqual(self.cache.lookup("6221000000031")['product_id'], other_id)
+        self.assertEqual(self.cache.misses, 0)
+        self.assertEqual(self.cache.lookup("6221000000017")['stock_quantity'], 48)
+        self.assertEqual(self.cache.misses, 1)
+    
+    def test_cache_warm(self):
+        """اختبار تعبئة الذاكرة دفعة واحدة"""
+        self.product.add_barcode(self.product_id, "6221000000024", 12)
+        self.assertEqual(self.cache.warm(), 2)
+        self.assertEqual(self.cache.lookup("6221000000024")['pack_quantity'], 12)
+        self.assertEqual(self.cache.misses, 0)
+
+class TestCartEngine(unittest.TestCase):
+    """اختبار محرك سلة البيع"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_cart.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.cart = CartEngine(self.test_db)
+        self.lamp_id = self.product.add_product("لمبة", "", 10.0, 6.0, 100,
+                                                discount_percentage=10, barcode="111")
+        self.cable_id = self.product.add_product("كابل", "", 20.0, 12.0, 3,
+                                                 manual_discount=2.0, barcode="222")
+        self.product.add_barcode(self.lamp_id, "333", 6)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_scan_and_totals(self):
+        """اختبار المسح وتحديث الإجماليات"""
+        self.cart.scan("111")
+        self.cart.scan("111")
+        self.cart.scan("333")
+        line = self.cart.scan("222")
+        self.assertIsNone(self.cart.scan("999"))
+        
+        self.assertEqual(self.cart.lines[self.lamp_id]['quantity'], 8)
+        self.assertEqual(line['final_price'], 18.0)
+        totals = self.cart.totals()
+        self.assertEqual(totals['total_amount'], 100.0)
+        self.assertEqual(totals['final_amount'], 90.0)
+        self.assertEqual(totals['discount'], 10.0)
+        self.assertEqual(totals['profit'], 90.0 - 8 * 6.0 - 12.0)
+        self.assertEqual(totals['item_count'], 9)
+    
+    def test_incremental_totals_match_recompute(self):
+        """اختبار تطابق الإجماليات التدريجية مع إعادة الحساب الكامل"""
+        product_ids = [self.product.add_product(f"منتج {i}", "", 1.1 + i, 0.5, 1000,
+                                                discount_percentage=i % 7)
+                       for i in range(200)]
+        for product_id in product_ids:
+            self.cart.add_product(self.product.get_product_by_id(product_id), 3)
+        for product_id in product_ids[::3]:
+            self.cart.set_quantity(product_id, 1)
+        for product_id in product_ids[::5]:
+            self.cart.remove(product_id)
+        
+        expected = sum(line['final_price'] * line['quantity'] for line in self.cart.lines.values())
+        self.assertAlmostEqual(self.cart.totals()['final_amount'], round(expected, 2), places=2)
+        self.assertEqual(self.cart.totals()['line_count'], len(self.cart.lines))
+    
+    def test_checkout_commits_once(self):
+        """اختبار حفظ البيع عند الدفع وتفريغ السلة"""
+        self.cart.scan("111")
+        self.cart.scan("222")
+        result = self.cart.checkout()
+        self.assertTrue(result['success'])
+        self.assertEqual(self.cart.lines, {})
+        
+        sale = Sale(self.test_db).get_sale_by_id(result['sale_id'])
+        self.assertEqual(sale['sale']['final_amount'], 27.0)
+        self.assertEqual(len(sale['details']), 2)
+        self.assertEqual(self.product.get_product_by_id(self.cable_id)['stock_quantity'], 2)
+    
+    def test_checkout_short_stock_keeps_cart(self):
+        """اختبار بقاء السلة عند نقص المخزون"""
+        self.cart.scan("222", 5)
+        self.assertTrue(self.cart.is_short(self.cable_id))
+        result = self.cart.checkout()
+        self.assertFalse(result['success'])
+        self.assertIn(self.cable_id, self.cart.lines)
+        self.assertEqual(self.cart.lines[self.cable_id]['stock_quantity'], 3)
+
+class TestCartJournal(unittest.TestCase):
+    """اختبار سجل السلة واستعادتها بعد التوقف"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_journal.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.journal_path = CartJournal.path_for(self.test_db)
+        self.lamp_id = self.product.add_product("لمبة", "", 10.0, 6.0, 100,
+                                                discount_percentage=10, barcode="111")
+        self.cable_id = self.product.add_product("كابل", "", 20.0, 12.0, 50, barcode="222")
+        self.switch_id = self.product.add_product("مفتاح", "", 5.0, 3.0, 50, barcode="333")
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        for path in (self.test_db, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def new_cart(self):
+        """سلة جديدة كأن البرنامج أعيد تشغيله"""
+        return CartEngine(self.test_db, journal=CartJournal(self.journal_path, fsync=False))
+    
+    def test_restore_after_restart(self):
+        """اختبار استعادة السلة بنفس البنود والترتيب والإجماليات"""
+        cart = self.new_cart()
+        cart.scan("111")
+        cart.scan("222")
+        cart.scan("333")
+        cart.scan("111", 2)
+        cart.remove(self.cable_id)
+        expected = cart.totals()
+        cart.journal.close()
+        
+        # تغيير السعر بعد المسح لا يغير السلة المستعادة
+        self.product.update_product(self.lamp_id, "لمبة", "", 99.0, 6.0, 100)
+        
+        restored = self.new_cart()
+        self.assertEqual(restored.restore(), 2)
+        self.assertEqual(list(restored.lines), [self.lamp_id, self.switch_id])
+        self.assertEqual(restored.lines[self.lamp_id]['quantity'], 3)
+        self.assertEqual(restored.totals(), expected)
+    
+    def test_truncated_on_checkout(self):
+        """اختبار تفريغ السجل بعد إتمام البيع"""
+        cart = self.new_cart()
+        cart.scan("111")
+        self.assertTrue(cart.checkout()['success'])
+        self.assertEqual(cart.journal.read(), [])
+        self.assertEqual(self.new_cart().restore(), 0)
+    
+    def test_committed_sale_not_restored(self):
+        """انقطاع بعد تثبيت البيع وقبل تفريغ السجل لا يعيد عرض السلة المباعة"""
+        cart = self.new_cart()
+        cart.scan("111")
+        cart.scan("222")
+        # تثبيت البيع دون تفريغ السلة (كأن البرنامج توقف بعد commit مباشرة)
+        totals = cart.totals()
+        result = cart.sale_model.checkout(None, totals['total_amount'], totals['profit'],
+                                          totals['final_amount'], cart.sale_items(),
+                                          before_commit=cart.journal.mark_sale)
+        self.assertTrue(result['success'])
+        cart.journal.close()
+        
+        restored = self.new_cart()
+        self.assertEqual(restored.pending_entries(), [])
+        self.assertEqual(restored.restore(), 0)
+        self.assertEqual(restored.journal.read(), [])
+    
+    def test_rolled_back_sale_restored(self):
+        """سطر بيع لم يُثبت (انقطاع قبل commit) يُتجاهل وتُستعاد البنود"""
+        cart = self.new_cart()
+        cart.scan("111", 2)
+        
+        def crash(sale_id, date):
+            cart.journal.mark_sale(sale_id, date)
+            raise OSError("انقطاع قبل التثبيت")
+        
+        totals = cart.totals()
+        with self.assertRaises(OSError):
+            cart.sale_model.checkout(None, totals['total_amount'], totals['profit'],
+                                     totals['final_amount'], cart.sale_items(), before_commit=crash)
+        self.assertEqual(Sale(self.test_db).get_all_sales(), [])
+        cart.journal.close()
+        
+        restored = self.new_cart()
+        self.assertEqual(restored.restore(), 1)
+        self.assertEqual(restored.lines[self.lamp_id]['quantity'], 2)
+    
+    def test_restore_from_checked_entries(self):
+        """الاستعادة من بنود فُحصت مسبقاً (في الخيط العامل) لا تعيد قراءة قاعدة البيانات"""
+        cart = self.new_cart()
+        cart.scan("111")
+        cart.scan("222", 3)
+        cart.journal.close()
+        
+        restored = self.new_cart()
+        entries = restored.pending_entries()
+        with mock.patch.object(restored.sale_model, 'sale_exists') as sale_exists:
+            self.assertEqual(restored.restore(entries), 2)
+            sale_exists.assert_not_called()
+        self.assertEqual(restored.lines[self.cable_id]['quantity'], 3)
+    
+    def test_partial_line_ignored(self):
+        """اختبار تجاهل سطر مقطوع بسبب انقطاع أثناء الكتابة"""
+        cart = self.new_cart()
+        cart.scan("111")
+        cart.scan("222")
+        cart.journal.close()
+        with open(self.journal_path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write('{"product_id": 3, "quan')
+        
+        restored = self.new_cart()
+        self.assertEqual(restored.restore(), 2)
+        # الاستعادة تعيد كتابة السجل بالحالة الصحيحة فقط
+        self.assertEqual(len(restored.journal.read()), 2)
+
+class TestCheckout(unittest.TestCase):
+    """اختبار مسار البيع في معاملة واحدة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_checkout.db"
+        self.db = Database(self.test_db)
+        self.sale = Sale(self.test_db)
+        self.product = Product(self.test_db)
+        self.invoice = Invoice(self.test_db)
+        self.product_id = self.product.add_product("مفتاح كهرباء", "", 20.0, 12.0, 10)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def make_item(self, quantity):
+        """بناء بند بيع"""
+        return {
+            'product_id': self.product_id,
+            'quantity': quantity,
+            'selling_price': 20.0,
+            'purchasing_price': 12.0,
+            'discount_applied': 0,
+            'manual_discount': 0,
+            'final_price': 20.0
+        }
+    
+    def test_sale_creates_details_stock_and_invoice(self):
+        """اختبار حفظ البيع وتفاصيله وفاتورته معاً"""
+        with mock.patch.object(Database, 'create_database') as create_database:
+            sale_id = self.sale.add_sale(None, 60.0, 24.0, 60.0, [self.make_item(2), self.make_item(1)])
+            create_database.assert_not_called()
+        self.assertIsNotNone(sale_id)
+        
+        sale = self.sale.get_sale_by_id(sale_id)
+        self.assertEqual(len(sale['details']), 2)
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['stock_quantity'], 7)
+        
+        invoices = [inv for inv in self.invoice.get_all_invoices() if inv['sale_id'] == sale_id]
+        self.assertEqual(len(invoices), 1)
+        self.assertEqual(invoices[0]['total_amount'], 60.0)
+        self.assertEqual(invoices[0]['customer_name'], "عميل عادي")
+    
+    def test_failed_line_rolls_back_whole_sale(self):
+        """اختبار التراجع عن البيع كاملاً عند فشل أحد البنود"""
+        bad_item = self.make_item(None)
+        sale_id = self.sale.add_sale(None, 20.0, 8.0, 20.0, [self.make_item(1), bad_item])
+        self.assertIsNone(sale_id)
+        self.assertEqual(len(self.sale.get_all_sales()), 0)
+        self.assertEqual(len(self.invoice.get_all_invoices()), 0)
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['stock_quantity'], 10)
+    
+    def test_oversell_rejected_with_line_results(self):
+        """اختبار رفض البيع عند عدم كفاية المخزون مع نتيجة لكل بند"""
+        result = self.sale.checkout(None, 220.0, 88.0, 220.0, [self.make_item(1), self.make_item(10)])
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['sale_id'])
+        self.assertEqual([line['ok'] for line in result['lines']], [True, False])
+        self.assertEqual(result['lines'][1]['available'], 9)
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['stock_quantity'], 10)
+        self.assertFalse(self.product.update_stock(self.product_id, 11))
+    
+    def test_rejected_stock_update_keeps_version(self):
+        """اختبار أن رفض تحديث المخزون لا يرفع نسخة المخزون"""
+        version = data_version.version
+        self.assertFalse(self.product.update_stock(self.product_id, 11))
+        self.assertFalse(data_version.changed_since(version, ('stock',)))
+        self.assertTrue(self.product.update_stock(self.product_id, 1))
+        self.assertTrue(data_version.changed_since(version, ('stock',)))
+    
+    def test_concurrent_registers_never_oversell(self):
+        """اختبار عدم بيع نفس الوحدات من نقطتي بيع في وقت واحد"""
+        import threading
+        results = []
+        barrier = threading.Barrier(4)
+        
+        def register():
+            sale = Sale(self.test_db)
+            barrier.wait()
+            results.append(sale.checkout(None, 60.0, 24.0, 60.0, [self.make_item(3)]))
+        
+        threads = [threading.Thread(target=register) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sum(1 for result in results if result['success']), 3)
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['stock_quantity'], 1)
+    
+    def test_reissued_invoice_gets_unique_number(self):
+        """اختبار إعادة إصدار فاتورة لنفس البيع"""
+        sale_id = self.sale.add_sale(None, 20.0, 8.0, 20.0, [self.make_item(1)])
+        invoice_id = self.invoice.create_invoice(sale_id, "عميل تجريبي")
+        self.assertIsNotNone(invoice_id)
+        numbers = {inv['invoice_number'] for inv in self.invoice.get_all_invoices()}
+        self.assertEqual(len(numbers), 2)
+
+    def test_referenced_rows_not_deleted(self):
+        """المفاتيح الأجنبية ترفض حذف منتج له مبيعات أو فئة بها منتجات برسالة واضحة"""
+        self.sale.add_sale(None, 20.0, 8.0, 20.0, [self.make_item(1)])
+        with self.assertRaises(InUseError):
+            self.product.delete_product(self.product_id)
+        self.assertIsNotNone(self.product.get_product_by_id(self.product_id))
+        
+        category = Category(self.test_db)
+        category_id = category.add_category("فئة مستخدمة")
+        self.product.add_product("منتج في الفئة", "", 5.0, 3.0, 1, category_id=category_id)
+        with self.assertRaises(InUseError):
+            category.delete_category(category_id)
+        
+        # المنتج بدون مبيعات يُحذف كالمعتاد
+        unused_id = self.product.add_product("منتج بدون مبيعات", "", 5.0, 3.0, 1)
+        self.assertTrue(self.product.delete_product(unused_id))
+    
+    def test_unknown_customer_rejected(self):
+        """البيع لعميل محذوف يفشل برسالة واضحة دون خصم المخزون"""
+        result = self.sale.checkout(9999, 20.0, 8.0, 20.0, [self.make_item(1)])
+        self.assertFalse(result['success'])
+        self.assertIn("العميل", result['error'])
+        self.assertEqual(self.product.get_product_by_id(self.product_id)['stock_quantity'], 10)
+
+class FakeTreeview:
+    """بديل بسيط لجدول Treeview للاختبار بدون شاشة"""
+    
+    def __init__(self):
+        self.items = {}
+        self.order = []
+        self.calls = 0
+    
+    def get_children(self):
+        return tuple(self.order)
+    
+    def insert(self, parent, index, iid, values, tags=()):
+        self.calls += 1
+        self.order.insert(index, iid)
+        self.items[iid] = values
+    
+    def item(self, iid, values, tags=()):
+        self.calls += 1
+        self.items[iid] = values
+    
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            self.order.remove(iid)
+            del self.items[iid]
+    
+    def move(self, iid, parent, index):
+        self.calls += 1
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+    
+    def yview_moveto(self, fraction):
+        pass
+
+class TestKeyedTreeview(unittest.TestCase):
+    """اختبار تحديث الجداول بالفروقات"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.tree = FakeTreeview()
+        self.rows = KeyedTreeview(self.tree)
+    
+    def test_initial_fill(self):
+        """اختبار التعبئة الأولى"""
+        result = self.rows.sync([(1, ("أ", 10)), (2, ("ب", 20))])
+        self.assertEqual(result, {'inserted': 2, 'updated': 0, 'deleted': 0})
+        self.assertEqual(self.tree.get_children(), ('1', '2'))
+    
+    def test_only_changes_applied(self):
+        """اختبار تطبيق الفروقات فقط"""
+        self.rows.sync([(i, (f"منتج {i}", i)) for i in range(1000)])
+        self.tree.calls = 0
+        
+        rows = [(i, (f"منتج {i}", i)) for i in range(1000) if i != 500]
+        rows[10] = (10, ("منتج معدل", 10))
+        rows.insert(20, (5000, ("منتج جديد", 0)))
+        result = self.rows.sync(rows)
+        
+        self.assertEqual(result, {'inserted': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(self.tree.calls, 3)
+        self.assertEqual(list(self.tree.get_children()), [str(key) for key, _ in rows])
+        self.assertEqual(self.tree.items['10'], ("منتج معدل", 10))
+    
+    def test_reorder(self):
+        """اختبار إعادة الترتيب عند تغير الترتيب"""
+        self.rows.sync([(1, ("ج",)), (2, ("ب",)), (3, ("أ",))])
+        result = self.rows.sync([(3, ("أ",)), (2, ("ب",)), (1, ("ج",))])
+        self.assertEqual(result['updated'], 0)
+        self.assertEqual(self.tree.get_children(), ('3', '2', '1'))
+    
+    def test_string_keys(self):
+        """اختبار المفاتيح النصية (أسماء ملفات النسخ الاحتياطية)"""
+        self.rows.sync([("backup_1.db", ("backup_1.db", "1.0"))])
+        self.rows.sync([("backup_2.db", ("backup_2.db", "2.0")), ("backup_1.db", ("backup_1.db", "1.0"))])
+        self.assertEqual(self.tree.get_children(), ("backup_2.db", "backup_1.db"))
+        self.assertEqual(len(self.rows), 2)
+
+class TestKeysetPaging(unittest.TestCase):
+    """اختبار الترقيم بمفتاح البحث والعرض الافتراضي للقوائم الكبيرة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_paging.db"
+        self.db = Database(self.test_db)
+        self.product = Product(self.test_db)
+        self.expense = Expense(self.test_db)
+        conn = self.db.connect()
+        # أسماء وأسعار مكررة لاختبار الترتيب بالمعرف عند التساوي
+        conn.executemany("""INSERT INTO products (name, selling_price, purchasing_price, stock_quantity)
+                            VALUES (?, ?, 1, 1)""",
+                         [(f"منتج {i % 50:02d}", float(i % 7)) for i in range(250)])
+        conn.executemany("INSERT INTO expenses (description, amount, date) VALUES (?, ?, ?)",
+                         [(f"مصروف {i}", float(i), f"2024-03-{i % 28 + 1:02d}T10:00:00")
+                          for i in range(120)])
+        conn.commit()
+        self.db.disconnect()
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def walk(self, fetch, id_field, page_size=40, **kwargs):
+        """المرور على جميع الصفحات للأمام"""
+        ids, seek = [], None
+        while True:
+            page = fetch(seek, True, page_size, **kwargs)
+            ids += [row[id_field] for row in page]
+            if len(page) < page_size:
+                return ids
+            seek = (page[-1]['sort_key'], page[-1][id_field])
+    
+    def test_pages_match_full_order(self):
+        """اختبار تطابق الصفحات مع الترتيب الكامل في كل اتجاه وعمود"""
+        conn = self.db.connect()
+        for sort, column, descending in (('name', 'name', False), ('selling_price', 'selling_price', True)):
+            direction = "DESC" if descending else "ASC"
+            expected = [row['product_id'] for row in conn.execute(
+                f"SELECT product_id FROM products ORDER BY {column} {direction}, product_id {direction}")]
+            self.assertEqual(self.walk(self.product.get_products_page, 'product_id',
+                                       sort=sort, descending=descending), expected)
+        self.db.disconnect()
+    
+    def test_backward_page(self):
+        """اختبار جلب الصفحة السابقة بترتيب العرض"""
+        first = self.product.get_products_page(limit=60)
+        second = self.product.get_products_page((first[-1]['sort_key'], first[-1]['product_id']), limit=30)
+        previous = self.product.get_products_page((second[0]['sort_key'], second[0]['product_id']),
+                                                  forward=False, limit=30)
+        self.assertEqual([row['product_id'] for row in previous],
+                         [row['product_id'] for row in first[30:]])
+    
+    def test_expense_filter_and_totals(self):
+        """اختبار ترقيم المصروفات داخل فترة زمنية"""
+        ids = self.walk(self.expense.get_expenses_page, 'expense_id', page_size=3,
+                        start_date="2024-03-01", end_date="2024-03-02")
+        totals = self.expense.get_expenses_totals("2024-03-01", "2024-03-02")
+        self.assertEqual(len(ids), totals['count'])
+        self.assertEqual(totals['count'], 10)
+        self.assertEqual(self.expense.get_expenses_totals()['count'], 120)
+    
+    def test_paged_treeview_window(self):
+        """اختبار بقاء عدد محدود من الصفوف في الجدول أثناء التمرير"""
+        tree = FakeTreeview()
+        pages = PagedTreeview(tree, self.product.get_products_page,
+                              lambda row: (row['product_id'], (row['name'],)),
+                              'product_id', page_size=50, max_pages=2)
+        pages.reset()
+        self.assertEqual(len(tree.get_children()), 50)
+        
+        seen = [row['product_id'] for row in pages.rows]
+        while pages.load_next():
+            seen += [row['product_id'] for row in pages.rows[-50:]]
+            self.assertLessEqual(len(tree.get_children()), 100)
+        self.assertEqual(len(set(seen)), 250)
+        self.assertFalse(pages.has_after)
+        
+        # الرجوع للخلف حتى البداية
+        while pages.load_previous():
+            pass
+        self.assertFalse(pages.has_before)
+        self.assertEqual(pages.rows[0]['product_id'], self.walk(self.product.get_products_page, 'product_id')[0])
+    
+    def test_paged_treeview_refresh_and_sort(self):
+        """اختبار التحديث في المكان والترتيب بالعمود"""
+        tree = FakeTreeview()
+        pages = PagedTreeview(tree, self.product.get_products_page,
+                              lambda row: (row['product_id'], (row['name'], row['selling_price'])),
+                              'product_id', page_size=50)
+        pages.reset()
+        pages.load_next()
+        first_id = pages.rows[0]['product_id']
+        
+        product = self.product.get_product_by_id(pages.rows[60]['product_id'])
+        self.product.update_product(product['product_id'], product['name'], "", 99.0, 1, 1)
+        tree.calls = 0
+        pages.refresh()
+        self.assertEqual(pages.rows[0]['product_id'], first_id)
+        self.assertEqual(tree.calls, 1)
+        self.assertEqual(tree.items[str(product['product_id'])][1], 99.0)
+        
+        pages.sort_by('selling_price')
+        pages.sort_by('selling_price')
+        self.assertTrue(pages.descending)
+        self.assertEqual(tree.get_children()[0], str(product['product_id']))
+
+    def test_paged_treeview_background_fetch(self):
+        """الجلب عبر الخيوط العاملة: الطلب الأحدث لنفس الجدول يلغي السابق ولا يتكرر أثناء التمرير"""
+        class WindowTree(FakeTreeview, FakeWindow):
+            def __init__(self):
+                FakeTreeview.__init__(self)
+                FakeWindow.__init__(self, ".products.tree")
+        
+        tree = WindowTree()
+        background = BackgroundWorker()
+        pages = PagedTreeview(tree, self.product.get_products_page,
+                              lambda row: (row['product_id'], (row['name'],)),
+                              'product_id', page_size=50, worker=background)
+        
+        def wait():
+            for task in tasks:
+                if not task.cancelled:
+                    task.future.result(timeout=5)
+            tree.run_after()
+        
+        try:
+            pages.reset()
+            tasks = [pages._task]
+            self.assertEqual(tree.get_children(), ())
+            wait()
+            self.assertEqual(len(tree.get_children()), 50)
+            
+            pages.on_scroll(0.0, 0.95)
+            tasks = [pages._task]
+            pages.on_scroll(0.0, 0.97)
+            self.assertIs(pages._task, tasks[0])
+            wait()
+            self.assertEqual(len(tree.get_children()), 100)
+            
+            pages.sort_by('selling_price')
+            tasks = [pages._task]
+            pages.sort_by('selling_price')
+            tasks.append(pages._task)
+            self.assertTrue(tasks[0].cancelled)
+            wait()
+            self.assertTrue(pages.descending)
+            self.assertEqual([row['product_id'] for row in pages.rows],
+                             [row['product_id'] for row in self.product.get_products_page(
+                                 limit=50, sort='selling_price', descending=True)])
+        finally:
+            background.shutdown()
+
+class FakeWindow:
+    """بديل بسيط لنافذة Tkinter للاختبار بدون شاشة (after تُنفذ يدوياً)"""
+    
+    def __init__(self, name=".window"):
+        self.name = name
+        self.exists = True
+        self.cursor = ""
+        self.scheduled = []
+    
+    def __str__(self):
+        return self.name
+    
+    def nametowidget(self, name):
+        return self
+    
+    def winfo_toplevel(self):
+        return self
+    
+    def winfo_exists(self):
+        return self.exists
+    
+    def config(self, cursor):
+        self.cursor = cursor
+    
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+    
+    def run_after(self):
+        """تنفيذ الاستدعاءات المجدولة حتى تتوقف الجدولة"""
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+class TestBackgroundWorker(unittest.TestCase):
+    """اختبار تنفيذ الاستدعاءات في الخلفية وإعادة النتائج لخيط الواجهة"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.worker = BackgroundWorker()
+        self.window = FakeWindow()
+        self.results = []
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        self.worker.shutdown()
+    
+    def wait(self, *tasks):
+        """انتظار انتهاء الطلبات ثم تسليم نتائجها"""
+        for task in tasks:
+            try:
+                task.future.result(timeout=5)
+            except Exception:
+                pass
+        self.window.run_after()
+    
+    def test_result_delivered_with_busy_cursor(self):
+        """النتيجة تُسلم عبر after ومؤشر الانشغال يظهر ثم يختفي"""
+        task = self.worker.submit(self.window, sum, [1, 2, 3], on_success=self.results.append)
+        self.assertEqual(self.window.cursor, "watch")
+        self.assertEqual(self.results, [])
+        
+        self.wait(task)
+        self.assertEqual(self.results, [6])
+        self.assertEqual(self.window.cursor, "")
+        self.assertEqual(self.window.scheduled, [])
+    
+    def test_shutdown_waits_for_running_task(self):
+        """الإيقاف ينتظر الطلب الجاري (حتى المهلة) ويلغي ما لم يبدأ"""
+        started = threading.Event()
+        release = threading.Event()
+        finished = []
+        
+        def slow():
+            started.set()
+            release.wait(5)
+            finished.append(True)
+        
+        self.worker.max_workers = 1
+        running = self.worker.submit(self.window, slow)
+        queued = self.worker.submit(self.window, finished.append, False)
+        started.wait(5)
+        self.assertFalse(self.worker.shutdown(timeout=0.05))
+        self.assertTrue(queued.future.cancelled())
+        
+        threading.Timer(0.1, release.set).start()
+        self.assertTrue(self.worker.shutdown(timeout=5))
+        self.assertTrue(running.future.done())
+        self.assertEqual(finished, [True])
+    
+    def test_stale_request_cancelled(self):
+        """طلب جديد بنفس المفتاح يلغي نتيجة الطلب السابق"""
+        release = threading.Event()
+        
+        def slow(value):
+            release.wait(5)
+            return value
+        
+        first = self.worker.submit(self.window, slow, "قديم", on_success=self.results.append, key='search')
+        second = self.worker.submit(self.window, slow, "جديد", on_success=self.results.append, key='search')
+        self.assertTrue(first.cancelled)
+        release.set()
+        
+        self.wait(first, second)
+        self.assertEqual(self.results, ["جديد"])
+        self.assertEqual(self.window.cursor, "")
+    
+    def test_error_delivered(self):
+        """الاستثناء في الخيط العامل يصل إلى on_error"""
+        task = self.worker.submit(self.window, int, "abc", on_error=self.results.append)
+        self.wait(task)
+        self.assertIsInstance(self.results[0], ValueError)
+    
+    def test_progress_delivered(self):
+        """قيم التقدم من الخيط العامل تصل إلى on_progress قبل النتيجة"""
+        def copy_pages(total, progress):
+            for copied in range(1, total + 1):
+                progress(copied, total)
+            return total
+        
+        events = []
+        task = self.worker.submit(self.window, copy_pages, 3, on_success=lambda result: events.append(result),
+                                  on_progress=lambda copied, total: events.append((copied, total)))
+        self.wait(task)
+        self.assertEqual(events, [(1, 3), (2, 3), (3, 3), 3])
+    
+    def test_closed_window_ignored(self):
+        """لا تُعرض النتيجة بعد إغلاق النافذة"""
+        task = self.worker.submit(self.window, sum, [1], on_success=self.results.append)
+        self.window.exists = False
+        self.wait(task)
+        self.assertEqual(self.results, [])
+    
+    def test_model_call_on_worker_thread(self):
+        """استدعاءات النماذج تعمل من الخيط العامل باتصاله الخاص"""
+        test_db = "test_background.db"
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        Database(test_db)
+        try:
+            Category(test_db).add_category("أدوات الخلفية")
+            task = self.worker.submit(self.window, Category(test_db, read_only=True).get_all_categories,
+                                      on_success=self.results.append)
+            self.wait(task)
+            self.assertIn("أدوات الخلفية", [row['category_name'] for row in self.results[0]])
+        finally:
+            self.worker.shutdown()
+            connection_manager.close_all(test_db)
+            os.remove(test_db)
+
+class TestSavedQueriesWindow(unittest.TestCase):
+    """اختبار نافذة الطلبات المحفوظة بدون شاشة"""
+    
+    def setUp(self):
+        """إعداد قاعدة بيانات اختبار بطلب محفوظ"""
+        self.test_db = "test_saved_queries.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        Database(self.test_db)
+        ProductQuery(self.test_db).add_query(None, "مفك براغي", 15.0, 2)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.close_all(self.test_db)
+        os.remove(self.test_db)
+    
+    def test_filter_queries_loads_in_background(self):
+        """بناء النافذة يجلب الطلبات عبر نموذج القراءة ويعرضها"""
+        import product_inquiry
+        
+        class QueriesWindow(FakeWindow):
+            def title(self, text):
+                pass
+            
+            def geometry(self, size):
+                pass
+            
+            def configure(self, **options):
+                pass
+        
+        window = QueriesWindow()
+        shown = []
+        submitted = []
+        submit = product_inquiry.worker.submit
+        
+        def tracked_submit(*args, **kwargs):
+            task = submit(*args, **kwargs)
+            submitted.append(task)
+            return task
+        
+        with mock.patch.object(product_inquiry.tk, 'Toplevel', return_value=window), \
+                mock.patch.object(product_inquiry, 'ProductQuery',
+                                  lambda **kwargs: ProductQuery(self.test_db, **kwargs)), \
+                mock.patch.object(product_inquiry.SavedQueriesWindow, 'create_widgets'), \
+                mock.patch.object(product_inquiry.SavedQueriesWindow, 'display_queries', shown.append), \
+                mock.patch.object(product_inquiry.worker, 'submit', tracked_submit):
+            saved = product_inquiry.SavedQueriesWindow(None)
+            self.assertTrue(saved.search_model.read_only)
+            saved.filter_queries(False)
+            for task in submitted:
+                task.future.result(timeout=5)
+            window.run_after()
+        
+        # التصفية الثانية تلغي نتيجة الأولى (نفس المفتاح)
+        self.assertEqual(len(shown), 1)
+        self.assertEqual([query['product_name'] for query in shown[0]], ["مفك براغي"])
+
+class TestEntityCache(unittest.TestCase):
+    """اختبار الذاكرة المشتركة للجداول الصغيرة"""
+    
+    def setUp(self):
+        """إعداد قاعدة بيانات للاختبار"""
+        self.test_db = "test_entities.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        Database(self.test_db)
+        self.cache = EntityCache()
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.close_all(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_cached_until_write(self):
+        """القائمة تُجلب مرة واحدة ثم تُبطل بعد الكتابة في نطاقها فقط"""
+        categories = self.cache.categories(self.test_db)
+        self.assertIs(self.cache.categories(self.test_db), categories)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        
+        # كتابة في نطاق آخر لا تبطل الفئات
+        Customer(self.test_db).add_customer("عميل الذاكرة")
+        self.assertIs(self.cache.categories(self.test_db), categories)
+        self.assertIn("عميل الذاكرة", [row['name'] for row in self.cache.customers(self.test_db)])
+        
+        Category(self.test_db).add_category("فئة الذاكرة")
+        names = [row['category_name'] for row in self.cache.categories(self.test_db)]
+        self.assertIn("فئة الذاكرة", names)
+        self.assertEqual(len(names), len(categories) + 1)
+    
+    def test_shared_indexes(self):
+        """فهرس البحث وذاكرة الباركود نسخة واحدة لكل قاعدة بيانات"""
+        self.assertIs(self.cache.product_index(self.test_db), self.cache.product_index(self.test_db))
+        self.assertIs(self.cache.barcode_cache(self.test_db), self.cache.barcode_cache(self.test_db))
+        self.assertIsNot(self.cache.product_index(self.test_db), self.cache.barcode_cache(self.test_db))
+
+class TestChangeBus(unittest.TestCase):
+    """اختبار إشعار النوافذ بتغير البيانات"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.versions = DataVersion()
+        self.bus = ChangeBus(self.versions)
+        self.products_window = FakeWindow(".products")
+        self.sales_window = FakeWindow(".sales")
+        self.calls = []
+        self.bus.subscribe(self.products_window, ('categories', 'suppliers'),
+                           lambda: self.calls.append('lookups'))
+        self.bus.subscribe(self.sales_window, ('customers',), lambda: self.calls.append('customers'))
+    
+    def test_only_changed_scopes_notified(self):
+        """يُستدعى المشتركون في النطاقات المتغيرة فقط ومرة واحدة لكل تغيير"""
+        self.assertEqual(self.bus.dispatch(), 0)
+        
+        self.versions.bump('suppliers')
+        self.versions.bump('categories')
+        self.assertEqual(self.bus.dispatch(), 1)
+        self.assertEqual(self.calls, ['lookups'])
+        self.assertEqual(self.bus.dispatch(), 0)
+        
+        # استعادة نسخة احتياطية تغير جميع النطاقات
+        self.versions.bump(ALL_SCOPES)
+        self.bus.dispatch()
+        self.assertEqual(sorted(self.calls), ['customers', 'lookups', 'lookups'])
+    
+    def test_closed_window_unsubscribed(self):
+        """اشتراكات النوافذ المغلقة تُحذف ويتوقف الفحص الدوري"""
+        self.sales_window.exists = False
+        self.versions.bump('customers')
+        self.assertEqual(self.bus.dispatch(), 0)
+        
+        self.bus.unsubscribe(self.products_window)
+        self.products_window.run_after()
+        self.assertFalse(self.bus._polling)
+
+    def test_other_process_writes_detected(self):
+        """كتابات عملية أخرى على نفس الملف تُبطل نطاقها فقط، واستبدال الملف يُبطل الكل"""
+        test_db = "test_watch_versions.db"
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        Database(test_db)
+        try:
+            self.versions.watch(test_db)
+            version = self.versions.version
+            self.assertEqual(self.bus.dispatch(), 0)
+            
+            # اتصال مستقل يمثل نقطة بيع أخرى
+            other = sqlite3.connect(test_db)
+            other.execute("INSERT INTO customers (name) VALUES ('عميل من جهاز آخر')")
+            other.commit()
+            other.close()
+            self.assertEqual(self.bus.dispatch(), 1)
+            self.assertEqual(self.calls, ['customers'])
+            self.assertFalse(self.versions.changed_since(version, ('products', 'sales')))
+            
+            # استبدال الملف (استعادة من عملية أخرى)
+            version = self.versions.version
+            shutil.copy(test_db, test_db + ".copy")
+            os.replace(test_db + ".copy", test_db)
+            self.assertTrue(self.versions.changed_since(version, ('products',)))
+        finally:
+            self.versions._close_watch()
+            connection_manager.close_all(test_db)
+            os.remove(test_db)
+
+class TestStartupImports(unittest.TestCase):
+    """اختبار تأجيل تحميل وحدات النوافذ عند تشغيل البرنامج"""
+    
+    def test_windows_not_imported_at_startup(self):
+        """استيراد البرنامج الرئيسي لا يحمل النوافذ ولا matplotlib"""
+        code = ("import sys, main_application; "
+                "print('LOADED:' + ','.join(m for m in list(main_application.WINDOW_MODULES.values()) + "
+                "['matplotlib', 'tkcalendar'] if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "LOADED:")
+    
+    def test_parse_import_times(self):
+        """تحليل مخرجات -X importtime حسب مستوى التداخل"""
+        output = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _json
+import time:      2000 |      30500 |   background
+import time:       400 |      50000 | main_application
+"""
+        self.assertEqual(parse_import_times(output, depth=1),
+                         [('main_application', 50.0), ('background', 30.5)])
+
+class TestChangeJournal(unittest.TestCase):
+    """اختبار سجل التغييرات وإعادة تطبيقه"""
+    
+    def setUp(self):
+        """قاعدة بيانات ونسخة أساسية منها"""
+        self.test_db = "test_journal.db"
+        self.base_db = "test_journal_base.db"
+        Database(self.test_db)
+        online_backup(self.test_db, self.base_db)
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive = JournalArchive(self.temp_dir)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        for path in (self.test_db, self.base_db):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(self.temp_dir)
+    
+    def table_rows(self, conn):
+        """محتوى الجداول المسجلة والجداول التي تحدثها المشغلات"""
+        tables = list(JOURNALED_TABLES) + ['daily_summary']
+        return {table: [tuple(row) for row in conn.execute(f"SELECT * FROM {table} ORDER BY 1")]
+                for table in tables}
+    
+    def test_replay_matches_live_database(self):
+        """تطبيق السجل على النسخة الأساسية ينتج نفس البيانات (إضافة وتعديل وحذف وتغيير معرف)"""
+        product_model = Product(self.test_db)
+        first = product_model.add_product("منتج أول", "", 100.0, 80.0, 5)
+        second = product_model.add_product("منتج ثان", "", 50.0, 40.0, 5)
+        expense_model = Expense(self.test_db)
+        kept = expense_model.add_expense("مصروف", 10.0)
+        removed = expense_model.add_expense("محذوف", 20.0)
+        expense_model.delete_expense(removed)
+        conn = connection_manager.get_connection(self.test_db)
+        conn.execute("UPDATE expenses SET amount = 15.0 WHERE expense_id = ?", (kept,))
+        conn.execute("UPDATE expenses SET expense_id = 500 WHERE expense_id = ?", (kept,))
+        conn.execute("UPDATE products SET selling_price = selling_price + 1, name = 'منتج معدل' "
+                     "WHERE product_id = ?", (first,))
+        conn.execute("DELETE FROM products WHERE product_id = ?", (second,))
+        conn.commit()
+        self.assertIsNotNone(Sale(self.test_db).add_sale(None, 100.0, 20.0, 100.0, [{
+            'product_id': first, 'quantity': 1, 'selling_price': 100.0, 'purchasing_price': 80.0,
+            'discount_applied': 0, 'manual_discount': 0, 'final_price': 100.0}]))
+        
+        self.assertGreater(self.archive.archive(self.test_db), 0)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM changelog").fetchone()[0], 0)
+        
+        base = sqlite3.connect(self.base_db)
+        try:
+            count = apply_changes(base, list(self.archive.changes(change_position(base))))
+            self.assertEqual(count, self.archive.last_archived())
+            self.assertEqual(self.table_rows(base), self.table_rows(conn))
+            self.assertEqual(change_position(base), change_position(conn))
+            # فهرس البحث يُحدث بالمشغلات أثناء التطبيق
+            self.assertEqual(base.execute("SELECT COUNT(*) FROM products_fts").fetchone()[0],
+                             conn.execute("SELECT COUNT(*) FROM products_fts").fetchone()[0])
+            # المشغلات تعود بعد التطبيق
+            Expense(self.base_db).add_expense("بعد التطبيق", 1.0)
+            self.assertEqual(change_position(base), count + 1)
+        finally:
+            base.close()
+            connection_manager.reset(self.base_db)
+    
+    def test_truncate_after_starts_new_timeline(self):
+        """التغييرات بعد موضع الاستعادة تُنقل جانباً ولا تُطبق"""
+        # ملف أرشيف لكل أرشفة
+        self.archive.SEGMENT_BYTES = 1
+        expense_model = Expense(self.test_db)
+        for index in range(4):
+            expense_model.add_expense(f"مصروف {index}", 1.0)
+            self.archive.archive(self.test_db)
+        
+        self.archive.truncate_after(2)
+        self.assertEqual(self.archive.last_archived(), 2)
+        self.assertEqual([change[0] for change in self.archive.changes(0)], [1, 2])
+        self.assertTrue([name for name in os.listdir(self.temp_dir) if name.startswith("abandoned_")])
+        self.assertEqual(self.archive.prune_before(2), 2)
+        self.assertEqual(self.archive.segments(), [])
+
+    def test_archive_appends_to_last_segment(self):
+        """الأرشفة الدورية تضيف لآخر ملف حتى يبلغ حده، وآخر رقم يُقرأ من ملف الحالة"""
+        expense_model = Expense(self.test_db)
+        for index in range(3):
+            expense_model.add_expense(f"مصروف {index}", 1.0)
+            self.assertEqual(self.archive.archive(self.test_db), 1)
+        self.assertEqual([segment[:2] for segment in self.archive.segments()], [(1, 3)])
+        
+        with mock.patch.object(self.archive, 'segments', side_effect=AssertionError):
+            self.assertEqual(self.archive.last_archived(), 3)
+        
+        # بعد بلوغ الحد يبدأ ملف جديد
+        self.archive.SEGMENT_BYTES = 1
+        expense_model.add_expense("مصروف جديد", 1.0)
+        self.archive.archive(self.test_db)
+        self.assertEqual([segment[:2] for segment in self.archive.segments()], [(1, 3), (4, 4)])
+        self.assertEqual([change[0] for change in self.archive.changes(0)], [1, 2, 3, 4])
+    
+    def test_interrupted_append_keeps_longest_segment(self):
+        """ملف سابق تركه انقطاع أثناء الإضافة يُحذف ولا تتكرر تغييراته"""
+        expense_model = Expense(self.test_db)
+        for index in range(2):
+            expense_model.add_expense(f"مصروف {index}", 1.0)
+            self.archive.archive(self.test_db)
+        self.archive._write_segment(list(self.archive.changes(0))[:1])
+        
+        self.assertEqual([segment[:2] for segment in self.archive.segments()], [(1, 2)])
+        self.assertEqual(len(os.listdir(self.temp_dir)), 2)
+        self.assertEqual(self.archive.last_archived(), 2)
+        self.assertEqual([change[0] for change in self.archive.changes(0)], [1, 2])
+
+class TestBackupCatalog(unittest.TestCase):
+    """اختبار فهرس النسخ وسياسة الاحتفاظ"""
+    
+    def entry(self, name, created):
+        """بيانات نسخة للاختبار"""
+        return {'name': name, 'created': created.strftime(DATE_FORMAT)}
+    
+    def test_catalog_sorted_newest_first(self):
+        """الفهرس يحفظ النسخ مرتبة ويستبدل بيانات الاسم المكرر"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            catalog = BackupCatalog(os.path.join(temp_dir, "catalog.json"))
+            self.assertFalse(catalog.exists())
+            self.assertEqual(catalog.entries(), [])
+            catalog.add(self.entry("old", datetime(2024, 1, 1)))
+            catalog.add(self.entry("new", datetime(2024, 3, 1)))
+            catalog.add(dict(self.entry("old", datetime(2024, 2, 1)), size=10))
+            self.assertEqual([e['name'] for e in catalog.entries()], ["new", "old"])
+            self.assertEqual(catalog.get("old")['size'], 10)
+            catalog.remove("new")
+            self.assertEqual([e['name'] for e in catalog.entries()], ["old"])
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    def test_gfs_retention(self):
+        """نسخة كل ساعة لمدة 90 يوماً: يبقى 24 ساعية و 7 يومية و 4 أسبوعية و 3 شهرية"""
+        now = datetime(2024, 3, 31, 23, 0)
+        entries = [self.entry(f"b{hour}", now - timedelta(hours=hour)) for hour in range(90 * 24)]
+        expired = set(select_expired(entries))
+        kept = [e for e in entries if e['name'] not in expired]
+        
+        self.assertIn("b0", [e['name'] for e in kept])
+        created = [datetime.strptime(e['created'], DATE_FORMAT) for e in kept]
+        self.assertEqual(len([c for c in created if now - c < timedelta(hours=24)]), 24)
+        self.assertEqual(len({c.date() for c in created}), len(kept) - 23)
+        self.assertEqual({c.strftime('%Y-%m') for c in created}, {'2024-01', '2024-02', '2024-03'})
+        self.assertLess(len(kept), 24 + 7 + 4 + 12)
+        
+        # سياسة يومية فقط: نسخة واحدة (الأحدث) لكل يوم
+        expired = set(select_expired(entries, {'daily': 2}))
+        self.assertEqual([e['name'] for e in entries if e['name'] not in expired], ["b0", "b24"])
+
+class TestCompression(unittest.TestCase):
+    """اختبار ضغط النسخ الاحتياطية بالتدفق"""
+    
+    def setUp(self):
+        """ملف مصدر أكبر من عدة كتل"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.temp_dir, "source.db")
+        self.data = (b"sales and expenses " * 2000 + os.urandom(1000)) * 5
+        with open(self.source, 'wb') as source_file:
+            source_file.write(self.data)
+    
+    def tearDown(self):
+        """حذف المجلد المؤقت"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_round_trip_all_codecs(self):
+        """الضغط المتوازي ثم فك الضغط يعيد نفس البيانات لكل الأنواع"""
+        modules = {'gzip': gzip, 'lzma': lzma, 'bz2': bz2}
+        for codec, module in modules.items():
+            target = os.path.join(self.temp_dir, "backup.db" + extension_for(codec))
+            progress = []
+            size, compressed = compress_file(self.source, target, codec,
+                                             lambda done, total: progress.append((done, total)),
+                                             workers=3, block_size=4096)
+            self.assertEqual(size, len(self.data))
+            self.assertLess(compressed, size)
+            self.assertEqual(progress[-1], (size, size))
+            self.assertFalse(os.path.exists(target + ".partial"))
+            self.assertEqual(codec_for_path(target), codec)
+            
+            # تيارات قياسية متتابعة يفكها أي برنامج ضغط عادي
+            with open(target, 'rb') as compressed_file:
+                self.assertEqual(module.decompress(compressed_file.read()), self.data)
+            
+            restored = os.path.join(self.temp_dir, "restored.db")
+            self.assertEqual(decompress_file(target, restored), len(self.data))
+            with open(restored, 'rb') as restored_file:
+                self.assertEqual(restored_file.read(), self.data)
+    
+    def test_failed_decompress_keeps_target(self):
+        """فك ضغط ملف تالف لا يمس الملف الهدف ولا يترك ملفاً مؤقتاً"""
+        target = os.path.join(self.temp_dir, "backup.db.gz")
+        compress_file(self.source, target)
+        with open(target, 'r+b') as compressed_file:
+            compressed_file.truncate(os.path.getsize(target) // 2)
+        
+        restored = os.path.join(self.temp_dir, "restored.db")
+        with open(restored, 'wb') as restored_file:
+            restored_file.write(b"current")
+        with self.assertRaises(EOFError):
+            decompress_file(target, restored)
+        with open(restored, 'rb') as restored_file:
+            self.assertEqual(restored_file.read(), b"current")
+        self.assertFalse(os.path.exists(restored + ".partial"))
+        
+        with self.assertRaises(ValueError):
+            decompress_file(self.source, restored)
+
+class TestChunkStore(unittest.TestCase):
+    """اختبار مخزن النسخ التزايدية"""
+    
+    def setUp(self):
+        """إعداد مجلد مؤقت وملف للتخزين"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = ChunkStore(os.path.join(self.temp_dir, "store"), chunk_size=1024)
+        self.source = os.path.join(self.temp_dir, "source.db")
+        self.data = bytearray(os.urandom(8 * 1024))
+        self.write_source()
+    
+    def tearDown(self):
+        """حذف المجلد المؤقت"""
+        shutil.rmtree(self.temp_dir)
+    
+    def write_source(self):
+        """كتابة محتوى الملف المصدر"""
+        with open(self.source, 'wb') as source_file:
+            source_file.write(self.data)
+    
+    def chunk_files(self):
+        """عدد ملفات الأجزاء المخزنة"""
+        return sum(len(files) for _, _, files in os.walk(self.store.chunks_dir))
+    
+    def test_unchanged_pages_stored_once(self):
+        """النسخة التالية لا تكتب إلا الأجزاء المتغيرة"""
+        first = self.store.store_file(self.source, "first")
+        self.assertEqual(first['new_bytes'], len(self.data))
+        self.assertEqual(self.store.store_file(self.source, "same")['new_bytes'], 0)
+        
+        self.data[5000] ^= 0xFF
+        self.write_source()
+        changed = self.store.store_file(self.source, "changed")
+        self.assertEqual(changed['new_bytes'], 1024)
+        self.assertEqual(self.chunk_files(), 9)
+    
+    def test_restore_reassembles_snapshot(self):
+        """إعادة التجميع تنتج نفس الملف مع التحقق من البصمة"""
+        self.store.store_file(self.source, "first")
+        original = bytes(self.data)
+        self.data[0] ^= 0xFF
+        self.write_source()
+        self.store.store_file(self.source, "second")
+        
+        target = os.path.join(self.temp_dir, "restored.db")
+        self.store.restore_to("first", target)
+        with open(target, 'rb') as restored:
+            self.assertEqual(restored.read(), original)
+        
+        # جزء تالف يُكتشف عند الاستعادة
+        with open(self.store.chunk_path(self.store.load_manifest("first")['chunks'][0]), 'wb') as chunk:
+            chunk.write(b"corrupt")
+        with self.assertRaises(ValueError):
+            self.store.restore_to("first", target)
+    
+    def test_refcount_delete(self):
+        """الأجزاء المشتركة تبقى حتى حذف آخر نسخة تستخدمها"""
+        self.store.store_file(self.source, "first")
+        self.data[0] ^= 0xFF
+        self.write_source()
+        self.store.store_file(self.source, "second")
+        
+        self.assertEqual(self.store.delete("first"), 1)
+        self.assertEqual(self.chunk_files(), 8)
+        self.assertEqual(self.store.delete("second"), 8)
+        self.assertEqual(self.chunk_files(), 0)
+        self.assertEqual(self.store.list_manifests(), [])
+    
+    def test_existing_name_not_overwritten(self):
+        """الاسم الموجود يُرفض أو يأخذ رقماً ولا تُحسب أجزاؤه مرتين"""
+        self.store.store_file(self.source, "snapshot")
+        with self.assertRaises(FileExistsError):
+            self.store.store_file(self.source, "snapshot")
+        self.assertEqual(self.store.store_file(self.source, "snapshot", unique=True)['name'], "snapshot_2")
+        self.assertEqual(self.store.store_file(self.source, "snapshot", unique=True)['name'], "snapshot_3")
+        
+        for name in ("snapshot", "snapshot_2", "snapshot_3"):
+            self.store.delete(name)
+        self.assertEqual(self.chunk_files(), 0)
+        self.assertEqual(self.store._load_refcounts(), {})
+    
+    def test_collect_garbage(self):
+        """إعادة الحساب تحذف الأجزاء اليتيمة بعد انقطاع"""
+        self.store.store_file(self.source, "first")
+        # انقطاع بعد كتابة الأجزاء وقبل ملف الوصف
+        os.remove(self.store.manifest_path("first"))
+        self.assertEqual(self.store.collect_garbage(), 8)
+        self.assertEqual(self.chunk_files(), 0)
+
 class TestCalculations(unittest.TestCase):
     """اختبار الحسابات"""
     
@@ -282,6 +1986,225 @@ class TestValidation(unittest.TestCase):
         self.assertFalse(ValidationUtils.validate_required_field("   "))
         self.assertFalse(ValidationUtils.validate_required_field(None))
 
+class TestReportGenerator(unittest.TestCase):
+    """اختبار مولد التقارير"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_reports.db"
+        self.db = Database(self.test_db)
+        conn = connection_manager.get_connection(self.test_db)
+        conn.executemany(
+            "INSERT INTO sales (customer_id, date, total_amount, profit, final_amount) VALUES (NULL, ?, ?, ?, ?)",
+            [("2024-02-01T10:00:00", 100.0, 30.0, 95.0),
+             ("2024-02-07T18:30:00", 50.0, 20.0, 50.0),
+             ("2024-02-08T09:00:00", 40.0, 10.0, 40.0),
+             ("2024-03-01T09:00:00", 70.0, 25.0, 70.0)])
+        conn.executemany("INSERT INTO expenses (description, amount, date) VALUES (?, ?, ?)",
+                         [("إيجار", 15.0, "2024-02-03"), ("كهرباء", 5.0, "2024-02-20T12:00:00")])
+        conn.commit()
+        self.report_generator = ReportGenerator(self.test_db)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_weekly_report_totals(self):
+        """اختبار إجماليات التقرير الأسبوعي"""
+        with mock.patch.object(Sale, 'get_sales_by_date_range') as get_rows:
+            report = self.report_generator.generate_weekly_report("2024-02-01")
+            get_rows.assert_not_called()
+        self.assertEqual(report['sales']['total_sales'], 2)
+        self.assertEqual(report['sales']['total_revenue'], 150.0)
+        self.assertEqual(report['sales']['total_final_amount'], 145.0)
+        self.assertEqual(report['expenses']['total_expenses'], 15.0)
+        self.assertEqual(report['net_profit'], 35.0)
+    
+    def test_monthly_report_totals(self):
+        """اختبار إجماليات التقرير الشهري"""
+        report = self.report_generator.generate_monthly_report(2024, 2)
+        self.assertEqual(report['sales']['total_sales'], 3)
+        self.assertEqual(report['sales']['total_profit'], 60.0)
+        self.assertEqual(report['expenses']['total_expenses'], 20.0)
+        self.assertEqual(report['net_profit'], 40.0)
+    
+    def test_empty_period_returns_zeros(self):
+        """اختبار فترة بدون مبيعات"""
+        report = self.report_generator.generate_monthly_report(2023, 12)
+        self.assertEqual(report['sales']['total_revenue'], 0)
+        self.assertEqual(report['net_profit'], 0)
+        daily = self.report_generator.generate_daily_report("2023-12-01")
+        self.assertEqual(daily['sales']['total_revenue'], 0)
+    
+    def test_details_fetched_by_page(self):
+        """اختبار جلب التفاصيل على صفحات"""
+        report = self.report_generator.generate_monthly_report(2024, 2)
+        first = self.report_generator.get_sales_details(report['start_date'], report['end_date'], limit=2)
+        second = self.report_generator.get_sales_details(report['start_date'], report['end_date'],
+                                                         limit=2, offset=2)
+        self.assertEqual([row['final_amount'] for row in first], [40.0, 50.0])
+        self.assertEqual([row['final_amount'] for row in second], [95.0])
+
+    def test_details_read_in_totals_snapshot(self):
+        """بيع يُسجل بين قراءة الإجماليات والتفاصيل لا يظهر في أحدهما دون الآخر"""
+        get_sales_details = self.report_generator.get_sales_details
+        
+        def sale_between_reads(*args, **kwargs):
+            conn = connection_manager.get_connection(self.test_db)
+            conn.execute("INSERT INTO sales (customer_id, date, total_amount, profit, final_amount) "
+                         "VALUES (NULL, '2024-02-10T10:00:00', 10.0, 1.0, 10.0)")
+            conn.commit()
+            return get_sales_details(*args, **kwargs)
+        
+        with mock.patch.object(self.report_generator, 'get_sales_details', sale_between_reads):
+            report = self.report_generator.generate_monthly_report(2024, 2, details=10)
+        self.assertEqual(report['sales']['total_sales'], 3)
+        self.assertEqual(len(report['sales_details']), 3)
+
+class TestDailySummary(unittest.TestCase):
+    """اختبار الملخص اليومي"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_summary.db"
+        self.db = Database(self.test_db)
+        self.summary = DailySummary(self.test_db)
+        self.expense = Expense(self.test_db)
+        self.sale = Sale(self.test_db)
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_expense_changes_update_rollup(self):
+        """اختبار تحديث الملخص مع إضافة وتعديل وحذف المصروفات"""
+        expense_id = self.expense.add_expense("إيجار", 100.0, "2024-05-01")
+        self.expense.add_expense("كهرباء", 30.0, "2024-05-01T15:00:00")
+        self.assertEqual(self.summary.get_day("2024-05-01")['expenses'], 130.0)
+        
+        # نقل المصروف إلى يوم آخر
+        self.expense.update_expense(expense_id, "إيجار", 80.0, "2024-05-02")
+        self.assertEqual(self.summary.get_day("2024-05-01")['expenses'], 30.0)
+        self.assertEqual(self.summary.get_day("2024-05-02")['expenses'], 80.0)
+        
+        self.expense.delete_expense(expense_id)
+        self.assertEqual(self.summary.get_day("2024-05-02")['expenses'], 0)
+    
+    def test_sales_update_rollup(self):
+        """اختبار تحديث الملخص مع المبيعات"""
+        self.sale.add_sale(None, 50.0, 20.0, 45.0, [])
+        self.sale.add_sale(None, 30.0, 10.0, 30.0, [])
+        today = datetime.now().strftime('%Y-%m-%d')
+        day = self.summary.get_day(today)
+        self.assertEqual(day['sales_count'], 2)
+        self.assertEqual(day['revenue'], 80.0)
+        self.assertEqual(day['final_amount'], 75.0)
+        
+        report = ReportGenerator(self.test_db).generate_daily_report(today)
+        self.assertEqual(report['sales']['total_profit'], 30.0)
+    
+    def test_rebuild_repairs_rollup(self):
+        """اختبار إصلاح الملخص من البيانات الأصلية"""
+        self.expense.add_expense("إيجار", 100.0, "2024-05-01")
+        self.summary.execute_query("UPDATE daily_summary SET expenses = 999")
+        self.assertTrue(self.summary.rebuild())
+        self.assertEqual(self.summary.get_day("2024-05-01")['expenses'], 100.0)
+    
+    def test_yearly_report_reads_rollup(self):
+        """اختبار التقرير السنوي"""
+        self.expense.add_expense("إيجار", 100.0, "2024-05-01")
+        self.expense.add_expense("صيانة", 40.0, "2024-11-20")
+        self.expense.add_expense("سنة أخرى", 7.0, "2025-01-01")
+        report = ReportGenerator(self.test_db).generate_yearly_report(2024)
+        self.assertEqual(report['expenses']['total_expenses'], 140.0)
+        self.assertEqual(report['net_profit'], -140.0)
+
+class TestReportCache(unittest.TestCase):
+    """اختبار الذاكرة المؤقتة للتقارير"""
+    
+    def setUp(self):
+        """إعداد الاختبار"""
+        self.test_db = "test_report_cache.db"
+        self.db = Database(self.test_db)
+        self.expense = Expense(self.test_db)
+        self.expense.add_expense("إيجار", 100.0, "2024-01-10")
+        report_cache.clear()
+    
+    def tearDown(self):
+        """تنظيف بعد الاختبار"""
+        connection_manager.reset(self.test_db)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_closed_period_survives_window_reopen(self):
+        """اختبار بقاء تقرير الفترة المغلقة بعد كتابات اليوم"""
+        first = ReportGenerator(self.test_db).generate_monthly_report(2024, 1)
+        self.expense.add_expense("اليوم", 5.0)
+        
+        with mock.patch.object(DailySummary, 'get_range_totals') as get_range_totals:
+            second = ReportGenerator(self.test_db).generate_monthly_report(2024, 1)
+            get_range_totals.assert_not_called()
+        self.assertIs(first, second)
+    
+    def test_closed_period_survives_local_sale_when_watching(self):
+        """بيع في هذه العملية مع متابعة الملف لا يُبطل تقرير فترة مغلقة"""
+        data_version.watch(self.test_db)
+        try:
+            report_generator = ReportGenerator(self.test_db)
+            report_generator.generate_monthly_report(2024, 1)
+            product_id = Product(self.test_db).add_product("منتج", "", 10.0, 8.0, 5)
+            self.assertIsNotNone(Sale(self.test_db).add_sale(None, 10.0, 2.0, 10.0, [{
+                'product_id': product_id, 'quantity': 1, 'selling_price': 10.0,
+                'purchasing_price': 8.0, 'discount_applied': 0, 'manual_discount': 0,
+                'final_price': 10.0}]))
+            
+            misses = report_cache.misses
+            for _ in range(2):
+                report_generator.generate_monthly_report(2024, 1)
+            self.assertEqual(report_cache.misses, misses)
+            
+            # بيع في الفترة نفسها من اتصال آخر يُبطلها
+            other = sqlite3.connect(self.test_db)
+            other.execute("INSERT INTO sales (customer_id, date, total_amount, profit, final_amount) "
+                          "VALUES (NULL, '2024-01-15 10:00:00', 5.0, 1.0, 5.0)")
+            other.commit()
+            other.close()
+            report_generator.generate_monthly_report(2024, 1)
+            self.assertEqual(report_cache.misses, misses + 1)
+        finally:
+            data_version._close_watch()
+            data_version._watch_path = None
+    
+    def test_write_in_period_invalidates(self):
+        """اختبار إبطال التقرير عند الكتابة داخل فترته"""
+        report_generator = ReportGenerator(self.test_db)
+        self.assertEqual(report_generator.generate_monthly_report(2024, 1)['expenses']['total_expenses'], 100.0)
+        self.expense.add_expense("متأخر", 20.0, "2024-01-20")
+        self.assertEqual(report_generator.generate_monthly_report(2024, 1)['expenses']['total_expenses'], 120.0)
+    
+    def test_reset_invalidates_everything(self):
+        """اختبار إبطال جميع النتائج بعد استعادة نسخة احتياطية"""
+        report_generator = ReportGenerator(self.test_db)
+        report_generator.generate_monthly_report(2024, 1)
+        connection_manager.reset(self.test_db)
+        misses = report_cache.misses
+        report_generator.generate_monthly_report(2024, 1)
+        self.assertEqual(report_cache.misses, misses + 1)
+    
+    def test_lru_eviction(self):
+        """اختبار إزالة الأقدم استخداماً عند امتلاء الذاكرة"""
+        cache = ReportCache(max_entries=2)
+        cache.get_or_compute('a', lambda: 1, ('sales',))
+        cache.get_or_compute('b', lambda: 2, ('sales',))
+        cache.get_or_compute('a', lambda: 0, ('sales',))
+        cache.get_or_compute('c', lambda: 3, ('sales',))
+        self.assertEqual(cache.get_or_compute('a', lambda: 0, ('sales',)), 1)
+        self.assertEqual(cache.get_or_compute('b', lambda: 20, ('sales',)), 20)
+
 class TestBackupSystem(unittest.TestCase):
     """اختبار نظام النسخ الاحتياطي"""
     
@@ -295,7 +2218,8 @@ class TestBackupSystem(unittest.TestCase):
     
     def tearDown(self):
         """تنظيف بعد الاختبار"""
-        # حذف ملفات الاختبار
+        # حذف ملفات الاختبار (بعد إغلاق الاتصالات المشتركة بها)
+        connection_manager.reset(self.test_db)
         if os.path.exists(self.test_db):
             os.remove(self.test_db)
         
@@ -326,6 +2250,338 @@ class TestBackupSystem(unittest.TestCase):
         # استعادة النسخة
         success = self.backup_manager.restore_backup(backup_path)
         self.assertTrue(success)
+    
+    def test_restore_reopens_watch_connection(self):
+        """اتصال متابعة الإصدارات يُغلق أثناء الاستبدال ويتابع الملف الجديد بعده"""
+        backup_path = self.backup_manager.create_backup()
+        data_version.watch(self.test_db)
+        replace = os.replace
+        open_during_replace = []
+        
+        def tracked_replace(source, target):
+            if target == self.test_db:
+                open_during_replace.append(data_version._watch_conn is not None)
+            replace(source, target)
+        
+        try:
+            with mock.patch('utils.os.replace', tracked_replace):
+                self.assertTrue(self.backup_manager.restore_backup(backup_path))
+            self.assertEqual(open_during_replace, [False])
+            self.assertIsNotNone(data_version._watch_conn)
+            
+            # كتابة من عملية أخرى على الملف المستعاد تُكتشف
+            data_version.sync()
+            version = data_version.version
+            other = sqlite3.connect(self.test_db)
+            other.execute("INSERT INTO customers (name) VALUES ('عميل بعد الاستعادة')")
+            other.commit()
+            other.close()
+            self.assertTrue(data_version.changed_since(version, ('customers',)))
+        finally:
+            data_version._close_watch()
+            data_version._watch_path = None
+    
+    def test_window_restore_runs_in_background(self):
+        """الاستعادة من النافذة تُرسل إلى الخيوط العاملة ولا تعمل في خيط الواجهة"""
+        import backup_system
+        
+        backup_path = self.backup_manager.create_backup()
+        window = backup_system.BackupSystemWindow.__new__(backup_system.BackupSystemWindow)
+        window.window = FakeWindow()
+        window.backup_manager = self.backup_manager
+        window.status_bar = mock.Mock()
+        
+        with mock.patch.object(backup_system.worker, 'submit') as submit, \
+                mock.patch.object(self.backup_manager, 'restore_backup') as restore:
+            window.start_restore(self.backup_manager.restore_backup, backup_path)
+        
+        restore.assert_not_called()
+        args, kwargs = submit.call_args
+        self.assertEqual(args[1:], (restore, backup_path))
+        self.assertEqual(kwargs['key'], 'restore')
+        self.assertIsNotNone(kwargs['on_progress'])
+    
+    def test_backup_consistent_while_writing(self):
+        """النسخة الاحتياطية سليمة وتشمل ما في WAL رغم الكتابة أثناء النسخ"""
+        expense_model = Expense(self.test_db)
+        expense_model.add_expense("قبل النسخ", 10.0)
+        stop = threading.Event()
+        
+        def keep_writing():
+            writer = Expense(self.test_db)
+            while not stop.is_set():
+                writer.add_expense("أثناء النسخ", 1.0)
+        
+        writer_thread = threading.Thread(target=keep_writing)
+        writer_thread.start()
+        progress = []
+        try:
+            # صفحة واحدة لكل خطوة حتى تتكرر إعادة النسخ بسبب الكتابة
+            backup_path = os.path.join(self.backup_manager.backup_dir, "online.db")
+            online_backup(self.test_db, backup_path, lambda copied, total: progress.append((copied, total)),
+                          pages=1, step_delay=0.001)
+        finally:
+            stop.set()
+            writer_thread.join()
+        
+        self.assertEqual(progress[-1][0], progress[-1][1])
+        self.assertFalse(os.path.exists(backup_path + ".partial"))
+        conn = sqlite3.connect(backup_path)
+        try:
+            self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(conn.execute(
+                "SELECT COUNT(*) FROM expenses WHERE description = 'قبل النسخ'").fetchone()[0], 1)
+        finally:
+            conn.close()
+    
+    def test_compressed_backup_restore(self):
+        """النسخة المضغوطة تُعرض بحجميها وتُستعاد وتُصدر بصيغة أخرى"""
+        Expense(self.test_db).add_expense("قبل النسخة", 10.0)
+        backup_path = self.backup_manager.create_backup()
+        self.assertTrue(backup_path.endswith(".db.gz"))
+        
+        backup = [b for b in self.backup_manager.list_backups()
+                  if b['name'] == os.path.basename(backup_path)][0]
+        self.assertEqual(backup['size'], os.path.getsize(backup_path))
+        self.assertGreater(backup['logical_size'], backup['size'])
+        
+        Expense(self.test_db).add_expense("بعد النسخة", 5.0)
+        self.assertTrue(self.backup_manager.restore_by_name(backup['name']))
+        self.assertFalse(os.path.exists(self.test_db + ".restore"))
+        descriptions = [e['description'] for e in Expense(self.test_db).get_all_expenses()]
+        self.assertIn("قبل النسخة", descriptions)
+        self.assertNotIn("بعد النسخة", descriptions)
+        
+        export_path = os.path.join(self.backup_manager.backup_dir, "exported.xz")
+        self.backup_manager.export_backup(backup['name'], export_path)
+        with lzma.open(export_path) as exported, gzip.open(backup_path) as original:
+            self.assertEqual(exported.read(), original.read())
+        
+        self.backup_manager.delete_backup(backup['name'])
+        self.assertFalse(os.path.exists(backup_path + ".json"))
+    
+    def test_corrupt_backup_not_swapped_in(self):
+        """نسخة تالفة لا تستبدل قاعدة البيانات الحالية"""
+        Expense(self.test_db).add_expense("بيانات حالية", 10.0)
+        corrupt_path = os.path.join(self.backup_manager.backup_dir, "corrupt.db")
+        with open(corrupt_path, 'wb') as corrupt_file:
+            corrupt_file.write(b"not a database" * 100)
+        
+        self.assertFalse(self.backup_manager.restore_backup(corrupt_path))
+        self.assertIn("بيانات حالية",
+                      [e['description'] for e in Expense(self.test_db).get_all_expenses()])
+    
+    def test_catalog_listing(self):
+        """القائمة تُقرأ من الفهرس مع البصمة وعدد الصفحات"""
+        backup_path = self.backup_manager.create_backup()
+        snapshot = self.backup_manager.create_incremental_backup("snapshot_first")
+        
+        backups = {b['name']: b for b in self.backup_manager.list_backups()}
+        full = backups[os.path.basename(backup_path)]
+        self.assertEqual(full['sha256'], file_checksum(backup_path))
+        self.assertEqual(full['page_count'] * 4096, full['logical_size'])
+        self.assertEqual(backups[snapshot]['page_count'], full['page_count'])
+        
+        # ملف منسوخ للمجلد لا يظهر إلا بعد إعادة الفهرسة
+        shutil.copy2(backup_path, os.path.join(self.backup_manager.backup_dir, "copied.db.gz"))
+        self.assertNotIn("copied.db.gz", [b['name'] for b in self.backup_manager.list_backups()])
+        os.remove(self.backup_manager.catalog.path)
+        self.assertEqual(self.backup_manager.rebuild_catalog(), 3)
+        rebuilt = {b['name']: b for b in self.backup_manager.list_backups()}
+        self.assertEqual(rebuilt['copied.db.gz']['page_count'], full['page_count'])
+        self.assertEqual(rebuilt['copied.db.gz']['source'], 'manual')
+        self.assertEqual(rebuilt[snapshot]['page_count'], full['page_count'])
+    
+    def test_rebuild_keeps_backup_added_meanwhile(self):
+        """نسخة تُضاف للفهرس أثناء إعادة الفهرسة لا تضيع عند كتابة الفهرس الجديد"""
+        self.backup_manager.create_backup()
+        added = {'name': 'added_meanwhile.db.gz', 'kind': 'full',
+                 'created': datetime.now().strftime(DATE_FORMAT)}
+        writers = []
+        
+        def add_during_rebuild(done, total):
+            if not writers:
+                writers.append(threading.Thread(target=self.backup_manager.catalog.add, args=(added,)))
+                writers[0].start()
+                writers[0].join(0.2)
+        
+        self.backup_manager.rebuild_catalog(progress=add_during_rebuild)
+        writers[0].join()
+        self.assertIsNotNone(self.backup_manager.catalog.get('added_meanwhile.db.gz'))
+    
+    def test_window_first_catalog_built_in_background(self):
+        """فتح النافذة بدون فهرس يرسل إعادة الفهرسة للخيوط العاملة"""
+        import backup_system
+        
+        window = backup_system.BackupSystemWindow.__new__(backup_system.BackupSystemWindow)
+        window.window = FakeWindow()
+        window.backup_manager = self.backup_manager
+        window.status_bar = mock.Mock()
+        window.tree_rows = mock.Mock()
+        self.assertFalse(self.backup_manager.catalog.exists())
+        
+        with mock.patch.object(backup_system.worker, 'submit') as submit:
+            window.refresh_backup_list()
+        
+        self.assertFalse(self.backup_manager.catalog.exists())
+        window.tree_rows.sync.assert_not_called()
+        args, kwargs = submit.call_args
+        self.assertEqual(args[1], self.backup_manager.rebuild_catalog)
+        self.assertEqual(kwargs['key'], 'catalog')
+    
+    def test_auto_backup_retention(self):
+        """سياسة الاحتفاظ بعد النسخ التلقائي تحذف النسخ التلقائية القديمة فقط"""
+        manual = self.backup_manager.create_incremental_backup("snapshot_manual")
+        for day in range(3):
+            name = self.backup_manager.create_incremental_backup(f"snapshot_auto_{day}", source='auto')
+            entry = self.backup_manager.catalog.get(name)
+            entry['created'] = datetime(2024, 1, day + 1).strftime(DATE_FORMAT)
+            self.backup_manager.catalog.add(entry)
+        
+        self.backup_manager.retention = {'daily': 2}
+        latest = self.backup_manager.auto_backup()
+        names = [b['name'] for b in self.backup_manager.list_backups()]
+        self.assertEqual(sorted(names), sorted([manual, latest, "snapshot_auto_2"]))
+        self.assertIsNone(self.backup_manager.chunk_store.load_manifest("snapshot_auto_0"))
+    
+    def test_point_in_time_recovery(self):
+        """الاستعادة لوقت محدد: نسخة أساسية + الأرشيف + ما لم يُؤرشف بعد"""
+        expense_model = Expense(self.test_db)
+        self.backup_manager.create_incremental_backup("snapshot_base")
+        
+        expense_model.add_expense("مؤرشف", 10.0)
+        self.assertEqual(self.backup_manager.archive_journal(), 1)
+        expense_model.add_expense("غير مؤرشف", 20.0)
+        conn = connection_manager.get_connection(self.test_db)
+        target_time, position = conn.execute(
+            "SELECT changed_at, change_id FROM changelog ORDER BY change_id DESC").fetchone()
+        time.sleep(0.01)
+        expense_model.add_expense("بعد الوقت", 30.0)
+        
+        result = self.backup_manager.recover_to_time(target_time)
+        self.assertEqual((result['base'], result['changes']), ("snapshot_base", 2))
+        recovered = sqlite3.connect(result['path'])
+        try:
+            descriptions = [row[0] for row in recovered.execute("SELECT description FROM expenses")]
+            self.assertEqual(change_position(recovered), position)
+        finally:
+            recovered.close()
+        self.assertIn("مؤرشف", descriptions)
+        self.assertIn("غير مؤرشف", descriptions)
+        self.assertNotIn("بعد الوقت", descriptions)
+        
+        # الاستبدال يبدأ خطاً زمنياً جديداً من موضع النسخة المستعادة
+        self.assertTrue(self.backup_manager.restore_backup(result['path']))
+        self.assertLessEqual(self.backup_manager.journal.last_archived(), position)
+        expense_model.add_expense("خط جديد", 5.0)
+        self.assertEqual(change_position(connection_manager.get_connection(self.test_db)), position + 1)
+        
+        # لا توجد نسخة قبل هذا الوقت
+        self.assertIsNone(self.backup_manager.recover_to_time("2000-01-01 00:00:00"))
+    
+    def test_recovery_keeps_foreign_keys(self):
+        """العملاء والفئات المضافة بعد النسخة الأساسية تُستعاد مع الصفوف التي تشير إليها"""
+        self.backup_manager.create_incremental_backup("snapshot_base")
+        customer_id = Customer(self.test_db).add_customer("عميل جديد")
+        category_id = Category(self.test_db).add_category("فئة جديدة")
+        product_id = Product(self.test_db).add_product("منتج", "", 10.0, 8.0, 5, category_id=category_id)
+        self.assertIsNotNone(Sale(self.test_db).add_sale(customer_id, 10.0, 2.0, 10.0, [{
+            'product_id': product_id, 'quantity': 1, 'selling_price': 10.0, 'purchasing_price': 8.0,
+            'discount_applied': 0, 'manual_discount': 0, 'final_price': 10.0}]))
+        self.backup_manager.archive_journal()
+        
+        # الوقت بالثواني يشمل التغييرات التي حدثت خلال تلك الثانية
+        last_change = self.backup_manager.journal.last_archived()
+        target_time = list(self.backup_manager.journal.changes(last_change - 1))[0][1][:19]
+        result = self.backup_manager.recover_to_time(target_time)
+        recovered = sqlite3.connect(result['path'])
+        try:
+            self.assertEqual(recovered.execute("PRAGMA foreign_key_check").fetchall(), [])
+            self.assertEqual(change_position(recovered), last_change)
+            self.assertEqual(recovered.execute("SELECT name FROM customers WHERE customer_id = ?",
+                                               (customer_id,)).fetchone()[0], "عميل جديد")
+        finally:
+            recovered.close()
+        self.assertTrue(self.backup_manager.restore_backup(result['path']))
+        
+        # ملف يخالف المفاتيح الأجنبية لا يُستبدل به
+        broken_path = self.test_db + ".broken"
+        shutil.copy2(self.test_db, broken_path)
+        broken = sqlite3.connect(broken_path)
+        broken.execute("UPDATE sales SET customer_id = 999")
+        broken.commit()
+        broken.close()
+        self.assertFalse(self.backup_manager.restore_backup(broken_path))
+        os.remove(broken_path)
+        conn = connection_manager.get_connection(self.test_db)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM sales WHERE customer_id = 999").fetchone()[0], 0)
+    
+    def test_recover_after_restore(self):
+        """بعد استعادة نسخة أقدم لا تُستخدم النسخ الأحدث منها أساساً للاستعادة لوقت"""
+        expense_model = Expense(self.test_db)
+        self.backup_manager.create_incremental_backup("snapshot_first")
+        expense_model.add_expense("الخط القديم", 1.0)
+        self.backup_manager.create_incremental_backup("snapshot_second")
+        
+        self.assertTrue(self.backup_manager.restore_by_name("snapshot_first"))
+        self.assertIsNone(self.backup_manager.catalog.get("snapshot_first").get('abandoned'))
+        self.assertIsNotNone(self.backup_manager.catalog.get("snapshot_second").get('abandoned'))
+        expense_model.add_expense("س", 2.0)
+        expense_model.add_expense("ص", 3.0)
+        self.assertEqual(self.backup_manager.archive_journal(), 2)
+        
+        result = self.backup_manager.recover_to_time(datetime.now().strftime(DATE_FORMAT))
+        self.assertEqual((result['base'], result['changes']), ("snapshot_first", 2))
+        recovered = sqlite3.connect(result['path'])
+        try:
+            descriptions = [row[0] for row in recovered.execute("SELECT description FROM expenses")]
+        finally:
+            recovered.close()
+        self.assertEqual(sorted(descriptions), ["س", "ص"])
+    
+    def test_incremental_backup_restore(self):
+        """النسخة التزايدية تظهر في القائمة وتُستعاد وتُحذف بالاسم"""
+        first = self.backup_manager.create_incremental_backup("snapshot_first")
+        second = self.backup_manager.create_incremental_backup("snapshot_second")
+        self.assertEqual((first, second), ("snapshot_first", "snapshot_second"))
+        # لم يتغير شيء بين النسختين
+        self.assertEqual(self.backup_manager.chunk_store.load_manifest(second)['new_bytes'], 0)
+        self.assertIn(first, [backup['name'] for backup in self.backup_manager.list_backups()])
+        
+        Expense(self.test_db).add_expense("بعد النسخة", 5.0)
+        self.assertTrue(self.backup_manager.restore_by_name(first))
+        self.assertEqual([e for e in Expense(self.test_db).get_all_expenses()
+                          if e['description'] == "بعد النسخة"], [])
+        
+        self.backup_manager.delete_backup(first)
+        self.backup_manager.delete_backup(second)
+        self.assertEqual(self.backup_manager.chunk_store.stored_bytes(), 0)
+    
+    def test_incremental_names_unique_within_second(self):
+        """نسختان تلقائيتان في نفس الثانية تأخذان اسمين مختلفين"""
+        with mock.patch('utils.datetime') as fake_datetime:
+            fake_datetime.now.return_value = datetime(2024, 5, 1, 18, 0, 0)
+            first = self.backup_manager.create_incremental_backup()
+            second = self.backup_manager.create_incremental_backup()
+        self.assertEqual((first, second), ("snapshot_20240501_180000", "snapshot_20240501_180000_2"))
+        self.assertEqual(sorted(backup['name'] for backup in self.backup_manager.list_backups()
+                                if backup['name'].startswith("snapshot_2024")), [first, second])
+        # الاسم المحدد صراحة لا يُستبدل
+        self.assertIsNone(self.backup_manager.create_incremental_backup(first))
+        
+        self.backup_manager.delete_backup(first)
+        self.backup_manager.delete_backup(second)
+        self.assertEqual(self.backup_manager.chunk_store.stored_bytes(), 0)
+    
+    def test_database_backup_progress(self):
+        """Database.backup_database تستخدم النسخ المباشر وتبلغ عن التقدم"""
+        progress = []
+        backup_path = os.path.join(self.backup_manager.backup_dir, "db_backup.db")
+        self.assertEqual(self.db.backup_database(backup_path, lambda *values: progress.append(values)),
+                         backup_path)
+        self.assertTrue(progress)
+        self.assertEqual(progress[-1][0], progress[-1][1])
 
 def run_all_tests():
     """تشغيل جميع الاختبارات"""
@@ -338,17 +2594,61 @@ def run_all_tests():
     # إضافة اختبارات قاعدة البيانات
     test_suite.addTest(unittest.makeSuite(TestDatabase))
     
+    # إضافة اختبارات ترحيلات المخطط
+    test_suite.addTest(unittest.makeSuite(TestSchemaMigrations))
+    
+    # إضافة اختبارات خطط الاستعلامات
+    test_suite.addTest(unittest.makeSuite(TestQueryPlans))
+    
+    # إضافة اختبارات قناة القراءة فقط
+    test_suite.addTest(unittest.makeSuite(TestReadOnlySnapshots))
+    
+    # إضافة اختبارات مدير الاتصالات
+    test_suite.addTest(unittest.makeSuite(TestConnectionManager))
+    
     # إضافة اختبارات النماذج
     test_suite.addTest(unittest.makeSuite(TestModels))
     
+    # إضافة اختبارات البحث عن المنتجات
+    test_suite.addTest(unittest.makeSuite(TestProductSearch))
+    test_suite.addTest(unittest.makeSuite(TestProductIndex))
+    test_suite.addTest(unittest.makeSuite(TestBarcodes))
+    
+    # إضافة اختبارات مسار البيع
+    test_suite.addTest(unittest.makeSuite(TestCheckout))
+    test_suite.addTest(unittest.makeSuite(TestCartEngine))
+    test_suite.addTest(unittest.makeSuite(TestCartJournal))
+    
     # إضافة اختبارات الحسابات
     test_suite.addTest(unittest.makeSuite(TestCalculations))
     
+    # إضافة اختبارات تحديث الجداول
+    test_suite.addTest(unittest.makeSuite(TestKeyedTreeview))
+    test_suite.addTest(unittest.makeSuite(TestKeysetPaging))
+    test_suite.addTest(unittest.makeSuite(TestBackgroundWorker))
+    test_suite.addTest(unittest.makeSuite(TestSavedQueriesWindow))
+    test_suite.addTest(unittest.makeSuite(TestEntityCache))
+    test_suite.addTest(unittest.makeSuite(TestChangeBus))
+    test_suite.addTest(unittest.makeSuite(TestStartupImports))
+    
     # إضافة اختبارات التحقق
     test_suite.addTest(unittest.makeSuite(TestValidation))
     
+    # إضافة اختبارات التقارير
+    test_suite.addTest(unittest.makeSuite(TestReportGenerator))
+    
+    # إضافة اختبارات الملخص اليومي
+    test_suite.addTest(unittest.makeSuite(TestDailySummary))
+    
+    # إضافة اختبارات الذاكرة المؤقتة للتقارير
+    test_suite.addTest(unittest.makeSuite(TestReportCache))
+    
     # إضافة اختبارات النسخ الاحتياطي
     test_suite.addTest(unittest.makeSuite(TestBackupSystem))
+    test_suite.addTest(unittest.makeSuite(TestChunkStore))
+    test_suite.addTest(unittest.makeSuite(TestCompression))
+    test_suite.addTest(unittest.makeSuite(TestBackupCatalog))
+    test_suite.addTest(unittest.makeSuite(TestChangeJournal))
     
     # تشغيل الاختبارات
     runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,261 @@
+"""أدوات مساعدة لجداول Treeview"""
+
+class KeyedTreeview:
+    """تحديث جدول Treeview بالفروقات فقط حسب المفتاح الأساسي
+
+    بدلاً من حذف جميع الصفوف وإعادة إدراجها، تُقارن الصفوف الجديدة
+    بالموجودة: يُحذف ما اختفى، ويُدرج الجديد، ويُعدل ما تغيرت قيمه فقط.
+    لذلك يبقى موضع التمرير والتحديد كما هما بعد كل إضافة أو تعديل.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        # القيم المعروضة لكل صف (لتجنب قراءتها من الجدول عند المقارنة)
+        self._values = {}
+        self._tags = {}
+
+    def sync(self, rows):
+        """مزامنة الجدول مع الصفوف الجديدة
+
+        rows: قائمة من (key, values) أو (key, values, tags) بالترتيب المطلوب.
+        ترجع عدد الصفوف المضافة والمعدلة والمحذوفة.
+        """
+        new_rows = []
+        for row in rows:
+            key, values = row[0], tuple(row[1])
+            tags = tuple(row[2]) if len(row) > 2 else ()
+            new_rows.append((str(key), values, tags))
+        new_keys = {iid for iid, _, _ in new_rows}
+
+        # حذف الصفوف التي لم تعد موجودة دفعة واحدة
+        removed = [iid for iid in self._values if iid not in new_keys]
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed:
+                del self._values[iid]
+                self._tags.pop(iid, None)
+
+        # إعادة الترتيب فقط إذا تغير ترتيب الصفوف الباقية
+        kept_order = [iid for iid, _, _ in new_rows if iid in self._values]
+        reorder = kept_order != list(self.tree.get_children())
+
+        inserted = updated = 0
+        for index, (iid, values, tags) in enumerate(new_rows):
+            if iid not in self._values:
+                self.tree.insert('', index, iid=iid, values=values, tags=tags)
+                inserted += 1
+            else:
+                if self._values[iid] != values or self._tags[iid] != tags:
+                    self.tree.item(iid, values=values, tags=tags)
+                    updated += 1
+                if reorder:
+                    self.tree.move(iid, '', index)
+            self._values[iid] = values
+            self._tags[iid] = tags
+
+        return {'inserted': inserted, 'updated': updated, 'deleted': len(removed)}
+
+    def clear(self):
+        """حذف جميع الصفوف"""
+        self.tree.delete(*self.tree.get_children())
+        self._values.clear()
+        self._tags.clear()
+
+    def __len__(self):
+        return len(self._values)
+
+class PagedTreeview:
+    """عرض افتراضي للقوائم الكبيرة: نافذة من الصفوف حول موضع التمرير
+
+    الجدول لا يحتوي إلا بضع صفحات في كل وقت. عند الاقتراب من نهاية أو بداية
+    الصفوف المعروضة تُجلب الصفحة التالية أو السابقة بمفتاح البحث (keyset)
+    وتُحذف صفحة من الطرف الآخر. الترتيب بالنقر على عناوين الأعمدة يتم في SQL.
+
+    fetch_page(seek, forward, limit, sort, descending, inclusive) يرجع الصفوف
+    بترتيب العرض ومعها sort_key، و row_fn(row) يرجع (المفتاح، القيم).
+    مع worker تُجلب الصفحات في الخلفية بمفتاح واحد للجدول، فكل طلب جديد
+    (ترتيب أو تحديث) يلغي الطلب السابق الذي لم يكتمل، وتُطبق النتيجة في
+    خيط الواجهة. بدونه يتم الجلب مباشرة (الاختبارات والسكربتات).
+    """
+
+    # نسبة التمرير التي يبدأ عندها تحميل الصفحة التالية أو السابقة
+    PREFETCH_MARGIN = 0.2
+
+    def __init__(self, tree, fetch_page, row_fn, id_field, sort='name', descending=False,
+                 page_size=100, max_pages=3, worker=None):
+        self.tree = tree
+        self.fetch_page = fetch_page
+        self.row_fn = row_fn
+        self.id_field = id_field
+        self.sort = sort
+        self.descending = descending
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.worker = worker
+        self.rows = []
+        self.has_before = False
+        self.has_after = False
+        self.rows_view = KeyedTreeview(tree)
+        self.scrollbar = None
+        self._loading = False
+        # طلب صفحة قيد التنفيذ في الخلفية (لا يُطلب غيره أثناء التمرير)
+        self._task = None
+
+    def attach(self, scrollbar, headings=None):
+        """ربط شريط التمرير وعناوين الأعمدة القابلة للترتيب
+
+        headings: قاموس (معرف عمود الجدول ← مفتاح الترتيب في النموذج).
+        """
+        self.scrollbar = scrollbar
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        for column, sort in (headings or {}).items():
+            self.tree.heading(column, command=lambda sort=sort: self.sort_by(sort))
+
+    def _seek(self, row):
+        """مفتاح البحث لصف"""
+        return (row['sort_key'], row[self.id_field])
+
+    def _request(self, apply, seek, forward, limit, inclusive=False, busy=True):
+        """جلب صفحة بالترتيب الحالي ثم apply(rows) في خيط الواجهة
+
+        يرجع نتيجة apply عند الجلب المباشر، و None عند الجلب في الخلفية.
+        """
+        args = (seek, forward, limit, self.sort, self.descending, inclusive)
+        if self.worker is None:
+            return apply(self.fetch_page(*args))
+
+        def on_success(rows):
+            self._task = None
+            apply(rows)
+
+        def on_error(e):
+            self._task = None
+            print(f"خطأ في جلب صفحة الجدول: {e}")
+
+        # المفتاح مع الجدول نفسه: طلب جديد لنفس الجدول يلغي السابق فقط
+        self._task = self.worker.submit(self.tree, self.fetch_page, *args, on_success=on_success,
+                                        on_error=on_error, key='page', busy=busy)
+        return None
+
+    def _loading_page(self):
+        """هل يوجد طلب صفحة في الخلفية لم تصل نتيجته؟"""
+        return self._task is not None and not self._task.cancelled
+
+    def reset(self):
+        """تحميل الصفحة الأولى (بعد تغيير الترتيب أو التصفية)"""
+        self._request(self._apply_reset, None, True, self.page_size)
+
+    def _apply_reset(self, rows):
+        """عرض الصفحة الأولى"""
+        self.rows = rows
+        self.has_before = False
+        self.has_after = len(self.rows) == self.page_size
+        self._render()
+        self.tree.yview_moveto(0)
+
+    def refresh(self):
+        """إعادة تحميل الصفوف المعروضة في مكانها بعد إضافة أو تعديل أو حذف"""
+        if not self.rows:
+            self.reset()
+            return
+        limit = max(len(self.rows), self.page_size)
+        self._request(lambda rows: self._apply_refresh(rows, limit),
+                      self._seek(self.rows[0]), True, limit, inclusive=True)
+
+    def _apply_refresh(self, rows, limit):
+        """عرض الصفوف المعاد تحميلها"""
+        if not rows and self.has_before:
+            # حذف جميع الصفوف المعروضة: الرجوع إلى البداية
+            self.reset()
+            return
+        self.rows = rows
+        self.has_after = len(rows) == limit
+        self._render()
+
+    def sort_by(self, sort):
+        """الترتيب حسب عمود (النقر مرة أخرى يعكس الاتجاه)"""
+        if sort == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = sort, False
+        self.reset()
+
+    def load_next(self, then=None):
+        """جلب الصفحة التالية وحذف صفحة من البداية عند تجاوز الحد
+
+        يرجع عدد الصفوف الجديدة عند الجلب المباشر، وthen() تُستدعى بعد العرض.
+        """
+        if not self.has_after or not self.rows:
+            return 0
+        return self._request(lambda page: self._apply_next(page, then),
+                             self._seek(self.rows[-1]), True, self.page_size, busy=False)
+
+    def _apply_next(self, page, then=None):
+        """إضافة الصفحة التالية"""
+        self.has_after = len(page) == self.page_size
+        if not page:
+            return 0
+        self.rows.extend(page)
+        excess = len(self.rows) - self.page_size * self.max_pages
+        if excess > 0:
+            del self.rows[:excess]
+            self.has_before = True
+        self._render()
+        if then is not None:
+            then()
+        return len(page)
+
+    def load_previous(self, then=None):
+        """جلب الصفحة السابقة وحذف صفحة من النهاية عند تجاوز الحد"""
+        if not self.has_before or not self.rows:
+            return 0
+        return self._request(lambda page: self._apply_previous(page, then),
+                             self._seek(self.rows[0]), False, self.page_size, busy=False)
+
+    def _apply_previous(self, page, then=None):
+        """إضافة الصفحة السابقة"""
+        self.has_before = len(page) == self.page_size
+        if not page:
+            return 0
+        self.rows[:0] = page
+        excess = len(self.rows) - self.page_size * self.max_pages
+        if excess > 0:
+            del self.rows[-excess:]
+            self.has_after = True
+        self._render()
+        if then is not None:
+            then()
+        return len(page)
+
+    def _render(self):
+        """عرض الصفوف الحالية (تحديث الفروقات فقط)"""
+        self.rows_view.sync(self.row_fn(row) for row in self.rows)
+
+    def on_scroll(self, first, last):
+        """تحميل الصفحات عند الاقتراب من طرفي الصفوف المعروضة"""
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self._loading or self._loading_page():
+            return
+        first, last = float(first), float(last)
+        self._loading = True
+        try:
+            if last >= 1 - self.PREFETCH_MARGIN and self.has_after:
+                self._keep_position(self.load_next, first)
+            elif first <= self.PREFETCH_MARGIN and self.has_before:
+                self._keep_position(self.load_previous, first)
+        finally:
+            self._loading = False
+
+    def _keep_position(self, load, first):
+        """تحميل صفحة مع إبقاء نفس الصف في أعلى الجدول"""
+        count = len(self.rows)
+        top = self.rows[min(int(first * count), count - 1)] if count else None
+
+        def restore_position():
+            if top is not None and self.rows:
+                keys = [row[self.id_field] for row in self.rows]
+                if top[self.id_field] in keys:
+                    self.tree.yview_moveto(keys.index(top[self.id_field]) / len(self.rows))
+
+        load(restore_position)
@@ -1,7 +1,22 @@
 from datetime import datetime, timedelta
-from models import Sale, Expense, Product
+from collections import OrderedDict, defaultdict
+from bisect import bisect_left
+import heapq
+from functools import lru_cache
+import threading
+from models import Sale, Expense, Product, ProductQuery, DailySummary, Category, Supplier, Customer, data_version
+from arabic_text import tokenize
+from database import Database, connection_manager, online_backup
+from chunk_store import ChunkStore
+from compression import DEFAULT_CODEC, codec_for_path, extension_for, compress_file, decompress_file
+from backup_catalog import BackupCatalog, DEFAULT_RETENTION, DATE_FORMAT, file_checksum, select_expired
+from change_journal import (JournalArchive, apply_changes, change_position, has_changelog, CHANGE_COLUMNS,
+                            end_of_second, foreign_key_violations)
 import os
 import shutil
+import sqlite3
+import tempfile
+import time
 
 class CalculationUtils:
     """فئة للحسابات المختلفة"""
@@ -38,74 +53,441 @@ class CalculationUtils:
             'final_total': total - total_discount
         }
 
+class ReportCache:
+    """ذاكرة مؤقتة لنتائج التقارير مع إزالة الأقدم استخداماً (LRU)
+
+    كل نتيجة تُخزن مع إصدار البيانات وقت حسابها، وتُعتبر صالحة ما لم
+    تحدث كتابة تمس نطاقاتها وفترتها الزمنية. لذلك تبقى تقارير الفترات
+    المغلقة محفوظة حتى بعد إغلاق نافذة التقارير وفتحها من جديد.
+    """
+    
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_or_compute(self, key, compute, scopes, start_day=None, end_day=None):
+        """إرجاع النتيجة المخزنة إن كانت صالحة، وإلا حسابها وتخزينها"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, result = entry
+                if not data_version.changed_since(version, scopes, start_day, end_day):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+        
+        # الإصدار يُقرأ قبل الحساب حتى لا تضيع كتابة تحدث أثناءه
+        version = data_version.version
+        result = compute()
+        
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+    
+    def clear(self):
+        """مسح جميع النتائج المخزنة"""
+        with self._lock:
+            self._entries.clear()
+
+# الذاكرة المؤقتة المشتركة للتقارير
+report_cache = ReportCache()
+
+# النطاقات التي تعتمد عليها التقارير
+LEDGER_SCOPES = ('sales', 'expenses')
+PRODUCT_SCOPES = ('products', 'stock')
+
+class ProductIndex:
+    """فهرس بادئات في الذاكرة للبحث الفوري عن المنتجات أثناء الكتابة
+
+    يُبنى مرة واحدة من قاعدة البيانات ثم يُحدث تدريجياً: عند تغير إصدار
+    بيانات المنتجات تُجلب المنتجات المعدلة بعد آخر رقم في سجل تعديلات
+    المنتجات فقط (الترحيل 9)، ولا يُعاد فهرسة إلا ما تغير اسمه أو فئته أو
+    مورده. تعديل الفئات أو الموردين (نادر) يعيد تحميل الجدول كاملاً.
+    الكلمات موحدة بنفس قواعد فهرس FTS5.
+    """
+    
+    # أوزان الترتيب لكل حقل
+    FIELD_WEIGHTS = (('name', 10), ('category_name', 5), ('supplier_name', 3))
+    # النطاقات التي تغير صفوف المنتجات المعروضة (المبيعات تغير المخزون فقط
+    # فيُجلب المنتج المباع وحده)
+    SCOPES = PRODUCT_SCOPES + ('categories', 'suppliers')
+    # النطاقات التي تغير أسماء الفئات والموردين في صفوف كثيرة دفعة واحدة
+    RELOAD_SCOPES = ('categories', 'suppliers')
+    
+    def __init__(self, db_name="store_management.db"):
+        self.search_model = ProductQuery(db_name, read_only=True)
+        self.version = None
+        self.position = 0
+        self._rows = {}
+        self._postings = defaultdict(dict)
+        self._tokens = []
+        self._indexed = {}
+        self._lock = threading.Lock()
+        # التحديث من أكثر من خيط عامل يتم بالترتيب حتى لا تكتب نتيجة أقدم فوق أحدث
+        self._refresh_lock = threading.Lock()
+    
+    def refresh(self):
+        """تحديث الفهرس إن تغيرت بيانات المنتجات، ويرجع True عند التحديث"""
+        if self.version is not None and not data_version.changed_since(self.version, self.SCOPES):
+            return False
+        with self._refresh_lock:
+            return self._refresh()
+    
+    def _refresh(self):
+        """جلب التغييرات وتطبيقها على الفهرس"""
+        if self.version is not None and not data_version.changed_since(self.version, self.SCOPES):
+            # حدّثه خيط آخر أثناء الانتظار
+            return False
+        
+        # الإصدار والموضع يُقرآن قبل الجلب حتى لا تضيع كتابة تحدث أثناءه
+        version = data_version.version
+        if self.version is None or data_version.changed_since(self.version, self.RELOAD_SCOPES):
+            position = self.search_model.product_changes_position()
+            rows = {row['product_id']: row for row in self.search_model.search_products("")}
+            removed = set(self._rows) - set(rows)
+        else:
+            position, changed_ids, changed_rows = self.search_model.get_product_changes(self.position)
+            rows = {row['product_id']: row for row in changed_rows}
+            removed = set(changed_ids) - set(rows)
+        
+        with self._lock:
+            for product_id in removed & set(self._rows):
+                self._unindex(product_id)
+                del self._rows[product_id]
+            new_tokens = []
+            for product_id, row in rows.items():
+                fields = tuple(row[field] for field, _ in self.FIELD_WEIGHTS)
+                if self._indexed.get(product_id, (None,))[0] != fields:
+                    self._unindex(product_id)
+                    self._index(product_id, fields, new_tokens)
+                self._rows[product_id] = row
+            if new_tokens:
+                # دمج الكلمات الجديدة دفعة واحدة بدلاً من إدراج كل كلمة على حدة
+                self._tokens = sorted(self._tokens + new_tokens)
+            self.version = version
+            self.position = position
+        return True
+    
+    def search(self, search_term, limit=None):
+        """البحث بالبادئات مع ترتيب النتائج حسب الحقل المطابق"""
+        tokens = tokenize(search_term)
+        with self._lock:
+            if not tokens:
+                results = sorted(self._rows.values(), key=lambda row: row['name'])
+                return results[:limit] if limit else results
+            
+            scores = None
+            for token in tokens:
+                token_scores = self._prefix_scores(token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {product_id: scores[product_id] + score
+                              for product_id, score in token_scores.items()
+                              if product_id in scores}
+                if not scores:
+                    return []
+            
+            rank = lambda product_id: (-scores[product_id], self._rows[product_id]['name'])
+            if limit:
+                ranked = heapq.nsmallest(limit, scores, key=rank)
+            else:
+                ranked = sorted(scores, key=rank)
+            return [self._rows[product_id] for product_id in ranked]
+    
+    def __len__(self):
+        return len(self._rows)
+    
+    def _field_tokens(self, fields):
+        """كلمات كل حقل مفهرس مع وزنه"""
+        keys = {}
+        for value, (_, weight) in zip(fields, self.FIELD_WEIGHTS):
+            for token in self._tokenize(value):
+                keys[token] = max(keys.get(token, 0), weight)
+        return keys
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _tokenize(value):
+        """تقسيم القيمة إلى كلمات (أسماء الفئات والموردين تتكرر كثيراً)"""
+        return tuple(tokenize(value))
+    
+    def _index(self, product_id, fields, new_tokens):
+        """إضافة كلمات المنتج إلى الفهرس وتسجيل الكلمات الجديدة"""
+        keys = self._field_tokens(fields)
+        for token, weight in keys.items():
+            postings = self._postings[token]
+            if not postings:
+                new_tokens.append(token)
+            postings[product_id] = weight
+        self._indexed[product_id] = (fields, keys)
+    
+    def _unindex(self, product_id):
+        """إزالة كلمات المنتج من الفهرس"""
+        _, keys = self._indexed.pop(product_id, (None, {}))
+        for token in keys:
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+    
+    def _prefix_scores(self, prefix):
+        """أفضل وزن لكل منتج يحتوي كلمة تبدأ بالبادئة"""
+        scores = {}
+        position = bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefix):
+            for product_id, weight in self._postings[self._tokens[position]].items():
+                if weight > scores.get(product_id, 0):
+                    scores[product_id] = weight
+            position += 1
+        return scores
+
+class BarcodeCache:
+    """ذاكرة مؤقتة ساخنة لربط الباركود بالمنتج أثناء المسح
+
+    المسح المتتالي بقارئ الباركود يُخدم من الذاكرة دون الرجوع لقاعدة
+    البيانات، والباركودات غير المعروفة تُخزن أيضاً حتى لا تتكرر الاستعلامات.
+    تُمسح الذاكرة عند تعديل المنتجات (الأسعار والأسماء والباركود)، أما البيع
+    فيحذف المنتجات المباعة فقط. الكمية المخزنة للعرض والتنبيه وليست مرجعاً:
+    عملية البيع تتحقق من المخزون في قاعدة البيانات عند التنفيذ.
+    """
+    
+    SCOPES = ('products', 'categories', 'suppliers')
+    # نطاق يُحذف عنده المنتجات التي تغيرت فقط (من سجل تعديلات المنتجات)
+    STOCK_SCOPES = ('stock',)
+    
+    def __init__(self, db_name="store_management.db", max_entries=10000):
+        self.product_model = Product(db_name, read_only=True)
+        self.changes_model = ProductQuery(db_name, read_only=True)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = data_version.version
+        self._position = self.changes_model.product_changes_position()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def lookup(self, barcode):
+        """جلب المنتج المرتبط بالباركود (None إن لم يكن معروفاً)"""
+        barcode = (barcode or "").strip()
+        if not barcode:
+            return None
+        
+        with self._lock:
+            self._invalidate_if_changed()
+            if barcode in self._entries:
+                self._entries.move_to_end(barcode)
+                self.hits += 1
+                return self._entries[barcode]
+            self.misses += 1
+            
+            product = self.product_model.get_by_barcode(barcode)
+            self._store(barcode, product)
+            return product
+    
+    def peek(self, barcode):
+        """البحث في الذاكرة فقط دون أي استعلام (لخيط الواجهة)
+
+        ترجع (True، المنتج أو None) إن كانت النتيجة مخزنة وصالحة، و (False، None)
+        إن احتاجت قاعدة البيانات (باركود جديد، أو ذاكرة تنتظر الإبطال، أو
+        lookup تعمل الآن في خيط آخر) فتُطلب lookup في الخيط العامل.
+        """
+        barcode = (barcode or "").strip()
+        if not barcode:
+            return True, None
+        if not self._lock.acquire(blocking=False):
+            return False, None
+        try:
+            if (barcode not in self._entries
+                    or data_version.changed_since(self._version, self.SCOPES + self.STOCK_SCOPES)):
+                return False, None
+            self._entries.move_to_end(barcode)
+            self.hits += 1
+            return True, self._entries[barcode]
+        finally:
+            self._lock.release()
+    
+    def warm(self):
+        """تعبئة الذاكرة بجميع الباركودات باستعلام واحد (عند فتح شاشة البيع)
+
+        الجلب خارج القفل فلا ينتظره المسح أثناء التعبئة في الخيط العامل.
+        """
+        version = data_version.version
+        products = self.product_model.get_all_barcode_products(self.max_entries)
+        with self._lock:
+            self._invalidate_if_changed()
+            # كتابة أثناء الجلب: الصفوف قد تكون قديمة فتُترك للبحث عند المسح
+            if not data_version.changed_since(version, self.SCOPES + self.STOCK_SCOPES):
+                for product in products:
+                    self._store(product['scanned_barcode'], product)
+            return len(self._entries)
+    
+    def clear(self):
+        """مسح الذاكرة"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _invalidate_if_changed(self):
+        """مسح الذاكرة إن تغيرت بيانات المنتجات منذ تعبئتها، أو حذف المنتجات المباعة فقط"""
+        if data_version.changed_since(self._version, self.SCOPES):
+            # الإصدار والموضع يُقرآن قبل المسح حتى لا تضيع كتابة تحدث بعده
+            self._version = data_version.version
+            self._position = self.changes_model.product_changes_position()
+            self._entries.clear()
+        elif data_version.changed_since(self._version, self.STOCK_SCOPES):
+            self._version = data_version.version
+            self._position, changed_ids, _ = self.changes_model.get_product_changes(
+                self._position, rows=False)
+            changed_ids = set(changed_ids)
+            for barcode in [barcode for barcode, product in self._entries.items()
+                            if product is not None and product['product_id'] in changed_ids]:
+                del self._entries[barcode]
+    
+    def _store(self, barcode, product):
+        """تخزين نتيجة مع إزالة الأقدم استخداماً"""
+        self._entries[barcode] = product
+        self._entries.move_to_end(barcode)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class EntityCache:
+    """ذاكرة مشتركة في العملية للجداول الصغيرة كثيرة الاستخدام
+
+    قوائم الفئات والموردين والعملاء تُجلب مرة واحدة لجميع النوافذ، وتبقى
+    صالحة حتى تحدث كتابة في نطاقها (عبر data_version). فهرس البحث وذاكرة
+    الباركود مشتركان أيضاً حتى لا تبني كل نافذة نسختها الخاصة.
+    """
+    
+    # النطاق ← (النموذج، دالة جلب القائمة)
+    LOADERS = {
+        'categories': (Category, 'get_all_categories'),
+        'suppliers': (Supplier, 'get_all_suppliers'),
+        'customers': (Customer, 'get_all_customers'),
+    }
+    
+    def __init__(self):
+        self._entries = {}
+        self._models = {}
+        self._shared = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, scope, db_name="store_management.db"):
+        """قائمة الجدول من الذاكرة، أو من قاعدة البيانات إن تغيرت (للقراءة فقط)"""
+        key = (os.path.abspath(db_name), scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not data_version.changed_since(entry[0], (scope,)):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            model = self._models.get(key)
+            if model is None:
+                model_class, _ = self.LOADERS[scope]
+                model = self._models[key] = model_class(db_name, read_only=True)
+        
+        # الإصدار يُقرأ قبل الجلب حتى لا تضيع كتابة تحدث أثناءه
+        version = data_version.version
+        rows = getattr(model, self.LOADERS[scope][1])()
+        with self._lock:
+            self._entries[key] = (version, rows)
+        return rows
+    
+    def categories(self, db_name="store_management.db"):
+        """جميع الفئات"""
+        return self.get('categories', db_name)
+    
+    def suppliers(self, db_name="store_management.db"):
+        """جميع الموردين"""
+        return self.get('suppliers', db_name)
+    
+    def customers(self, db_name="store_management.db"):
+        """جميع العملاء"""
+        return self.get('customers', db_name)
+    
+    def product_index(self, db_name="store_management.db"):
+        """فهرس البحث الفوري المشترك للمنتجات"""
+        return self._get_shared(ProductIndex, db_name)
+    
+    def barcode_cache(self, db_name="store_management.db"):
+        """ذاكرة الباركود المشتركة"""
+        return self._get_shared(BarcodeCache, db_name)
+    
+    def _get_shared(self, cache_class, db_name):
+        """إنشاء نسخة واحدة من الفهرس أو الذاكرة لكل قاعدة بيانات"""
+        key = (os.path.abspath(db_name), cache_class.__name__)
+        with self._lock:
+            shared = self._shared.get(key)
+            if shared is None:
+                shared = self._shared[key] = cache_class(db_name)
+            return shared
+    
+    def clear(self):
+        """مسح جميع القوائم المخزنة"""
+        with self._lock:
+            self._entries.clear()
+
+# الذاكرة المشتركة للجداول الصغيرة بين جميع النوافذ
+entity_cache = EntityCache()
+
 class ReportGenerator:
     """فئة لإنشاء التقارير"""
     
-    def __init__(self):
-        self.sale_model = Sale()
-        self.expense_model = Expense()
-        self.product_model = Product()
+    def __init__(self, db_name="store_management.db"):
+        self.db_name = db_name
+        # التقارير تقرأ عبر قناة القراءة فقط حتى لا تعطل نقطة البيع
+        self.sale_model = Sale(db_name, read_only=True)
+        self.expense_model = Expense(db_name, read_only=True)
+        self.product_model = Product(db_name, read_only=True)
+        # الإجماليات تُقرأ من الملخص اليومي بدلاً من مسح جميع العمليات
+        self.summary_model = DailySummary(db_name, read_only=True)
     
     def generate_daily_report(self, date):
         """إنشاء تقرير يومي"""
-        # تقرير المبيعات
-        sales_report = self.sale_model.get_daily_sales_report(date)
-        
-        # تقرير المصروفات
-        total_expenses = self.expense_model.get_total_expenses_by_date(date)
+        return report_cache.get_or_compute(
+            (self.db_name, 'daily', date), lambda: self._compute_daily_report(date),
+            LEDGER_SCOPES, date[:10], date[:10])
+    
+    def _compute_daily_report(self, date):
+        """حساب التقرير اليومي من الملخص"""
+        summary = self.summary_model.get_range_totals(date, date)
         
         # حساب صافي الربح
-        net_profit = (sales_report['total_profit'] if sales_report['total_profit'] else 0) - total_expenses
+        net_profit = summary['total_profit'] - summary['total_expenses']
         
         return {
             'date': date,
             'sales': {
-                'total_sales': sales_report['total_sales'] if sales_report else 0,
-                'total_revenue': sales_report['total_revenue'] if sales_report else 0,
-                'total_profit': sales_report['total_profit'] if sales_report else 0,
-                'total_final_amount': sales_report['total_final_amount'] if sales_report else 0
+                'total_sales': summary['total_sales'],
+                'total_revenue': summary['total_revenue'],
+                'total_profit': summary['total_profit'],
+                'total_final_amount': summary['total_final_amount']
             },
             'expenses': {
-                'total_expenses': total_expenses
+                'total_expenses': summary['total_expenses']
             },
             'net_profit': net_profit
         }
     
-    def generate_weekly_report(self, start_date):
+    def generate_weekly_report(self, start_date, details=0):
         """إنشاء تقرير أسبوعي"""
         end_date = (datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=6)).strftime('%Y-%m-%d')
-        
-        # جلب المبيعات الأسبوعية
-        sales = self.sale_model.get_sales_by_date_range(start_date, end_date)
-        
-        # جلب المصروفات الأسبوعية
-        expenses = self.expense_model.get_expenses_by_date_range(start_date, end_date)
-        
-        # حساب الإجماليات
-        total_revenue = sum(sale['total_amount'] for sale in sales)
-        total_profit = sum(sale['profit'] for sale in sales)
-        total_final_amount = sum(sale['final_amount'] for sale in sales)
-        total_expenses = sum(expense['amount'] for expense in expenses)
-        
-        net_profit = total_profit - total_expenses
-        
-        return {
-            'period': f"{start_date} إلى {end_date}",
-            'sales': {
-                'total_sales': len(sales),
-                'total_revenue': total_revenue,
-                'total_profit': total_profit,
-                'total_final_amount': total_final_amount
-            },
-            'expenses': {
-                'total_expenses': total_expenses
-            },
-            'net_profit': net_profit,
-            'sales_details': sales,
-            'expenses_details': expenses
-        }
+        return self.generate_period_report(f"{start_date} إلى {end_date}", start_date, end_date, details)
     
-    def generate_monthly_report(self, year, month):
+    def generate_monthly_report(self, year, month, details=0):
         """إنشاء تقرير شهري"""
         start_date = f"{year}-{month:02d}-01"
         
@@ -116,39 +498,72 @@ class ReportGenerator:
             next_month = f"{year}-{month + 1:02d}-01"
         
         end_date = (datetime.strptime(next_month, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        return self.generate_period_report(f"{year}/{month:02d}", start_date, end_date, details)
+    
+    def generate_yearly_report(self, year, details=0):
+        """إنشاء تقرير سنوي"""
+        return self.generate_period_report(str(year), f"{year}-01-01", f"{year}-12-31", details)
+    
+    def generate_period_report(self, period, start_date, end_date, details=0):
+        """إنشاء تقرير لفترة زمنية
+
+        الإجماليات تُقرأ من الملخص اليومي (صف لكل يوم). details > 0 يضيف أول
+        details مبيعات (sales_details) مقروءة في نفس لقطة الإجماليات، وباقي
+        التفاصيل تُجلب عند عرضها عبر get_sales_details و get_expenses_details.
+        """
+        return report_cache.get_or_compute(
+            (self.db_name, 'period', start_date, end_date, details),
+            lambda: self._compute_period_report(period, start_date, end_date, details),
+            LEDGER_SCOPES, start_date, end_date)
+    
+    def _compute_period_report(self, period, start_date, end_date, details=0):
+        """حساب تقرير الفترة من الملخص (مع التفاصيل في نفس اللقطة)"""
+        with connection_manager.snapshot(self.db_name):
+            sales = self.summary_model.get_range_totals(start_date, end_date)
+            sales_details = (self.get_sales_details(start_date, end_date, limit=details)
+                             if details and sales['total_sales'] else None)
+        total_expenses = sales['total_expenses']
         
-        # جلب المبيعات الشهرية
-        sales = self.sale_model.get_sales_by_date_range(start_date, end_date)
-        
-        # جلب المصروفات الشهرية
-        expenses = self.expense_model.get_expenses_by_date_range(start_date, end_date)
-        
-        # حساب الإجماليات
-        total_revenue = sum(sale['total_amount'] for sale in sales)
-        total_profit = sum(sale['profit'] for sale in sales)
-        total_final_amount = sum(sale['final_amount'] for sale in sales)
-        total_expenses = sum(expense['amount'] for expense in expenses)
-        
-        net_profit = total_profit - total_expenses
+        net_profit = sales['total_profit'] - total_expenses
         
-        return {
-            'period': f"{year}/{month:02d}",
+        report = {
+            'period': period,
+            'start_date': start_date,
+            'end_date': end_date,
             'sales': {
-                'total_sales': len(sales),
-                'total_revenue': total_revenue,
-                'total_profit': total_profit,
-                'total_final_amount': total_final_amount
+                'total_sales': sales['total_sales'],
+                'total_revenue': sales['total_revenue'],
+                'total_profit': sales['total_profit'],
+                'total_final_amount': sales['total_final_amount']
             },
             'expenses': {
                 'total_expenses': total_expenses
             },
-            'net_profit': net_profit,
-            'sales_details': sales,
-            'expenses_details': expenses
+            'net_profit': net_profit
         }
+        if sales_details is not None:
+            report['sales_details'] = sales_details
+        return report
+    
+    def rebuild_summary(self):
+        """إعادة بناء الملخص اليومي من البيانات الأصلية"""
+        return DailySummary(self.db_name).rebuild()
+    
+    def get_sales_details(self, start_date, end_date, limit=10, offset=0):
+        """جلب صفحة من تفاصيل المبيعات عند عرضها فقط"""
+        return self.sale_model.get_sales_by_date_range(start_date, end_date, limit, offset)
+    
+    def get_expenses_details(self, start_date, end_date, limit=10, offset=0):
+        """جلب صفحة من تفاصيل المصروفات عند عرضها فقط"""
+        return self.expense_model.get_expenses_by_date_range(start_date, end_date, limit, offset)
     
     def generate_product_report(self):
         """تقرير المنتجات والمخزون"""
+        return report_cache.get_or_compute(
+            (self.db_name, 'products'), self._compute_product_report, PRODUCT_SCOPES)
+    
+    def _compute_product_report(self):
+        """حساب تقرير المنتجات"""
         products = self.product_model.get_all_products()
         
         low_stock_products = []
@@ -170,64 +585,427 @@ class ReportGenerator:
 class BackupManager:
     """فئة إدارة النسخ الاحتياطية"""
     
-    def __init__(self, db_name="store_management.db"):
+    def __init__(self, db_name="store_management.db", compression=DEFAULT_CODEC):
         self.db_name = db_name
         self.backup_dir = "backups"
+        # ضغط النسخ الكاملة (None = ملف قاعدة بيانات غير مضغوط)
+        self.compression = compression
         self.ensure_backup_directory()
+        # النسخ التزايدية (أجزاء بدون تكرار + ملفات وصف)
+        self.chunk_store = ChunkStore(os.path.join(self.backup_dir, "store"))
+        # فهرس النسخ وسياسة الاحتفاظ بالنسخ التلقائية
+        self.catalog = BackupCatalog(os.path.join(self.backup_dir, "catalog.json"))
+        self.retention = dict(DEFAULT_RETENTION)
+        # أرشيف سجل التغييرات للاستعادة لوقت محدد
+        self.journal = JournalArchive(os.path.join(self.backup_dir, "journal"))
     
     def ensure_backup_directory(self):
         """التأكد من وجود مجلد النسخ الاحتياطية"""
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
     
-    def create_backup(self, backup_name=None):
-        """إنشاء نسخة احتياطية"""
+    def create_backup(self, backup_name=None, progress=None, source='manual'):
+        """إنشاء نسخة احتياطية متسقة أثناء عمل البرنامج (مضغوطة حسب الإعداد)
+
+        النسخة المضغوطة تُؤخذ أولاً بواجهة النسخ في SQLite ثم تُضغط بالتدفق.
+        progress(done, total) تُستدعى بعد كل خطوة (من نفس الخيط).
+        source: 'manual' أو 'auto' (سياسة الاحتفاظ لا تحذف إلا النسخ التلقائية).
+        """
         if backup_name is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = f"backup_{timestamp}.db"
+            backup_name = f"backup_{timestamp}.db{extension_for(self.compression)}"
         
         backup_path = os.path.join(self.backup_dir, backup_name)
+        codec = codec_for_path(backup_path)
         
         try:
-            shutil.copy2(self.db_name, backup_path)
+            if codec is None:
+                online_backup(self.db_name, backup_path, progress)
+                snapshot, logical_size = self._describe(backup_path), os.path.getsize(backup_path)
+            else:
+                snapshot_path = self._temp_path()
+                try:
+                    online_backup(self.db_name, snapshot_path,
+                                  progress and (lambda done, total: progress(done, 2 * total)))
+                    snapshot, logical_size = self._describe(snapshot_path), os.path.getsize(snapshot_path)
+                    compress_file(snapshot_path, backup_path, codec,
+                                  progress and (lambda done, total: progress(total + done, 2 * total)))
+                finally:
+                    if os.path.exists(snapshot_path):
+                        os.remove(snapshot_path)
+            
+            self.catalog.add(self._full_entry(backup_name, snapshot, logical_size, source))
             return backup_path
         except Exception as e:
             print(f"خطأ في إنشاء النسخة الاحتياطية: {e}")
             return None
     
-    def restore_backup(self, backup_path):
-        """استعادة نسخة احتياطية"""
+    def restore_backup(self, backup_path, progress=None):
+        """استعادة نسخة احتياطية (مضغوطة أو لا) من ملف
+        
+        النسخة تُفك بالتدفق إلى ملف مؤقت بجانب قاعدة البيانات ثم تُستبدل بها
+        دفعة واحدة، فالانقطاع أثناء الاستعادة لا يترك قاعدة بيانات نصف مكتوبة.
+        """
+        if not os.path.exists(backup_path):
+            return False
+        
+        restore_path = self.db_name + ".restore"
         try:
-            if os.path.exists(backup_path):
-                shutil.copy2(backup_path, self.db_name)
-                return True
+            if codec_for_path(backup_path):
+                decompress_file(backup_path, restore_path, progress)
+            else:
+                shutil.copy2(backup_path, restore_path)
+            return self._swap_in(restore_path)
+        except Exception as e:
+            print(f"خطأ في استعادة النسخة الاحتياطية: {e}")
             return False
+        finally:
+            if os.path.exists(restore_path):
+                os.remove(restore_path)
+    
+    def _swap_in(self, restore_path):
+        """استبدال قاعدة البيانات بملف مستعاد بعد التحقق من سلامته"""
+        conn = sqlite3.connect(restore_path)
+        try:
+            result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            violations = foreign_key_violations(conn)
+            position = change_position(conn)
+        finally:
+            conn.close()
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"النسخة المستعادة تالفة: {result}")
+        if violations:
+            raise sqlite3.IntegrityError(f"النسخة المستعادة تخالف المفاتيح الأجنبية: {violations[:5]}")
+        
+        # أرشفة تغييرات الخط الزمني الحالي قبل استبداله، ثم بدء خط جديد من موضع النسخة
+        self.archive_journal()
+        self.journal.truncate_after(position)
+        self.catalog.abandon_after(position, datetime.now().strftime(DATE_FORMAT))
+        
+        # تفريغ WAL ثم إغلاق الاتصالات المشتركة حتى لا تبقى مرتبطة بالملف القديم
+        connection_manager.checkpoint(self.db_name, 'TRUNCATE')
+        with connection_manager.replacing(self.db_name):
+            os.replace(restore_path, self.db_name)
+        # ترقية مخطط النسخة المستعادة إن كانت أقدم
+        Database(self.db_name)
+        return True
+    
+    def create_incremental_backup(self, backup_name=None, progress=None, source='manual'):
+        """نسخة تزايدية: لا تُكتب إلا أجزاء قاعدة البيانات التي تغيرت منذ آخر نسخة
+
+        تُؤخذ لقطة متسقة بواجهة النسخ في SQLite ثم تُقسم إلى أجزاء في المخزن.
+        progress(done, total) تغطي المرحلتين (النصف الأول للقطة والثاني للتخزين).
+        """
+        # الاسم التلقائي بدقة الثانية: نسختان في نفس الثانية تأخذ الثانية رقماً
+        unique = backup_name is None
+        if backup_name is None:
+            backup_name = f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        snapshot_path = self._temp_path()
+        try:
+            online_backup(self.db_name, snapshot_path,
+                          progress and (lambda done, total: progress(done, 2 * total)))
+            manifest = self.chunk_store.store_file(
+                snapshot_path, backup_name,
+                progress and (lambda done, total: progress(total + done, 2 * total)), unique=unique)
+            self.catalog.add(self._incremental_entry(manifest, self._describe(snapshot_path), source))
+            return manifest['name']
+        except Exception as e:
+            print(f"خطأ في إنشاء النسخة الاحتياطية التزايدية: {e}")
+            return None
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+    
+    def _full_entry(self, backup_name, snapshot, logical_size, source, created=None):
+        """بيانات نسخة كاملة للفهرس (البصمة لملف النسخة كما هو على القرص)
+
+        snapshot: (عدد الصفحات، موضع سجل التغييرات) من _describe.
+        """
+        backup_path = os.path.join(self.backup_dir, backup_name)
+        return {
+            'name': backup_name,
+            'kind': 'full',
+            'source': source,
+            'size': os.path.getsize(backup_path),
+            'logical_size': logical_size,
+            'sha256': file_checksum(backup_path),
+            'page_count': snapshot[0],
+            'change_id': snapshot[1],
+            'created': created or datetime.now().strftime(DATE_FORMAT),
+        }
+    
+    @staticmethod
+    def _incremental_entry(manifest, snapshot, source):
+        """بيانات نسخة تزايدية للفهرس (الحجم هو الأجزاء الجديدة التي أضافتها)"""
+        return {
+            'name': manifest['name'],
+            'kind': 'incremental',
+            'source': source,
+            'size': manifest['new_bytes'],
+            'logical_size': manifest['size'],
+            'sha256': manifest['sha256'],
+            'page_count': snapshot[0],
+            'change_id': snapshot[1],
+            'created': manifest['created'],
+        }
+    
+    @staticmethod
+    def _describe(db_path):
+        """عدد صفحات ملف قاعدة بيانات وموضع سجل تغييراته (None إن كان أقدم من السجل)"""
+        conn = sqlite3.connect(db_path)
+        try:
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            return page_count, change_position(conn) if has_changelog(conn) else None
+        finally:
+            conn.close()
+    
+    def _temp_path(self):
+        """ملف مؤقت فريد في مجلد النسخ (النسخ اليدوي والتلقائي قد يعملان معاً)"""
+        fd, path = tempfile.mkstemp(suffix=".tmp", dir=self.backup_dir)
+        os.close(fd)
+        return path
+    
+    @staticmethod
+    def is_backup_file(file_name):
+        """هل الملف نسخة كاملة (.db مضغوطة أو لا)؟"""
+        extension = extension_for(codec_for_path(file_name))
+        return file_name[:len(file_name) - len(extension)].endswith('.db')
+    
+    def is_incremental(self, backup_name):
+        """هل الاسم لنسخة تزايدية (وليس ملف نسخة كاملة)؟"""
+        return not self.is_backup_file(backup_name)
+    
+    def restore_by_name(self, backup_name, progress=None):
+        """استعادة نسخة من القائمة (كاملة أو تزايدية)"""
+        if not self.is_incremental(backup_name):
+            return self.restore_backup(os.path.join(self.backup_dir, backup_name), progress)
+        
+        restore_path = self.db_name + ".restore"
+        try:
+            self.chunk_store.restore_to(backup_name, restore_path, progress)
+            return self._swap_in(restore_path)
         except Exception as e:
             print(f"خطأ في استعادة النسخة الاحتياطية: {e}")
             return False
+        finally:
+            if os.path.exists(restore_path):
+                os.remove(restore_path)
+    
+    def extract_backup(self, backup_name, target_path, progress=None):
+        """كتابة نسخة من القائمة كملف قاعدة بيانات غير مضغوط"""
+        backup_path = os.path.join(self.backup_dir, backup_name)
+        if self.is_incremental(backup_name):
+            self.chunk_store.restore_to(backup_name, target_path, progress)
+        elif codec_for_path(backup_name):
+            decompress_file(backup_path, target_path, progress)
+        else:
+            shutil.copy2(backup_path, target_path)
+        return target_path
+    
+    def export_backup(self, backup_name, export_path, progress=None):
+        """تصدير نسخة من القائمة، والضغط حسب امتداد ملف التصدير (.gz/.xz/.bz2)"""
+        codec = codec_for_path(export_path)
+        if not self.is_incremental(backup_name) and codec_for_path(backup_name) == codec:
+            # نفس الصيغة: نسخ الملف كما هو
+            shutil.copy2(os.path.join(self.backup_dir, backup_name), export_path)
+            return export_path
+        if codec is None:
+            return self.extract_backup(backup_name, export_path, progress)
+        
+        plain_path = self._temp_path()
+        try:
+            self.extract_backup(backup_name, plain_path,
+                                progress and (lambda done, total: progress(done, 2 * total)))
+            compress_file(plain_path, export_path, codec,
+                          progress and (lambda done, total: progress(total + done, 2 * total)))
+        finally:
+            os.remove(plain_path)
+        return export_path
+    
+    def delete_backup(self, backup_name):
+        """حذف نسخة من القائمة (أجزاء النسخ التزايدية تُحذف عند عدم استخدامها)"""
+        if self.is_incremental(backup_name):
+            self.chunk_store.delete(backup_name)
+        else:
+            os.remove(os.path.join(self.backup_dir, backup_name))
+        self.catalog.remove(backup_name)
+        return True
+    
+    def collect_garbage(self):
+        """حذف الأجزاء غير المستخدمة (بعد انقطاع أثناء النسخ أو الحذف)"""
+        return self.chunk_store.collect_garbage()
     
     def list_backups(self):
-        """قائمة النسخ الاحتياطية المتاحة"""
-        if not os.path.exists(self.backup_dir):
-            return []
+        """قائمة النسخ الاحتياطية المتاحة (الكاملة والتزايدية) من الفهرس
+        
+        size هو الحجم على القرص (المضغوط، أو الأجزاء الجديدة للنسخة التزايدية)،
+        و logical_size حجم قاعدة البيانات بعد الاستعادة.
+        """
+        if not self.catalog.exists():
+            self.rebuild_catalog()
+        
+        backups = self.catalog.entries()
+        for backup in backups:
+            backup['path'] = (self.chunk_store.manifest_path(backup['name'])
+                              if backup['kind'] == 'incremental'
+                              else os.path.join(self.backup_dir, backup['name']))
+        return backups
+    
+    def rebuild_catalog(self, progress=None):
+        """إعادة بناء الفهرس من ملفات مجلد النسخ (للنسخ الأقدم من الفهرس أو المنسوخة يدوياً)
+        
+        النسخ المضغوطة تُفك مؤقتاً لمعرفة عدد صفحاتها، والنسخ غير المفهرسة تُعد
+        يدوية حتى لا تحذفها سياسة الاحتفاظ. ترجع عدد النسخ في الفهرس.
+        """
+        # القفل يمتد من قراءة الفهرس إلى كتابته حتى لا تضيع نسخة أُضيفت أثناء الفهرسة
+        with self.catalog.locked():
+            known = {entry['name']: entry for entry in self.catalog.entries()}
+            file_names = [file for file in os.listdir(self.backup_dir) if self.is_backup_file(file)]
+            manifests = self.chunk_store.list_manifests()
+            total = len(file_names) + len(manifests)
+            entries = []
+        
+            for file in file_names:
+                if file in known:
+                    entries.append(known[file])
+                else:
+                    file_path = os.path.join(self.backup_dir, file)
+                    created = datetime.fromtimestamp(os.stat(file_path).st_ctime).strftime(DATE_FORMAT)
+                    plain_path = self._temp_path()
+                    try:
+                        self.extract_backup(file, plain_path)
+                        entries.append(self._full_entry(file, self._describe(plain_path),
+                                                        os.path.getsize(plain_path), 'manual', created))
+                    except Exception as e:
+                        print(f"خطأ في فهرسة النسخة الاحتياطية {file}: {e}")
+                    finally:
+                        os.remove(plain_path)
+                if progress:
+                    progress(len(entries), total)
         
-        backups = []
-        for file in os.listdir(self.backup_dir):
-            if file.endswith('.db'):
-                file_path = os.path.join(self.backup_dir, file)
-                file_stat = os.stat(file_path)
-                backups.append({
-                    'name': file,
-                    'path': file_path,
-                    'size': file_stat.st_size,
-                    'created': datetime.fromtimestamp(file_stat.st_ctime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-        
-        return sorted(backups, key=lambda x: x['created'], reverse=True)
-    
-    def auto_backup(self):
-        """نسخ احتياطي تلقائي"""
-        return self.create_backup()
+            for manifest in manifests:
+                if manifest['name'] in known:
+                    entries.append(known[manifest['name']])
+                else:
+                    # عدد الصفحات مسجل في ترويسة قاعدة البيانات (البايتات 28-31)،
+                    # وموضع السجل لا يُعرف بدون إعادة التجميع فلا تصلح أساساً للاستعادة لوقت
+                    with open(self.chunk_store.chunk_path(manifest['chunks'][0]), 'rb') as first_chunk:
+                        header = first_chunk.read(32)
+                    entries.append(self._incremental_entry(
+                        manifest, (int.from_bytes(header[28:32], 'big'), None), 'manual'))
+                if progress:
+                    progress(len(entries), total)
+        
+            self.catalog.replace_all(entries)
+        return len(entries)
+    
+    def apply_retention(self):
+        """حذف النسخ التلقائية التي تتجاوز سياسة الاحتفاظ، ويرجع أسماءها
+        
+        يُحذف بعدها من أرشيف السجل ما يسبق أقدم نسخة متبقية.
+        """
+        automatic = [entry for entry in self.catalog.entries() if entry.get('source') == 'auto']
+        expired = select_expired(automatic, self.retention)
+        for backup_name in expired:
+            try:
+                self.delete_backup(backup_name)
+            except Exception as e:
+                print(f"خطأ في حذف النسخة الاحتياطية القديمة {backup_name}: {e}")
+        
+        positions = [entry['change_id'] for entry in self.catalog.entries()
+                     if entry.get('change_id') is not None]
+        if positions:
+            self.journal.prune_before(min(positions))
+        return expired
+    
+    def archive_journal(self):
+        """نقل التغييرات الجديدة إلى أرشيف السجل، ويرجع عددها (None عند الخطأ)"""
+        try:
+            return self.journal.archive(self.db_name)
+        except Exception as e:
+            print(f"خطأ في أرشفة سجل التغييرات: {e}")
+            return None
+    
+    def recover_to_time(self, target_time, output_path=None, progress=None):
+        """بناء قاعدة بيانات بحالتها في وقت محدد (YYYY-MM-DD HH:MM:SS)
+        
+        تُستخرج أحدث نسخة قبل الوقت وتُطبق عليها تغييرات الأرشيف (ثم ما لم
+        يُؤرشف بعد في قاعدة البيانات الحالية إن كانت سليمة) حتى ذلك الوقت.
+        الناتج ملف منفصل لا يمس قاعدة البيانات الحالية، ويُستعاد بـ restore_backup.
+        ترجع {'base', 'changes', 'path', 'seconds'} أو None.
+        """
+        started = time.perf_counter()
+        if output_path is None:
+            output_path = os.path.join(
+                self.backup_dir, f"recovered_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        
+        # النسخ التالية لآخر استعادة من خط زمني آخر لا يتبعه الأرشيف
+        bases = [entry for entry in self.list_backups()
+                 if entry['created'] <= target_time and entry.get('change_id') is not None
+                 and not entry.get('abandoned')]
+        if not bases:
+            print(f"لا توجد نسخة احتياطية قبل {target_time} تحتوي سجل التغييرات")
+            return None
+        base = bases[0]
+        
+        work_path = self._temp_path()
+        try:
+            self.extract_backup(base['name'], work_path,
+                                progress and (lambda done, total: progress(done, 2 * total)))
+            conn = sqlite3.connect(work_path)
+            try:
+                position = change_position(conn)
+                until = end_of_second(target_time)
+                changes = list(self.journal.changes(position, until))
+                changes.extend(self._live_changes(max(position, self.journal.last_archived()), until))
+                if changes and changes[0][0] != position + 1:
+                    raise ValueError(f"أرشيف السجل ناقص بعد التغيير رقم {position}")
+                if progress:
+                    progress(1, 2)
+                count = apply_changes(conn, changes)
+                
+                conn.execute("PRAGMA journal_mode = DELETE")
+                result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+                if result != "ok":
+                    raise sqlite3.DatabaseError(f"فشل فحص سلامة قاعدة البيانات المستعادة: {result}")
+                violations = foreign_key_violations(conn)
+                if violations:
+                    raise sqlite3.IntegrityError(
+                        f"قاعدة البيانات المستعادة تخالف المفاتيح الأجنبية: {violations[:5]}")
+            finally:
+                conn.close()
+            os.replace(work_path, output_path)
+            if progress:
+                progress(2, 2)
+            return {'base': base['name'], 'changes': count, 'path': output_path,
+                    'seconds': time.perf_counter() - started}
+        except Exception as e:
+            print(f"خطأ في الاستعادة لوقت محدد: {e}")
+            return None
+        finally:
+            if os.path.exists(work_path):
+                os.remove(work_path)
+    
+    def _live_changes(self, after_id, until):
+        """التغييرات التي لم تُؤرشف بعد من قاعدة البيانات الحالية (إن وُجدت وكانت سليمة)"""
+        if not os.path.exists(self.db_name):
+            return []
+        try:
+            conn = connection_manager.get_connection(self.db_name, read_only=True)
+            return conn.execute(f"SELECT {', '.join(CHANGE_COLUMNS)} FROM changelog "
+                                "WHERE change_id > ? AND changed_at <= ? ORDER BY change_id",
+                                (after_id, until)).fetchall()
+        except sqlite3.Error as e:
+            print(f"تعذرت قراءة التغييرات غير المؤرشفة: {e}")
+            return []
+    
+    def auto_backup(self, progress=None):
+        """نسخ احتياطي تلقائي (تزايدي حتى لا يكبر المجلد مع كل نسخة) ثم تطبيق سياسة الاحتفاظ"""
+        backup_name = self.create_incremental_backup(progress=progress, source='auto')
+        if backup_name:
+            self.apply_retention()
+        return backup_name
 
 class ValidationUtils:
     """فئة للتحقق من صحة البيانات"""